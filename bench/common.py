@@ -0,0 +1,207 @@
+"""
+Shared support for the benchmarks: resolves the tool packages and provides a throw-away tool home.
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+import yaml
+
+
+#=====
+# Resolve our modules the same way `bin/jbadm` does
+HOME = os.path.realpath(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(1, f"{HOME}/cli/packages")
+sys.path.insert(2, f"{HOME}/lib/packages")
+
+import paths
+#-----
+
+
+class Sandbox:
+    """
+    Throw-away tool home with its own configuration, instances and run directories. The schemas, the packages and the
+    `jbadm` script are shared with the real tool home, the sandbox copy of the script, see `jbadm()`, operates on the
+    sandbox.
+
+    As `paths.Paths.home()` is a singleton only one sandbox may be created per process.
+    """
+    root : str
+
+    def __init__(
+            self,
+            jboss : str = "/opt/jboss",
+    ):
+        """
+        Creates an instance and seeds `paths.Paths` with it.
+
+        ### Arguments
+        - jboss : str
+            - JBoss base installation the configuration refers to.
+        """
+        self.root = tempfile.mkdtemp(prefix = "jbadm-bench-")
+        os.makedirs(f"{self.root}/resources/config")
+        os.makedirs(f"{self.root}/instances")
+        os.makedirs(f"{self.root}/run")
+        os.symlink(f"{HOME}/resources/schema", f"{self.root}/resources/schema")
+        os.makedirs(f"{self.root}/bin")
+        os.symlink(f"{HOME}/bin/jbadm", self.jbadm())
+        os.symlink(f"{HOME}/cli", f"{self.root}/cli")
+        os.symlink(f"{HOME}/lib", f"{self.root}/lib")
+        paths.Paths.home(self.root)
+        self.jboss = jboss
+
+
+    def jbadm(
+            self,
+    ) -> str:
+        """
+        Returns the absolute path to the `jbadm` script operating on the sandbox.
+
+        ### Returns
+        - Script path.
+        """
+        return f"{self.root}/bin/jbadm"
+
+
+    def install_jboss(
+            self,
+            files : int = 0,
+    ) -> str:
+        """
+        Installs a fake JBoss base installation into the sandbox whose `standalone.sh` launches a fake JVM and whose
+        `jboss-cli.sh` is a fake CLI, see `bench/fake`, and makes the configuration refer to it.
+
+        ### Arguments
+        - files : int
+            - Number of additional files, both copied and not copied to managed instances, in the `standalone`
+              directory.
+
+        ### Returns
+        - Absolute path to the fake JBoss base installation.
+        """
+        self.jboss = f"{self.root}/jboss"
+        os.makedirs(f"{self.jboss}/bin")
+        os.symlink(f"{HOME}/bench/fake/standalone.sh", f"{self.jboss}/bin/standalone.sh")
+        os.symlink(f"{HOME}/bench/fake/jboss-cli.sh", f"{self.jboss}/bin/jboss-cli.sh")
+
+        standalone = f"{self.jboss}/standalone"
+        for directory in ("configuration", "data", "deployments", "lib/ext", "log", "tmp"):
+            os.makedirs(f"{standalone}/{directory}")
+        for file in ("standalone.xml", "standalone-full.xml", "standalone-ha.xml", "logging.properties"):
+            with open(f"{standalone}/configuration/{file}", "w") as f:
+                f.write(f"<!-- {file} -->\n" * 256)
+        for i in range(files):
+            directory = ("deployments", "data", "configuration", "tmp", "lib/ext")[i % 5]
+            suffix = ".properties" if directory == "configuration" else ".bin"
+            with open(f"{standalone}/{directory}/file-{i:05d}{suffix}", "wb") as f:
+                f.write(b"\0" * 4096)
+
+        return self.jboss
+
+
+    def clear(
+            self,
+    ) -> None:
+        """
+        Removes the configuration, the managed instances, the instance states and the caches from the sandbox.
+
+        ### Returns
+        - Nothing.
+        """
+        for directory in (f"{self.root}/resources/config", f"{self.root}/instances", f"{self.root}/run"):
+            shutil.rmtree(directory, ignore_errors = True)
+            os.makedirs(directory)
+        shutil.rmtree(paths.Paths.caches(), ignore_errors = True)
+
+
+    def write_config(
+            self,
+            count : int = 0,
+            prefix : str = "instance-",
+    ) -> list:
+        """
+        Writes a configuration with synthetic managed instances.
+
+        ### Arguments
+        - count : int
+            - Number of managed instances.
+        - prefix : str
+            - Managed instance name prefix.
+
+        ### Returns
+        - List of managed instance names.
+        """
+        names = [ f"{prefix}{i:05d}" for i in range(count) ]
+        data = {
+            "paths": {
+                "jboss": self.jboss,
+                "instances": f"{self.root}/instances",
+                "run": f"{self.root}/run",
+            },
+            "defaults": {
+                "jboss": {
+                    "profile": "standalone-full.xml",
+                    "properties": {
+                        "jboss.bind.address": "0.0.0.0",
+                    },
+                },
+                "jvm": {
+                    "options": {
+                        "-Xms": "512m",
+                        "-Xmx": "1g",
+                    },
+                },
+            },
+            "instances": [
+                {
+                    "name": name,
+                    "jvm": { "options": { "-Xmx": "2g" } },
+                    "java": { "properties": { "jboss.socket.binding.port-offset": str(i) } },
+                }
+                for i, name in enumerate(names)
+            ],
+        }
+        with open(f"{self.root}/resources/config/config.yaml", "w") as f:
+            yaml.safe_dump(data, f, sort_keys = False)
+        for name in names:
+            os.makedirs(f"{self.root}/instances/{name}", exist_ok = True)
+
+        return names
+
+
+    def write_states(
+            self,
+            names : list,
+            pid : int = None,
+    ) -> None:
+        """
+        Writes managed instance states for the provided managed instances.
+
+        ### Arguments
+        - names : list[str]
+            - Managed instance names.
+        - pid : int
+            - PID recorded for every managed instance, defaults to this process.
+
+        ### Returns
+        - Nothing.
+        """
+        data = {
+            "instances": [ { "name": x, "pid": pid or os.getpid() } for x in names ],
+        }
+        with open(f"{self.root}/run/instance-states.yaml", "w") as f:
+            yaml.safe_dump(data, f, sort_keys = False)
+
+
+    def remove(
+            self,
+    ) -> None:
+        """
+        Removes the sandbox.
+
+        ### Returns
+        - Nothing.
+        """
+        shutil.rmtree(self.root, ignore_errors = True)
@@ -0,0 +1,116 @@
+#!/usr/bin/python3
+"""
+Instance state store contention benchmark.
+
+Many processes concurrently record instance states the same way `jbadm instance start` does: load the instance states,
+update one instance state and save. Every update must survive, regardless of the amount of contention, and the time
+spent saving under contention is compared against the same amount of updates performed by a single process.
+
+Usage: bench/contention.py [--processes N] [--updates M]
+"""
+import argparse
+import multiprocessing
+import os
+import statistics
+import sys
+import time
+
+from common import Sandbox
+
+from box import Box
+import config
+from instance.impl.state import InstanceStateManager
+
+
+def worker(
+        worker_id : int,
+        updates : int,
+        latencies,
+) -> None:
+    """
+    Records `updates` instance states, one load / update / save cycle each.
+    """
+    conf = config.Config.load()
+    result = []
+    for i in range(updates):
+        state_manager = InstanceStateManager.load(conf)
+        state_manager.update(Box(name = f"worker-{worker_id:03d}-{i:05d}", pid = os.getpid()))
+        started = time.perf_counter()
+        state_manager.save(conf)
+        result.append(time.perf_counter() - started)
+    latencies.extend(result)
+
+
+def run(
+        processes : int,
+        updates : int,
+) -> dict:
+    """
+    Runs `processes` concurrent workers and verifies that no update was lost.
+
+    ### Returns
+    - Measurements.
+    """
+    conf = config.Config.load()
+    if os.path.exists(InstanceStateManager.state_file(conf)):
+        os.unlink(InstanceStateManager.state_file(conf))
+
+    with multiprocessing.Manager() as manager:
+        latencies = manager.list()
+        workers = [
+            multiprocessing.Process(target = worker, args = (i, updates, latencies)) for i in range(processes)
+        ]
+        started = time.perf_counter()
+        for x in workers:
+            x.start()
+        for x in workers:
+            x.join()
+        elapsed = time.perf_counter() - started
+        latencies = sorted(latencies)
+
+    saved = len(InstanceStateManager.load(conf).instances)
+    expected = processes * updates
+
+    return {
+        "processes": processes,
+        "expected": expected,
+        "saved": saved,
+        "lost": expected - saved,
+        "elapsed": elapsed,
+        "throughput": expected / elapsed,
+        "save_mean_ms": statistics.mean(latencies) * 1000,
+        "save_p95_ms": latencies[int(len(latencies) * 0.95) - 1] * 1000,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type = int, default = 16, help = "Number of concurrent processes")
+    parser.add_argument("--updates", type = int, default = 25, help = "Number of updates per process")
+    args = parser.parse_args()
+
+    sandbox = Sandbox()
+    try:
+        sandbox.write_config()
+        baseline = run(1, args.processes * args.updates)
+        contended = run(args.processes, args.updates)
+    finally:
+        sandbox.remove()
+
+    for x in (baseline, contended):
+        print(
+            f"processes={x['processes']:<4} updates={x['expected']:<6} lost={x['lost']:<4} "
+            f"throughput={x['throughput']:8.1f}/s save mean={x['save_mean_ms']:6.2f} ms p95={x['save_p95_ms']:6.2f} ms"
+        )
+
+    # Both runs save the same number of instance states so the difference is the time spent waiting for the lock
+    print(f"lock wait per save: {contended['save_mean_ms'] - baseline['save_mean_ms']:.2f} ms")
+
+    if contended["lost"] or baseline["lost"]:
+        print("FAILED: updates were lost", file = sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
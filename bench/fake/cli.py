@@ -0,0 +1,70 @@
+#!/usr/bin/python3
+"""
+Fake JBoss CLI launched by the fake `jboss-cli.sh`.
+
+Takes `FAKE_CLI_START_TIME` seconds, 1 by default, to start, standing in for the JVM startup and the management
+connection handshake, and then performs the commands read from its standard input one at a time like the CLI does when
+it is not interactive:
+
+- `echo <text>` writes the text.
+- `quit` and `exit` end the CLI.
+- Commands containing `fail` report a failed outcome, after which the CLI exits with status 1.
+- Blocks, e.g. `batch` up to `run-batch`, are only performed once complete.
+- Any other command reports a successful outcome whose result is the command itself.
+"""
+import os
+import sys
+import time
+
+
+BLOCKS = { "batch": "run-batch", "if": "end-if", "try": "end-try", "for": "done" }
+
+
+def outcome(
+        command : str,
+) -> bool:
+    """
+    Writes the outcome of an operation in the DMR format of the CLI.
+
+    ### Returns
+    - Whether or not it succeeded.
+    """
+    if "fail" in command:
+        print('{\n    "outcome" => "failed",\n    "failure-description" => "WFLYCTL0216: Management resource not found",\n'
+              '    "rolled-back" => true\n}')
+        return False
+    print(f'{{\n    "outcome" => "success",\n    "result" => "{command}"\n}}')
+    return True
+
+
+def main() -> int:
+    time.sleep(float(os.environ.get("FAKE_CLI_START_TIME", "1")))
+
+    block = []
+    for line in sys.stdin:
+        line = line.strip()
+        if not line:
+            continue
+        word = line.split(None, 1)[0]
+        if block or word in BLOCKS:
+            block.append(line)
+            if word != BLOCKS[block[0].split(None, 1)[0]]:
+                continue
+            line = " ".join(block)
+            block = []
+        elif word in ("quit", "exit"):
+            return 0
+        elif word == "echo":
+            print(line[len("echo"):].strip(), flush = True)
+            continue
+
+        succeeded = outcome(line)
+        sys.stdout.flush()
+        if not succeeded:
+            return 1
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
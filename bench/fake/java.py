@@ -0,0 +1,112 @@
+#!/usr/bin/python3
+"""
+Fake JBoss standalone JVM launched by the fake `standalone.sh`.
+
+The process renames itself to `java` and rewrites its command line to `java -D[Standalone] <arguments>` so that it is
+recognized as a JBoss standalone JVM, see `instance.impl.process.is_standalone_jvm()`, logs its boot like WildFly does
+to `server.log` in `jboss.server.log.dir`, or `log` in `jboss.server.base.dir`, and then idles until terminated.
+
+The boot takes `FAKE_JAVA_BOOT_TIME` seconds, 0.5 by default, and fails, after which the process exits, when
+`FAKE_JAVA_BOOT_FAILURE` is set to a non-empty value.
+
+The first argument is a placeholder reserving room in the original command line for the rewritten one as it is
+rewritten in place.
+"""
+import ctypes
+import datetime
+import os
+import signal
+import sys
+import time
+
+
+PR_SET_NAME = 15
+
+
+def masquerade(
+        args : list,
+) -> None:
+    """
+    Renames this process to `java` and rewrites its command line.
+
+    ### Arguments
+    - args : list[str]
+        - Arguments following `-D[Standalone]` on the rewritten command line.
+
+    ### Returns
+    - Nothing.
+    """
+    ctypes.CDLL(None, use_errno = True).prctl(PR_SET_NAME, b"java", 0, 0, 0)
+
+    # Fields 48 and 49 of the process status are the bounds of the command line
+    with open("/proc/self/stat", "rb") as f:
+        fields = f.read().rsplit(b")", 1)[1].split()
+    start, end = int(fields[45]), int(fields[46])
+
+    head = b"java\0-D[Standalone]\0"
+    tail = b"".join(x.encode() + b"\0" for x in args)
+    padding = (end - start) - len(head) - len(tail) - len(b"-Dfake=\0")
+    cmdline = head + b"-Dfake=" + b"x" * max(padding, 0) + b"\0" + tail
+    with open("/proc/self/mem", "r+b", buffering = 0) as f:
+        f.seek(start)
+        f.write(cmdline[:end - start])
+
+
+def log(
+        log_dir : str,
+        level : str,
+        message : str,
+) -> None:
+    """
+    Appends a line formatted like the WildFly server log to `server.log`.
+
+    ### Returns
+    - Nothing.
+    """
+    timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S,%f")[:-3]
+    with open(f"{log_dir}/server.log", "a") as f:
+        f.write(f"{timestamp} {level:<5} [org.jboss.as] (Controller Boot Thread) {message}\n")
+
+
+def boot(
+        args : list,
+) -> bool:
+    """
+    Logs a fake boot.
+
+    ### Arguments
+    - args : list[str]
+        - Arguments of the process, the `-D` properties are looked up in them.
+
+    ### Returns
+    - Whether or not the boot succeeded.
+    """
+    properties = dict(x[2:].split("=", 1) for x in args if x.startswith("-D") and "=" in x)
+    log_dir = properties.get("jboss.server.log.dir")
+    if log_dir is None and "jboss.server.base.dir" in properties:
+        log_dir = f"{properties['jboss.server.base.dir']}/log"
+    boot_time = float(os.environ.get("FAKE_JAVA_BOOT_TIME", "0.5"))
+    if log_dir is None:
+        return True
+
+    os.makedirs(log_dir, exist_ok = True)
+    log(log_dir, "INFO", "WFLYSRV0049: WildFly Full 26.1.3.Final (WildFly Core 18.1.2.Final) starting")
+    time.sleep(boot_time)
+    if os.environ.get("FAKE_JAVA_BOOT_FAILURE"):
+        log(log_dir, "ERROR", "WFLYSRV0056: Server boot has failed in an unrecoverable manner; exiting. See previous messages for details.")
+        return False
+    log(log_dir, "INFO", f"WFLYSRV0025: WildFly Full 26.1.3.Final (WildFly Core 18.1.2.Final) started in {boot_time * 1000:.0f}ms - Started 1 of 1 services")
+    return True
+
+
+def main() -> int:
+    masquerade(sys.argv[2:])
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    if not boot(sys.argv[2:]):
+        return 1
+    while True:
+        time.sleep(3600)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
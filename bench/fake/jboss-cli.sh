@@ -0,0 +1,8 @@
+#!/bin/bash
+#
+# Stand-in for the JBoss `jboss-cli.sh` used to benchmark CLI sessions without a JBoss installation.
+#
+# Like the real script the CLI is launched as a child rather than replacing the script.
+HERE="$(dirname "$(readlink -f "$0")")"
+
+python3 "${HERE}/cli.py" "$@"
@@ -0,0 +1,15 @@
+#!/bin/bash
+#
+# Stand-in for the JBoss `standalone.sh` used to benchmark lifecycle operations without a JBoss installation.
+#
+# Like the real script the JVM is launched as a child which is then waited upon.
+HERE="$(dirname "$(readlink -f "$0")")"
+
+python3 "${HERE}/java.py" --placeholder-reserving-room-for-the-rewritten-command-line "$@" &
+JVM_PID=$!
+
+trap 'kill -TERM ${JVM_PID} 2>/dev/null' TERM INT
+while kill -0 ${JVM_PID} 2>/dev/null; do
+    wait ${JVM_PID}
+done
+wait ${JVM_PID}
@@ -0,0 +1,120 @@
+#!/usr/bin/python3
+"""
+Command line startup budget check.
+
+Runs `jbadm` commands under `python -X importtime` and fails when a command imports a module it should defer, e.g.
+`jsonschema` when every document is validated already, or when the time spent importing modules exceeds the budget.
+
+Import times vary a lot from one machine, or one moment, to the next, so the budget is relative: it is a ratio of the
+time spent importing the third party modules every command needs, measured in the same run. The baseline and the
+command are run alternately a few times, after a warm-up run populating the caches, and the fastest run of each is
+retained. An absolute budget may be enforced as well on machines whose timings are known to be stable.
+
+Usage: bench/startup.py [--ratio R] [--budget MS] [--runs N] [--verbose]
+"""
+import argparse
+import re
+import subprocess
+import sys
+
+from common import Sandbox
+
+
+#=====
+# Commands checked, with their import time budget as a ratio of the baseline and the modules they must not import.
+# Lifecycle operations, even against a single instance, run on the event loop of an `InstanceManager`.
+COMMANDS = [
+    (["instance", "status", "instance-00000"], 1.9, ["jsonschema", "rich.markdown", "rich.table", "typer.rich_utils"]),
+    (["instance", "list"], 1.9, ["jsonschema", "rich.markdown", "typer.rich_utils"]),
+]
+#-----
+
+
+# Third party modules imported by every command, whose import time is the yardstick of the budget
+BASELINE = ["typer", "yaml", "box", "psutil"]
+
+IMPORT_TIME = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def measure(
+        args : list,
+) -> tuple:
+    """
+    Runs Python once with import timing enabled.
+
+    ### Arguments
+    - args : list[str]
+        - Arguments of the interpreter, e.g. a script followed by its arguments.
+
+    ### Returns
+    - Tuple of the total import time in milliseconds and the cumulative import time per module in milliseconds.
+    """
+    process = subprocess.run(
+        [ sys.executable, "-X", "importtime" ] + args,
+        stdout = subprocess.DEVNULL,
+        stderr = subprocess.PIPE,
+        text = True,
+    )
+
+    total = 0
+    modules = dict()
+    for line in process.stderr.splitlines():
+        match = IMPORT_TIME.match(line)
+        if match is None:
+            continue
+        cumulative = int(match.group(2)) / 1000
+        modules[match.group(4)] = cumulative
+        # Only top level imports, their cumulative time includes the nested ones
+        if len(match.group(3)) == 1:
+            total += cumulative
+
+    return total, modules
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ratio", type = float, default = None, help = "Import time budget of every command, as a ratio of the baseline, instead of their own")
+    parser.add_argument("--budget", type = float, default = None, help = "Absolute import time budget per command, in ms")
+    parser.add_argument("--runs", type = int, default = 10, help = "Number of runs per command")
+    parser.add_argument("--verbose", action = "store_true", help = "Show the slowest top level imports")
+    args = parser.parse_args()
+
+    failed = False
+    sandbox = Sandbox()
+    try:
+        sandbox.write_states(sandbox.write_config(10))
+        baseline_args = [ "-c", f"import {', '.join(BASELINE)}" ]
+        for command, budget, forbidden in COMMANDS:
+            budget = args.ratio or budget
+            command_args = [ sandbox.jbadm() ] + command
+            measure(command_args)
+
+            # Alternating spreads whatever else the machine is doing evenly over both
+            baselines = []
+            runs = []
+            for _ in range(args.runs):
+                baselines.append(measure(baseline_args)[0])
+                runs.append(measure(command_args))
+            baseline = min(baselines)
+            total, modules = min(runs, key = lambda x: x[0])
+
+            imported = [ x for x in forbidden if x in modules ]
+            ratio = total / baseline
+            over = ratio > budget or (args.budget is not None and total > args.budget)
+            failed = failed or over or bool(imported)
+            print(f"{' '.join(command):<40} imports={total:7.1f} ms baseline={baseline:7.1f} ms ratio={ratio:.2f} "
+                  f"budget={budget:.2f}{f' / {args.budget:.0f} ms' if args.budget is not None else ''} "
+                  f"{'FAILED' if over else 'OK'}")
+            for x in imported:
+                print(f"  FAILED: imports {x} ({modules[x]:.1f} ms)")
+            if args.verbose:
+                for name, elapsed in sorted(modules.items(), key = lambda x: -x[1])[:10]:
+                    print(f"  {elapsed:7.1f} ms {name}")
+    finally:
+        sandbox.remove()
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,273 @@
+#!/usr/bin/python3
+"""
+Hot path benchmark suite.
+
+Times the hot paths of the tool against synthetic inventories of increasing sizes:
+
+- `config.load.cold`: `Config.load()` without the configuration snapshot nor the on disk schema caches.
+- `config.load`: `Config.load()` once the caches are populated.
+- `state.load` / `state.save`: `InstanceStateManager.load()` and recording one instance state with `save()`.
+- `list`: `InstanceImpl.list()`, output discarded.
+- `compose`: `composeJBossProperties()` and `composeJvmOptions()` for one managed instance.
+- `add`: `InstanceImpl.add()`, i.e. copying the allowed assets of the base installation and saving the configuration.
+- `start` / `stop`: lifecycle of one managed instance against a fake JBoss installation, see `bench/fake`.
+- `cli`: one command performed by the pooled CLI session of one managed instance, launched by the first run.
+
+Every case is run `--repeat` times and the minimum, median and mean are reported in milliseconds. Results are
+appended to a JSON history file together with the current commit so that runs can be compared with `--compare`.
+
+Usage: bench/suite.py [--sizes 10,100,1000,10000] [--repeat N] [--cases list,add,...] [--sharded] [--compare]
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import time
+
+from common import HOME, Sandbox
+
+from box import Box
+import config
+import paths
+from instance.impl import CliSessionPool, InstanceImpl
+from instance.impl.state import InstanceStateManager
+
+
+CASES = [ "config.load.cold", "config.load", "state.load", "state.save", "list", "compose", "add", "start", "stop", "cli" ]
+DEFAULT_SIZES = [ 10, 100, 1000, 10000 ]
+DEFAULT_HISTORY = f"{HOME}/bench/history.json"
+
+
+def measure(
+        repeat : int,
+        operation,
+        setup = None,
+        teardown = None,
+) -> dict:
+    """
+    Times an operation.
+
+    ### Arguments
+    - repeat : int
+        - Number of times to run the operation.
+    - operation : callable
+        - Operation to time.
+    - setup : callable
+        - Untimed preparation run before every run of the operation.
+    - teardown : callable
+        - Untimed cleanup run after every run of the operation.
+
+    ### Returns
+    - Minimum, median and mean duration in milliseconds.
+    """
+    durations = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        operation()
+        durations.append((time.perf_counter() - started) * 1000)
+        if teardown is not None:
+            teardown()
+
+    return {
+        "min": min(durations),
+        "median": statistics.median(durations),
+        "mean": statistics.mean(durations),
+    }
+
+
+def run_size(
+        sandbox : Sandbox,
+        size : int,
+        cases : list,
+        repeat : int,
+        sharded : bool,
+) -> dict:
+    """
+    Runs the selected cases against an inventory of `size` managed instances.
+
+    ### Returns
+    - Measurements per case.
+    """
+    sandbox.clear()
+    names = sandbox.write_config(size)
+    sandbox.write_states(names[::2])
+    if sharded:
+        with InstanceStateManager.migrate(config.Config.load()):
+            config.Config.migrate()
+
+    def drop_caches():
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(config.Config.snapshot())
+        shutil.rmtree(paths.Paths.caches(), ignore_errors = True)
+
+    # Populate the caches
+    conf = config.Config.load()
+    state_manager = InstanceStateManager.load(conf)
+    state_manager.state_for(names[-1])
+
+    def save_state():
+        current = InstanceStateManager.load(conf)
+        current.update(Box(name = names[0], pid = os.getpid()))
+        current.save(conf)
+
+    def list_instances():
+        with contextlib.redirect_stdout(io.StringIO()):
+            InstanceImpl.list()
+
+    def compose():
+        target = InstanceImpl(names[-1])
+        target.composeJBossProperties(conf)
+        target.composeJvmOptions(conf)
+
+    def add():
+        with contextlib.redirect_stdout(io.StringIO()):
+            InstanceImpl("bench-added").add()
+
+    def remove():
+        with contextlib.redirect_stdout(io.StringIO()):
+            InstanceImpl("bench-added").remove()
+
+    def start():
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = InstanceImpl(names[-1]).start(background = True)
+        if not result.success:
+            raise RuntimeError(result.message)
+
+    def stop():
+        with contextlib.redirect_stdout(io.StringIO()):
+            InstanceImpl(names[-1]).stop()
+
+    sessions = CliSessionPool()
+
+    def cli():
+        target = InstanceImpl(names[-1])
+        results = sessions.session(names[-1], target.composeCliCommand(conf)).run([ ":read-attribute(name=server-state)" ])
+        if not results[-1].success:
+            raise RuntimeError(results[-1].output)
+
+    operations = {
+        "config.load.cold": (config.Config.load, drop_caches, None),
+        "config.load": (config.Config.load, None, None),
+        "state.load": (lambda: InstanceStateManager.load(conf).state_for(names[-1]), None, None),
+        "state.save": (save_state, None, None),
+        "list": (list_instances, None, None),
+        "compose": (compose, None, None),
+        "add": (add, None, remove),
+        "start": (start, None, stop),
+        "stop": (stop, start, None),
+        "cli": (cli, None, None),
+    }
+
+    result = dict()
+    with sessions:
+        for case in cases:
+            operation, setup, teardown = operations[case]
+            result[case] = measure(repeat, operation, setup, teardown)
+            print(f"{size:>6} {case:<18} min={result[case]['min']:9.2f} ms median={result[case]['median']:9.2f} ms")
+
+    return result
+
+
+def commit() -> str:
+    """
+    Returns the current commit of the tool, marked as dirty when there are uncommitted changes.
+
+    ### Returns
+    - Abbreviated commit hash or `None` when unavailable.
+    """
+    try:
+        head = subprocess.run(
+            [ "git", "-C", HOME, "rev-parse", "--short", "HEAD" ], capture_output = True, text = True, check = True)
+        status = subprocess.run(
+            [ "git", "-C", HOME, "status", "--porcelain", "--untracked-files=no" ], capture_output = True, text = True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+    return head.stdout.strip() + ("-dirty" if status.stdout.strip() else "")
+
+
+def compare(
+        previous : dict,
+        current : dict,
+) -> None:
+    """
+    Displays the relative change of the median of every case between two runs.
+
+    ### Returns
+    - Nothing.
+    """
+    print(f"\nCompared to {previous['commit']} from {previous['timestamp']}:")
+    for size, cases in current["results"].items():
+        for case, measurement in cases.items():
+            before = previous["results"].get(size, dict()).get(case)
+            if before is None:
+                continue
+            change = (measurement["median"] - before["median"]) / before["median"] * 100
+            print(f"{size:>6} {case:<18} {before['median']:9.2f} ms -> {measurement['median']:9.2f} ms {change:+7.1f}%")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default = ",".join(str(x) for x in DEFAULT_SIZES),
+                        help = "Comma separated inventory sizes")
+    parser.add_argument("--cases", default = ",".join(CASES), help = "Comma separated cases to run")
+    parser.add_argument("--repeat", type = int, default = 5, help = "Number of runs per case")
+    parser.add_argument("--files", type = int, default = 500, help = "Number of files in the fake base installation")
+    parser.add_argument("--sharded", action = "store_true", help = "Use the sharded configuration layout")
+    parser.add_argument("--history", default = DEFAULT_HISTORY, help = "JSON history file")
+    parser.add_argument("--compare", action = "store_true", help = "Compare with the previous run of another commit")
+    args = parser.parse_args()
+
+    sizes = [ int(x) for x in args.sizes.split(",") ]
+    cases = args.cases.split(",")
+    unknown = set(cases) - set(CASES)
+    if unknown:
+        parser.error(f"Unknown cases: {', '.join(sorted(unknown))}")
+
+    run = {
+        "commit": commit(),
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec = "seconds"),
+        "python": platform.python_version(),
+        "repeat": args.repeat,
+        "sharded": args.sharded,
+        "results": dict(),
+    }
+
+    sandbox = Sandbox()
+    try:
+        sandbox.install_jboss(args.files)
+        for size in sizes:
+            run["results"][str(size)] = run_size(sandbox, size, cases, args.repeat, args.sharded)
+    finally:
+        sandbox.remove()
+
+    history = []
+    with contextlib.suppress(FileNotFoundError):
+        with open(args.history, "r") as f:
+            history = json.load(f)
+
+    if args.compare:
+        previous = [ x for x in history if x["commit"] != run["commit"] and x.get("sharded") == args.sharded ]
+        if previous:
+            compare(previous[-1], run)
+        else:
+            print("\nNo previous run of another commit to compare with")
+
+    history.append(run)
+    with open(args.history, "w") as f:
+        json.dump(history, f, indent = 2)
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
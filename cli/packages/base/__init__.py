@@ -1,3 +1,4 @@
 __version__ = "0.0.1"
 
 from .main import Command
+from .engine import BoundedBuffer, ExecutionResult, ProcessEngine
@@ -0,0 +1,486 @@
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+
+class BoundedBuffer:
+    """
+    Captures a stream keeping at most `limit` bytes, the most recent ones, and counts what was dropped.
+    """
+    _data : bytearray
+    _limit : int
+    dropped : int
+
+    def __init__(
+            self,
+            limit : int,
+    ):
+        """
+        Creates an instance.
+
+        ### Arguments
+        - limit : int
+            - Maximum number of bytes kept.
+        """
+        self._data = bytearray()
+        self._limit = limit
+        self.dropped = 0
+
+
+    def write(
+            self,
+            data : bytes,
+    ) -> None:
+        """
+        Appends data, dropping the oldest bytes beyond the limit.
+
+        ### Returns
+        - Nothing.
+        """
+        self._data += data
+        excess = len(self._data) - self._limit
+        if excess > 0:
+            del self._data[:excess]
+            self.dropped = self.dropped + excess
+
+
+    def getvalue(
+            self,
+    ) -> bytes:
+        """
+        Returns the bytes kept.
+
+        ### Returns
+        - Captured bytes.
+        """
+        return bytes(self._data)
+
+
+class ExecutionResult:
+    """
+    Outcome of a command run to completion, see `ProcessEngine.run()`.
+    """
+    args : list
+    pid : int
+    returncode : int
+    stdout : bytes
+    stderr : bytes
+    truncated : bool
+    timed_out : bool
+    elapsed : float
+
+    def __init__(
+            self,
+            args : list,
+            pid : int,
+            returncode : int,
+            stdout : bytes = b"",
+            stderr : bytes = b"",
+            truncated : bool = False,
+            timed_out : bool = False,
+            elapsed : float = 0.0,
+    ):
+        """
+        Creates an instance.
+
+        ### Arguments
+        - args : list[str]
+            - Command line.
+        - pid : int
+            - PID the command ran with.
+        - returncode : int
+            - Exit status, or the negated signal number if it was killed by a signal.
+        - stdout : bytes
+            - Captured standard output, empty when not captured.
+        - stderr : bytes
+            - Captured standard error, empty when not captured.
+        - truncated : bool
+            - Whether or not the oldest captured output was dropped to stay within the limit.
+        - timed_out : bool
+            - Whether or not the command was terminated because it ran out of time.
+        - elapsed : float
+            - Wall clock time, in seconds, the command took.
+        """
+        self.args = args
+        self.pid = pid
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+        self.truncated = truncated
+        self.timed_out = timed_out
+        self.elapsed = elapsed
+
+
+    @property
+    def success(
+            self,
+    ) -> bool:
+        """
+        Whether or not the command exited with status 0 in time.
+        """
+        return self.returncode == 0 and not self.timed_out
+
+
+class ProcessEngine:
+    """
+    Runs commands on an `asyncio` event loop so that any number of them run concurrently from a single thread.
+
+    - Commands are executed directly, without a shell, so arguments are never reinterpreted.
+
+    - Exits are noticed through a pidfd registered with the event loop, and the child is then reaped right away,
+      without a thread per child. Commands started in the background are reaped the same way by an event loop, either
+      the one given, which may run in another thread, or the one running in the calling thread, otherwise by whoever
+      waits for them, see `instance.impl.ChildDiscovery`, or once this process exits. Their reaping may be held off
+      until `release()` so that whoever watches them meanwhile obtains their exit status.
+
+    - Captured output is streamed from non-blocking pipes into a `BoundedBuffer` per stream as it is written.
+
+    - Commands running out of time, or whose run is cancelled, are sent `SIGTERM` and, after `KILL_GRACE` seconds,
+      `SIGKILL`.
+
+    `asyncio` is only imported when running commands in the foreground, it is costly to import for short lived
+    processes.
+    """
+    _pending : set
+    _held : dict
+    _lock : threading.Lock
+
+    DEFAULT_LIMIT = 1024 * 1024
+    KILL_GRACE = 5
+
+    # Time allowed for reading what remains in the pipes once the command exited, which may be held open by its own
+    # background children forever
+    DRAIN_TIMEOUT = 0.1
+
+    _CHUNK = 64 * 1024
+    _POLL_INTERVAL = 0.05
+
+    def __init__(
+            self,
+    ):
+        """
+        Creates an instance.
+        """
+        self._pending = set()
+        self._held = dict()
+        self._lock = threading.Lock()
+
+
+    async def run(
+            self,
+            args : list,
+            env : dict = None,
+            cwd : str = None,
+            timeout : float = None,
+            capture : bool = True,
+            limit : int = DEFAULT_LIMIT,
+    ) -> ExecutionResult:
+        """
+        Runs a command and waits for it to exit.
+
+        ### Arguments
+        - args : list[str]
+            - Command line, starting with the executable.
+        - env : dict
+            - Complete environment of the command, inherited when not provided.
+        - cwd : str
+            - Working directory of the command, inherited when not provided.
+        - timeout : float
+            - Maximum time, in seconds, the command may run, no limit when `None`.
+        - capture : bool
+            - Whether to capture the standard output and error, with the standard input closed, or to let the
+              command use the standard streams of this process, e.g. for interactive commands. In the latter case
+              `SIGINT` and `SIGQUIT` are ignored by this process while the command runs, like `system()` does.
+        - limit : int
+            - Maximum number of bytes captured per stream.
+
+        ### Returns
+        - Outcome of the command.
+
+        ### Raises
+        - OSError
+            - If the command cannot be executed.
+        """
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        started = time.monotonic()
+        pipe = subprocess.PIPE if capture else None
+        proc = subprocess.Popen(
+            args, stdin = subprocess.DEVNULL if capture else None, stdout = pipe, stderr = pipe, env = env, cwd = cwd)
+
+        # Only once the command was executed, so that it does not inherit ignoring them
+        ignored = dict()
+        if not capture and threading.current_thread() is threading.main_thread():
+            for signum in (signal.SIGINT, signal.SIGQUIT):
+                ignored[signum] = signal.signal(signum, signal.SIG_IGN)
+
+        buffers = []
+        streams = []
+        if capture:
+            for stream in (proc.stdout, proc.stderr):
+                buffer = BoundedBuffer(limit)
+                buffers.append(buffer)
+                streams.append(self._stream(loop, stream, buffer))
+
+        exited = self._exited(loop, proc)
+        timed_out = False
+        try:
+            try:
+                await asyncio.wait_for(asyncio.shield(exited), timeout)
+            except asyncio.TimeoutError:
+                timed_out = True
+                await self._terminate(proc, exited)
+            except asyncio.CancelledError:
+                await asyncio.shield(self._terminate(proc, exited))
+                raise
+
+            # Whatever the command wrote before exiting is read unless the pipes are held open by its descendants
+            if streams:
+                await asyncio.wait(streams, timeout = ProcessEngine.DRAIN_TIMEOUT)
+        finally:
+            for stream in (proc.stdout, proc.stderr):
+                if stream is not None:
+                    loop.remove_reader(stream.fileno())
+                    stream.close()
+            for signum, handler in ignored.items():
+                signal.signal(signum, handler)
+
+        return ExecutionResult(
+            args, proc.pid, proc.returncode,
+            stdout = buffers[0].getvalue() if buffers else b"",
+            stderr = buffers[1].getvalue() if buffers else b"",
+            truncated = any(x.dropped for x in buffers),
+            timed_out = timed_out,
+            elapsed = time.monotonic() - started,
+        )
+
+
+    def spawn(
+            self,
+            args : list,
+            env : dict = None,
+            cwd : str = None,
+            loop = None,
+            hold : bool = False,
+    ) -> int:
+        """
+        Starts a command in the background, detached from the TTY with its standard streams closed, without waiting
+        for it. It is reaped once it exits by `loop`, or the event loop running in the calling thread if any.
+
+        ### Arguments
+        - args : list[str]
+            - Command line, starting with the executable.
+        - env : dict
+            - Complete environment of the command, inherited when not provided.
+        - cwd : str
+            - Working directory of the command, inherited when not provided.
+        - loop : asyncio.AbstractEventLoop
+            - Event loop to reap the command with, which may be running in another thread, e.g. when called from the
+              worker threads of an event loop.
+        - hold : bool
+            - Whether or not to hold off reaping the command until it is released, see `release()`, which the caller
+              is then responsible for.
+
+        ### Returns
+        - PID of the command.
+
+        ### Raises
+        - OSError
+            - If the command cannot be executed.
+        """
+        proc = subprocess.Popen(
+            args, stdin = subprocess.DEVNULL, stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL, env = env,
+            cwd = cwd, start_new_session = True)
+
+        # No event loop can be running unless asyncio was imported
+        asyncio = sys.modules.get("asyncio")
+        if loop is None and asyncio is not None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                pass
+
+        if hold:
+            with self._lock:
+                self._held[proc.pid] = (proc, loop)
+        else:
+            self._adopt(proc, loop)
+
+        return proc.pid
+
+
+    def release(
+            self,
+            pid : int,
+    ) -> int:
+        """
+        Ends holding off reaping a command started in the background, see `spawn()`. Should it have exited meanwhile
+        then it is reaped right away, otherwise it is handed over to the event loop it was started with, if any.
+
+        ### Arguments
+        - pid : int
+            - PID of the command.
+
+        ### Returns
+        - Exit status of the command, or `None` if it is still running or was not held.
+        """
+        with self._lock:
+            proc, loop = self._held.pop(pid, (None, None))
+        if proc is None:
+            return None
+
+        returncode = proc.poll()
+        if returncode is None:
+            self._adopt(proc, loop)
+        return returncode
+
+
+    def _adopt(
+            self,
+            proc : subprocess.Popen,
+            loop,
+    ) -> None:
+        """
+        Has a child started in the background reaped by an event loop once it exits, if any.
+
+        ### Returns
+        - Nothing.
+        """
+        if loop is not None:
+            try:
+                loop.call_soon_threadsafe(self._reap, loop, proc)
+            except RuntimeError:
+                # Closed meanwhile, then it is reaped by whoever waits for it
+                pass
+
+
+    def _reap(
+            self,
+            loop,
+            proc : subprocess.Popen,
+    ) -> None:
+        """
+        Reaps a child started in the background once it exits. Must be called from the thread running `loop`.
+
+        ### Returns
+        - Nothing.
+        """
+        exited = self._exited(loop, proc)
+        self._pending.add(exited)
+        exited.add_done_callback(self._pending.discard)
+
+
+    def _exited(
+            self,
+            loop,
+            proc : subprocess.Popen,
+    ):
+        """
+        Returns a future completed with the exit status of a child once it exited and was reaped.
+
+        ### Returns
+        - Future.
+        """
+        import asyncio
+
+        future = loop.create_future()
+
+        def reap() -> None:
+            try:
+                returncode = proc.wait()
+            except ChildProcessError:
+                # Reaped by someone else meanwhile
+                returncode = proc.returncode
+            if not future.done():
+                future.set_result(returncode)
+
+        try:
+            pidfd = os.pidfd_open(proc.pid)
+        except (AttributeError, OSError):
+            pidfd = None
+
+        if pidfd is not None:
+            def readable() -> None:
+                loop.remove_reader(pidfd)
+                os.close(pidfd)
+                reap()
+
+            loop.add_reader(pidfd, readable)
+        else:
+            async def poll() -> None:
+                while proc.poll() is None:
+                    await asyncio.sleep(ProcessEngine._POLL_INTERVAL)
+                reap()
+
+            # Held until done since the loop only keeps weak references to tasks
+            poller = loop.create_task(poll())
+            self._pending.add(poller)
+            poller.add_done_callback(self._pending.discard)
+
+        return future
+
+
+    def _stream(
+            self,
+            loop,
+            stream,
+            buffer : BoundedBuffer,
+    ):
+        """
+        Captures a pipe into a buffer as data becomes available.
+
+        ### Returns
+        - Future completed once the pipe reached its end.
+        """
+        future = loop.create_future()
+        fd = stream.fileno()
+        os.set_blocking(fd, False)
+
+        def readable() -> None:
+            while True:
+                try:
+                    data = os.read(fd, ProcessEngine._CHUNK)
+                except BlockingIOError:
+                    return
+                if not data:
+                    loop.remove_reader(fd)
+                    if not future.done():
+                        future.set_result(None)
+                    return
+                buffer.write(data)
+
+        loop.add_reader(fd, readable)
+        return future
+
+
+    async def _terminate(
+            self,
+            proc : subprocess.Popen,
+            exited,
+    ) -> None:
+        """
+        Sends `SIGTERM` to a child, then `SIGKILL` if it did not exit within `KILL_GRACE` seconds, and waits for it
+        to be reaped.
+
+        ### Returns
+        - Nothing.
+        """
+        import asyncio
+
+        for signum in (signal.SIGTERM, signal.SIGKILL):
+            if exited.done():
+                return
+            try:
+                proc.send_signal(signum)
+            except ProcessLookupError:
+                pass
+            try:
+                await asyncio.wait_for(asyncio.shield(exited), ProcessEngine.KILL_GRACE)
+                return
+            except asyncio.TimeoutError:
+                continue
+        await exited
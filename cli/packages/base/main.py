@@ -1,36 +1,63 @@
-import sys
-import os
-import subprocess
+import shlex
+
+from .engine import ProcessEngine
 
 
 class Command:
+    # Shared by every command so that its background children are reaped by whichever event loop is running
+    engine : ProcessEngine = ProcessEngine()
+
     def execute(
             self,
             args : list = [],
             command : str = None,
             debug : bool = False,
             background : bool = False,
+            env : dict = None,
+            timeout : float = None,
+            loop = None,
+            hold : bool = False,
     ) -> int:
         """
-        Executes a command.
+        Executes a command directly, without a shell, see `ProcessEngine`.
 
         If `background` is `True` then the command is executed in the background detachad from the TTY, *stdout*, 
         *stderr* and *stdin* are suppresed and the PID is returned. Otherwise the comamnd is executed in the 
         foreground, *stdout*, *stderr* and *stdim* are preserved amd the exit status of the command is returned.
-        """
-        result = None
 
-        cmdline = "{} {}".format(command, " ".join(args))
+        If `env` is provided it is used as the complete environment of the command instead of inheriting the
+        environment of this process. A foreground command running for longer than `timeout` seconds is terminated. A
+        background command is reaped by `loop` when provided, or only once released with `hold`, see
+        `ProcessEngine.spawn()`.
+
+        This must not be called while an event loop is running in the calling thread, use `execute_async()` instead.
+        """
+        cmdline = [ command ] + args
         if debug:
-            print(f"Executing command: {cmdline}")
-        if not background:
-            # Run command in the foreground and wait for it to exit
-            result = os.waitstatus_to_exitcode(os.system(cmdline))
-        else:
+            print(f"Executing command: {shlex.join(cmdline)}")
+        if background:
             # Run command in the background, detached, and do not wait for it at all
-            # args = [ command ] + args
-            # result = os.spawnv(os.P_NOWAITO, command, args)
-            args = [ command ] + args
-            result = subprocess.Popen(args, stdout = subprocess.DEVNULL, stderr = subprocess.STDOUT, stdin = subprocess.DEVNULL).pid
- 
-        return result
\ No newline at end of file
+            return Command.engine.spawn(cmdline, env = env, loop = loop, hold = hold)
+
+        # Run command in the foreground and wait for it to exit
+        import asyncio
+
+        return asyncio.run(Command.engine.run(cmdline, env = env, timeout = timeout, capture = False)).returncode
+
+
+    async def execute_async(
+            self,
+            args : list = [],
+            command : str = None,
+            env : dict = None,
+            timeout : float = None,
+            capture : bool = True,
+    ):
+        """
+        Executes a command directly, without a shell, and waits for it to exit without blocking the event loop, see
+        `ProcessEngine.run()`.
+
+        ### Returns
+        - `ExecutionResult` of the command.
+        """
+        return await Command.engine.run([ command ] + args, env = env, timeout = timeout, capture = capture)
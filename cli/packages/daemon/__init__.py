@@ -0,0 +1,6 @@
+# The CLI is only imported when used, the client is imported by every invocation to forward commands to the daemon
+def __getattr__(name : str):
+    if name == "app":
+        from .main import app
+        return app
+    raise AttributeError(name)
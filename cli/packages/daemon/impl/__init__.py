@@ -0,0 +1,4 @@
+__version__ = "0.0.1"
+
+# The server is imported by the daemon only, every invocation imports the client to forward commands
+from .client import DaemonClient
@@ -0,0 +1,271 @@
+import json
+import os
+import socket
+import sys
+
+import paths
+
+
+class DaemonClient:
+    """
+    Client of the daemon, see `DaemonServer`.
+
+    Messages are JSON documents exchanged over a `SOCK_SEQPACKET` Unix socket, which preserves message boundaries, one
+    request and one response per connection. Commands are run by the daemon with the standard streams of the client,
+    which are passed along the request, so their output goes straight to the terminal or pipe of the client.
+    """
+    _timeout : float
+
+    # Instance commands run by the daemon. Those attached to the terminal for their whole duration, i.e. `cli` and
+    # starting in the foreground, are always run in-process.
+    FORWARDED = ("add", "remove", "list", "migrate", "start", "stop", "restart", "rolling-restart", "status", "kill")
+
+    # Environment variable disabling forwarding when set to a non-empty value
+    DISABLE_VARIABLE = "JBADM_NO_DAEMON"
+
+    MAX_MESSAGE = 1 << 20
+
+    # Whether or not commands are forwarded by this process, the daemon itself runs them in-process
+    enabled = True
+
+    def __init__(
+            self,
+            timeout : float = None,
+    ):
+        """
+        Creates an instance.
+
+        ### Arguments
+        - timeout : float
+            - Time, in seconds, to wait for a response; no limit when not provided.
+        """
+        self._timeout = timeout
+
+
+    @staticmethod
+    def socket_path() -> str:
+        """
+        Returns the absolute path to the socket of the daemon.
+
+        ### Returns
+        - Socket path.
+        """
+        return f"{paths.Paths.daemon()}/jbadm.sock"
+
+
+    @staticmethod
+    def forwardable(
+            argv : list,
+    ) -> bool:
+        """
+        Returns whether or not a command line may be run by the daemon, regardless of whether forwarding is enabled.
+
+        ### Arguments
+        - argv : list[str]
+            - Command line arguments, without the program name.
+
+        ### Returns
+        - True if it may be forwarded, False if it must run in-process.
+        """
+        if len(argv) < 2 or argv[0] != "instance" or argv[1] not in DaemonClient.FORWARDED:
+            return False
+        return not (argv[1] == "start" and "--no-background" in argv)
+
+
+    def request(
+            self,
+            message : dict,
+            fds : list = [],
+    ) -> dict:
+        """
+        Sends a request to the daemon and waits for its response.
+
+        ### Arguments
+        - message : dict
+            - Request.
+        - fds : list[int]
+            - File descriptors passed along the request.
+
+        ### Returns
+        - Response.
+
+        ### Raises
+        - FileNotFoundError, ConnectionRefusedError
+            - If the daemon is not running.
+        - ConnectionError
+            - If the daemon closed the connection without responding.
+        """
+        with self._send(message, fds) as sock:
+            return self._receive(sock)
+
+
+    def cli(
+            self,
+            name : str,
+            commands : list,
+            timeout : float = None,
+    ) -> list:
+        """
+        Performs JBoss CLI commands against a managed instance with the session the daemon keeps for it, see
+        `instance.impl.CliSessionPool`. The outcome of every command is sent as its output, in chunks, followed by
+        the result itself and then a final status once every command completed.
+
+        ### Arguments
+        - name : str
+            - Managed instance name.
+        - commands : list[str]
+            - Commands, see `instance.impl.CliSession.group()`.
+        - timeout : float
+            - Maximum time, in seconds, the commands may take.
+
+        ### Returns
+        - List of `instance.impl.CliResult`, one per command performed, or `None` if the commands were not performed,
+          because forwarding is disabled, the daemon is not running or rejected them, so they must be performed
+          in-process.
+
+        ### Raises
+        - ConnectionError
+            - If the daemon closed the connection before every command completed.
+        """
+        from instance.impl.cli import CliResult
+
+        if os.environ.get(DaemonClient.DISABLE_VARIABLE):
+            return None
+        message = { "op": "cli", "name": name, "commands": commands, "timeout": timeout }
+        try:
+            sock = self._send(message)
+        except (FileNotFoundError, ConnectionRefusedError):
+            return None
+
+        results = []
+        output = []
+        with sock:
+            while True:
+                response = self._receive(sock)
+                if "error" in response:
+                    return None
+                if "output" in response:
+                    output.append(response["output"])
+                elif "result" in response:
+                    results.append(CliResult(output = "".join(output), **response["result"]))
+                    output = []
+                else:
+                    return results
+
+
+    def ping(
+            self,
+    ) -> dict:
+        """
+        Inquires the status of the daemon.
+
+        ### Returns
+        - Status of the daemon, `pid`, `started`, `served` and `active`, or `None` if it is not running.
+        """
+        try:
+            return self.request({ "op": "ping" })
+        except (FileNotFoundError, ConnectionRefusedError):
+            return None
+
+
+    def shutdown(
+            self,
+    ) -> bool:
+        """
+        Requests the daemon to exit once the commands it is running completed.
+
+        ### Returns
+        - True if it was running, False otherwise.
+        """
+        try:
+            self.request({ "op": "shutdown" })
+        except (FileNotFoundError, ConnectionRefusedError):
+            return False
+        return True
+
+
+    def _send(
+            self,
+            message : dict,
+            fds : list = [],
+    ) -> socket.socket:
+        """
+        Connects to the daemon and sends a request.
+
+        ### Returns
+        - Connected socket, to receive the responses from.
+        """
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET | socket.SOCK_CLOEXEC)
+        try:
+            sock.connect(DaemonClient.socket_path())
+            sock.settimeout(self._timeout)
+            socket.send_fds(sock, [ json.dumps(message).encode() ], fds)
+        except BaseException:
+            sock.close()
+            raise
+        return sock
+
+
+    def _receive(
+            self,
+            sock : socket.socket,
+    ) -> dict:
+        """
+        Receives a response from the daemon.
+
+        ### Returns
+        - Response.
+        """
+        response = sock.recv(DaemonClient.MAX_MESSAGE)
+        if not response:
+            raise ConnectionError("Daemon closed the connection without responding")
+        return json.loads(response)
+
+
+    def forward(
+            self,
+            argv : list,
+    ) -> int:
+        """
+        Runs a command line in the daemon with the standard streams, environment and working directory of this
+        process.
+
+        ### Arguments
+        - argv : list[str]
+            - Command line arguments, without the program name.
+
+        ### Returns
+        - Exit status of the command or `None` if it was not run, because it cannot be forwarded or the daemon is not
+          running, so it must be run in-process.
+        """
+        if not DaemonClient.enabled or os.environ.get(DaemonClient.DISABLE_VARIABLE):
+            return None
+        if not DaemonClient.forwardable(argv):
+            return None
+
+        # Every standard stream must be open to be passed along
+        try:
+            for fd in (0, 1, 2):
+                os.fstat(fd)
+        except OSError:
+            return None
+
+        message = {
+            "op": "run",
+            "argv": argv,
+            "cwd": os.getcwd(),
+            "env": dict(os.environ),
+        }
+        try:
+            response = self.request(message, [ 0, 1, 2 ])
+        except (FileNotFoundError, ConnectionRefusedError):
+            return None
+        except OSError as e:
+            # The command may or may not have run, it must not be run again
+            print(f"Lost connection to the daemon: {e}", file = sys.stderr)
+            return 1
+
+        # The command is not run when the request is rejected
+        if "error" in response:
+            return None
+        return response["status"]
@@ -0,0 +1,516 @@
+import importlib
+import json
+import os
+import selectors
+import signal
+import socket
+import struct
+import sys
+import time
+
+from .client import DaemonClient
+from .supervisor import Supervisor
+from instance.impl.cli import CliSessionPool
+import paths
+import store
+import util
+
+
+class DaemonServer:
+    """
+    Long running agent serving the instance commands over a Unix socket, see `DaemonClient`, so that they do not pay
+    for starting Python, importing their dependencies and loading the configuration and instance states every time.
+
+    - Everything is imported once at startup and the parsed configuration and instance states are retained in memory,
+      see `store.Memo`. Their directories are watched with `inotify` and retained files are discarded as soon as they
+      change, including when changed by other processes. Pending events are always processed before serving a command
+      so that no command observes a stale file.
+
+    - Every command runs in a child forked from the daemon, which inherits everything imported and retained, with the
+      standard streams, environment and working directory of the client. Commands therefore run concurrently, are
+      isolated from each other and behave exactly as when run in-process.
+
+    - The daemon is single threaded, so that forking is safe, and multiplexes its socket, the `inotify` descriptor,
+      signals and the pidfds of its children with `selectors`.
+
+    - JBoss CLI commands are performed by sessions the daemon keeps per managed instance, see `CliSessionPool`,
+      which are driven by the same loop and ended once idle for `CLI_TTL` seconds.
+
+    - Only clients running as the same user as the daemon, or as root, are served.
+    """
+    _listener : socket.socket
+    _selector : selectors.BaseSelector
+    _inotify : util.Inotify
+    _wakeup : tuple
+    _supervise : bool
+    _program : object
+    _children : dict
+    _supervisor : Supervisor
+    _sessions : CliSessionPool
+    _clients : set
+    _running : bool
+    _started : float
+    _served : int
+
+    CLI_TTL = CliSessionPool.DEFAULT_TTL
+
+    # Size of the chunks the output of CLI commands is sent in, well within the limit of a single message
+    CLI_CHUNK = 32 * 1024
+
+    _PEERCRED = struct.Struct("3i")
+
+    def __init__(
+            self,
+            supervise : bool = False,
+    ):
+        """
+        Creates an instance.
+
+        ### Arguments
+        - supervise : bool
+            - Whether or not to restart the JVMs of managed instances that exit unexpectedly, see `Supervisor`.
+        """
+        self._supervise = supervise
+        self._listener = None
+        self._selector = None
+        self._inotify = None
+        self._wakeup = None
+        self._program = None
+        self._children = dict()
+        self._supervisor = None
+        self._sessions = None
+        self._clients = set()
+        self._running = False
+        self._started = None
+        self._served = 0
+
+
+    @staticmethod
+    def program() -> str:
+        """
+        Returns the absolute path to the program run for every command.
+
+        ### Returns
+        - Program path.
+        """
+        return f"{paths.Paths.home()}/bin/jbadm"
+
+
+    def serve(
+            self,
+    ) -> None:
+        """
+        Serves requests until the daemon is requested to shut down or receives `SIGTERM` or `SIGINT`. Commands still
+        running are waited upon before returning.
+
+        ### Returns
+        - Nothing.
+
+        ### Raises
+        - BlockingIOError
+            - If the daemon is already running.
+        """
+        socket_path = DaemonClient.socket_path()
+        os.makedirs(paths.Paths.daemon(), mode = 0o700, exist_ok = True)
+        with store.Store.locked(socket_path, blocking = False):
+            # Import everything the commands need once and for all
+            for module in ("config", "instance", "typer", "typer.rich_utils"):
+                importlib.import_module(module)
+            with open(DaemonServer.program(), "r") as f:
+                self._program = compile(f.read(), DaemonServer.program(), "exec")
+
+            store.Memo.enable()
+            DaemonClient.enabled = False
+
+            self._selector = selectors.DefaultSelector()
+            self._inotify = util.Inotify()
+            self._selector.register(self._inotify, selectors.EVENT_READ, self._changed)
+            self._watch()
+            self._warm()
+
+            # Signals are handled within the loop
+            self._wakeup = socket.socketpair()
+            for sock in self._wakeup:
+                sock.setblocking(False)
+            signal.set_wakeup_fd(self._wakeup[1].fileno())
+            for signum in (signal.SIGTERM, signal.SIGINT):
+                signal.signal(signum, lambda *args: None)
+            self._selector.register(self._wakeup[0], selectors.EVENT_READ, self._signalled)
+
+            # A socket left behind by a daemon that did not exit cleanly is stale since the lock is held
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
+            self._listener = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET | socket.SOCK_CLOEXEC)
+            self._listener.bind(socket_path)
+            os.chmod(socket_path, 0o600)
+            self._listener.listen(128)
+            self._selector.register(self._listener, selectors.EVENT_READ, self._accept)
+
+            if self._supervise:
+                self._supervisor = Supervisor(self._selector, self._fork)
+                self._supervisor.reconcile()
+            self._sessions = CliSessionPool(ttl = DaemonServer.CLI_TTL, selector = self._selector)
+
+            self._running = True
+            self._started = time.time()
+            print(f"Daemon {os.getpid()} listening on {socket_path}", flush = True)
+            try:
+                while self._running or self._children or self._sessions.busy():
+                    timeouts = [ self._sessions.timeout() ]
+                    if self._supervisor and self._running:
+                        timeouts.append(self._supervisor.timeout())
+                    timeouts = [ x for x in timeouts if x is not None ]
+                    for key, _ in self._selector.select(min(timeouts) if timeouts else None):
+                        key.data(key.fileobj)
+                    self._sessions.tick()
+                    if self._supervisor and self._running:
+                        # Decisions must not be based on retained instance states that changed meanwhile
+                        self._changed(self._inotify)
+                        self._supervisor.tick()
+            finally:
+                self._sessions.close()
+                if self._supervisor:
+                    self._supervisor.close()
+                os.unlink(socket_path)
+                signal.set_wakeup_fd(-1)
+                for sock in (self._listener, *self._wakeup):
+                    sock.close()
+                self._inotify.close()
+                self._selector.close()
+            print(f"Daemon {os.getpid()} exiting after serving {self._served} commands", flush = True)
+
+
+    def _accept(
+            self,
+            listener : socket.socket,
+    ) -> None:
+        """
+        Serves a request.
+
+        ### Returns
+        - Nothing.
+        """
+        conn, _ = listener.accept()
+        fds = []
+        try:
+            conn.settimeout(5)
+            pid, uid, gid = DaemonServer._PEERCRED.unpack(
+                conn.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, DaemonServer._PEERCRED.size))
+            message, fds, _, _ = socket.recv_fds(conn, DaemonClient.MAX_MESSAGE, 3)
+            request = json.loads(message)
+
+            if uid not in (0, os.getuid()):
+                response = { "error": f"User {uid} is not allowed" }
+            elif not self._running:
+                response = { "error": "Shutting down" }
+            elif request.get("op") == "ping":
+                response = {
+                    "pid": os.getpid(),
+                    "started": self._started,
+                    "served": self._served,
+                    "active": len(self._children),
+                    "supervising": self._supervisor is not None,
+                }
+            elif request.get("op") == "supervision":
+                if self._supervisor is None:
+                    response = { "error": "Not supervising" }
+                else:
+                    self._changed(self._inotify)
+                    response = { "instances": [ x.to_dict() for x in self._supervisor.instances() ] }
+            elif request.get("op") == "shutdown":
+                self._running = False
+                response = { "status": 0 }
+            elif request.get("op") == "run" and len(fds) == 3 and DaemonClient.forwardable(request.get("argv", [])):
+                self._run(conn, fds, request)
+                conn = None
+                return
+            elif request.get("op") == "cli" and isinstance(request.get("name"), str) and \
+                    isinstance(request.get("commands"), list):
+                response = self._cli(conn, request)
+                if response is None:
+                    conn = None
+                    return
+            else:
+                response = { "error": "Invalid request" }
+            conn.send(json.dumps(response).encode())
+        except (OSError, ValueError) as e:
+            print(f"Failed to serve a request: {e}", file = sys.stderr, flush = True)
+        finally:
+            for fd in fds:
+                os.close(fd)
+            if conn is not None:
+                conn.close()
+
+
+    def _run(
+            self,
+            conn : socket.socket,
+            fds : list,
+            request : dict,
+    ) -> None:
+        """
+        Runs a command in a child whose exit status is sent to the client once it exits.
+
+        ### Returns
+        - Nothing.
+        """
+        # Never let a command observe a change it could not have missed in-process
+        self._changed(self._inotify)
+        self._watch()
+        self._warm()
+
+        def command() -> int:
+            conn.close()
+
+            # The standard streams are those of the client, buffered as if this process had been started with them
+            for target, fd in zip((0, 1, 2), fds):
+                os.dup2(fd, target)
+                os.close(fd)
+            sys.stdin = open(0, "r", closefd = False)
+            sys.stdout = open(1, "w", closefd = False)
+            sys.stderr = open(2, "w", buffering = 1, closefd = False, errors = "backslashreplace")
+            os.chdir(request["cwd"])
+            os.environ.clear()
+            os.environ.update(request["env"])
+
+            sys.argv = [ DaemonServer.program() ] + request["argv"]
+            try:
+                exec(self._program, { "__name__": "__main__", "__file__": DaemonServer.program() })
+            except SystemExit as e:
+                return e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+            return 0
+
+        def done(status : int) -> None:
+            try:
+                conn.send(json.dumps({ "status": status }).encode())
+            except OSError:
+                # The client went away
+                pass
+            conn.close()
+
+        self._fork(command, done, conn)
+        self._served = self._served + 1
+
+
+    def _cli(
+            self,
+            conn : socket.socket,
+            request : dict,
+    ) -> dict:
+        """
+        Performs JBoss CLI commands with the session of a managed instance, responding once they completed, see
+        `DaemonClient.cli()`.
+
+        ### Returns
+        - Response to send right away if the commands cannot be performed, `None` otherwise.
+        """
+        import config
+        from instance.impl import InstanceImpl
+
+        self._changed(self._inotify)
+        self._watch()
+        try:
+            conf = config.Config.load()
+            target = InstanceImpl(request["name"])
+            if not target.exists(conf):
+                return { "error": f"Instance {request['name']} does not exist" }
+            session = self._sessions.session(request["name"], target.composeCliCommand(conf))
+        except Exception as e:
+            # Reported by the command itself once performed in-process
+            return { "error": str(e) }
+
+        def done(results : list) -> None:
+            self._clients.discard(conn)
+            try:
+                for result in results:
+                    output = result.output
+                    for offset in range(0, len(output), DaemonServer.CLI_CHUNK):
+                        conn.send(json.dumps({ "output": output[offset:offset + DaemonServer.CLI_CHUNK] }).encode())
+                    conn.send(json.dumps({ "result": { "command": result.command, "success": result.success } }).encode())
+                conn.send(json.dumps({ "status": 0 }).encode())
+            except OSError:
+                # The client went away
+                pass
+            conn.close()
+
+        self._clients.add(conn)
+        session.submit(request["commands"], done, request.get("timeout"))
+        self._served = self._served + 1
+        return None
+
+
+    def _fork(
+            self,
+            target,
+            done,
+            conn : socket.socket = None,
+    ) -> None:
+        """
+        Runs a callable in a forked child.
+
+        ### Arguments
+        - target : callable
+            - Callable run in the child, returning its exit status. Uncaught exceptions are reported just like those of
+              a command run in-process and exit with status 1.
+        - done : callable
+            - Callable invoked with the exit status of the child once it exited, or 128 plus the signal number if it
+              was killed by a signal.
+        - conn : socket.socket
+            - Connection of the client the child runs on behalf of, if any.
+
+        ### Returns
+        - Nothing.
+        """
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid == 0:
+            status = 1
+            try:
+                signal.set_wakeup_fd(-1)
+                for signum in (signal.SIGTERM, signal.SIGINT):
+                    signal.signal(signum, signal.SIG_DFL)
+                self._selector.close()
+                for sock in (self._listener, *self._wakeup):
+                    sock.close()
+                self._inotify.close()
+                if self._supervisor:
+                    self._supervisor.close()
+                self._sessions.detach()
+                for client in self._clients:
+                    client.close()
+                for pidfd, (_, _, other) in self._children.items():
+                    os.close(pidfd)
+                    if other is not None:
+                        other.close()
+                status = target()
+            except BaseException as e:
+                sys.excepthook(type(e), e, e.__traceback__)
+            finally:
+                try:
+                    sys.stdout.flush()
+                    sys.stderr.flush()
+                finally:
+                    os._exit(status)
+
+        pidfd = os.pidfd_open(pid)
+        self._children[pidfd] = (pid, done, conn)
+        self._selector.register(pidfd, selectors.EVENT_READ, self._reap)
+
+
+    def _reap(
+            self,
+            pidfd : int,
+    ) -> None:
+        """
+        Reports the exit status of a child.
+
+        ### Returns
+        - Nothing.
+        """
+        self._selector.unregister(pidfd)
+        pid, done, _ = self._children.pop(pidfd)
+        os.close(pidfd)
+
+        _, status = os.waitpid(pid, 0)
+        status = os.waitstatus_to_exitcode(status)
+        if status < 0:
+            # Killed by a signal, reported like shells do
+            status = 128 - status
+        done(status)
+
+
+    def _signalled(
+            self,
+            wakeup : socket.socket,
+    ) -> None:
+        """
+        Stops serving new requests upon `SIGTERM` or `SIGINT`.
+
+        ### Returns
+        - Nothing.
+        """
+        try:
+            while wakeup.recv(64):
+                pass
+        except BlockingIOError:
+            pass
+        self._running = False
+
+
+    def _changed(
+            self,
+            inotify : util.Inotify,
+    ) -> None:
+        """
+        Discards the retained files that changed.
+
+        ### Returns
+        - Nothing.
+        """
+        events = inotify.read()
+        for path, mask, name in events:
+            if path is None or not name or path == paths.Paths.schemas():
+                # Queue overflow, watched directory gone or schema changed
+                store.Memo.invalidate()
+            else:
+                store.Memo.invalidate(f"{path}/{name}")
+
+        # Changes of the instance states of the sharded layout concern one instance, any other change may concern all
+        if events and self._supervisor:
+            names = set()
+            everything = False
+            for path, mask, name in events:
+                if name.endswith(".state"):
+                    names.add(name[:-len(".state")])
+                elif not name.startswith("."):
+                    everything = True
+            if everything:
+                self._supervisor.reconcile()
+            elif names:
+                self._supervisor.reconcile(sorted(names))
+
+
+    def _watch(
+            self,
+    ) -> None:
+        """
+        Watches the directories of the configuration, the schemas and the instance states, which is done before
+        serving every command since they may be created or relocated at any time. Watching a directory already watched
+        has no effect.
+
+        ### Returns
+        - Nothing.
+        """
+        import config
+
+        directories = [ paths.Paths.configs(), config.Config.conf_dir(), paths.Paths.schemas() ]
+        try:
+            directories.append(config.Config.load().paths.run)
+        except Exception:
+            # Reported by the commands themselves
+            pass
+        for directory in directories:
+            try:
+                self._inotify.add_watch(directory)
+            except OSError:
+                pass
+
+
+    def _warm(
+            self,
+    ) -> None:
+        """
+        Retains the configuration and instance states so that children inherit them.
+
+        ### Returns
+        - Nothing.
+        """
+        import config
+        from instance.impl.state import InstanceStateManager
+
+        try:
+            InstanceStateManager.load(config.Config.load())
+        except Exception:
+            # Reported by the commands themselves
+            pass
@@ -0,0 +1,355 @@
+import os
+import selectors
+import time
+
+import config
+from instance.impl import InstanceImpl
+from instance.impl.process import ProcessIdentity
+from instance.impl.state import InstanceStateManager
+
+
+class SupervisedInstance:
+    """
+    Supervision record of a managed instance.
+    """
+    name : str
+    pid : int
+    pidfd : int
+    status : str
+    exits : list
+    restarts : int
+    last_exit : float
+    deadline : float
+
+    RUNNING = "running"
+    EXITED = "exited"
+    BACKOFF = "backoff"
+    RESTARTING = "restarting"
+    CRASH_LOOP = "crash-loop"
+    STOPPED = "stopped"
+
+    def __init__(
+            self,
+            name : str,
+    ):
+        """
+        Creates an instance.
+
+        ### Arguments
+        - name : str
+            - Managed instance name.
+        """
+        self.name = name
+        self.pid = None
+        self.pidfd = None
+        self.status = SupervisedInstance.STOPPED
+        self.exits = []
+        self.restarts = 0
+        self.last_exit = None
+        self.deadline = None
+
+
+    def to_dict(
+            self,
+    ) -> dict:
+        """
+        Returns this record as a dictionary.
+
+        ### Returns
+        - Dictionary of the record fields.
+        """
+        return {
+            "name": self.name,
+            "pid": self.pid,
+            "status": self.status,
+            "exits": len(self.exits),
+            "restarts": self.restarts,
+            "last_exit": self.last_exit,
+        }
+
+
+class Supervisor:
+    """
+    Restarts the JVMs of managed instances that exit unexpectedly, see `DaemonServer`.
+
+    - The JVM recorded in the state of every managed instance is held through a pidfd, registered with the event loop
+      of the daemon, so exits are noticed immediately without polling whoever started it. The instance states are
+      reconciled whenever their files change, which the daemon watches, so instances started or stopped by any means
+      are picked up.
+
+    - An exit is only deemed unexpected when the state of the instance still records the exited JVM once `SETTLE`
+      seconds elapsed, since stopping an instance removes its state right after its JVM exited.
+
+    - Unexpected exits are restarted after an exponential backoff starting at `INITIAL_BACKOFF` seconds and doubling
+      with every exit within the last `WINDOW` seconds, up to `MAXIMUM_BACKOFF`. Once `MAXIMUM_EXITS` exits occurred
+      within `WINDOW` the instance is deemed crash looping and left alone until it is started again by other means.
+    """
+    _selector : selectors.BaseSelector
+    _spawn : object
+    _instances : dict
+
+    SETTLE = 1.0
+    INITIAL_BACKOFF = 1.0
+    MAXIMUM_BACKOFF = 60.0
+    WINDOW = 600.0
+    MAXIMUM_EXITS = 5
+
+    def __init__(
+            self,
+            selector : selectors.BaseSelector,
+            spawn,
+    ):
+        """
+        Creates an instance.
+
+        ### Arguments
+        - selector : selectors.BaseSelector
+            - Selector of the event loop the pidfds are registered with, their data is the callback to invoke with the
+              pidfd once it becomes readable.
+        - spawn : callable
+            - Callable accepting a callable to run in a child process, returning its exit status, and a callable
+              invoked with that exit status once the child exited.
+        """
+        self._selector = selector
+        self._spawn = spawn
+        self._instances = dict()
+
+
+    def instances(
+            self,
+    ) -> list:
+        """
+        Returns the supervision records.
+
+        ### Returns
+        - List of `SupervisedInstance` sorted by name.
+        """
+        return [ self._instances[x] for x in sorted(self._instances) ]
+
+
+    def reconcile(
+            self,
+            names : list = None,
+    ) -> None:
+        """
+        Tracks the JVMs recorded in the instance states.
+
+        ### Arguments
+        - names : list[str]
+            - Managed instances to reconcile, every managed instance when not provided.
+
+        ### Returns
+        - Nothing.
+        """
+        conf = config.Config.load()
+        state_manager = InstanceStateManager.load(conf)
+        known = set(conf.instance_names())
+        if names is None:
+            names = known | set(self._instances)
+
+        for name in names:
+            record = self._instances.get(name)
+            if name not in known:
+                # Managed instance removed
+                if record is not None:
+                    self._untrack(record)
+                    del self._instances[name]
+                continue
+
+            if record is None:
+                record = self._instances[name] = SupervisedInstance(name)
+            if record.status in (SupervisedInstance.EXITED, SupervisedInstance.RESTARTING):
+                # Decided upon once settled, respectively once restarted
+                continue
+
+            state = state_manager.state_for(name)
+            pid = state.pid if state is not None else None
+            if pid is None:
+                if record.status in (SupervisedInstance.RUNNING, SupervisedInstance.BACKOFF):
+                    # Stopped, possibly while waiting to be restarted
+                    self._untrack(record)
+                    record.pid = None
+                    record.status = SupervisedInstance.STOPPED
+                    record.deadline = None
+                continue
+            if pid == record.pid:
+                continue
+
+            # Started by other means, which ends crash looping
+            if record.status == SupervisedInstance.CRASH_LOOP:
+                record.exits = []
+            self._untrack(record)
+            record.deadline = None
+            self._track(record, state)
+
+
+    def timeout(
+            self,
+    ) -> float:
+        """
+        Returns the time until the next pending decision or restart.
+
+        ### Returns
+        - Time in seconds or `None` if nothing is pending.
+        """
+        deadlines = [ x.deadline for x in self._instances.values() if x.deadline is not None ]
+        if not deadlines:
+            return None
+        return max(0.0, min(deadlines) - time.monotonic())
+
+
+    def tick(
+            self,
+    ) -> None:
+        """
+        Decides upon the settled exits and restarts the instances whose backoff elapsed.
+
+        ### Returns
+        - Nothing.
+        """
+        now = time.monotonic()
+        for record in list(self._instances.values()):
+            if record.deadline is None or record.deadline > now:
+                continue
+            record.deadline = None
+            if record.status == SupervisedInstance.EXITED:
+                self._settled(record)
+            elif record.status == SupervisedInstance.BACKOFF:
+                self._restart(record)
+
+
+    def close(
+            self,
+    ) -> None:
+        """
+        Closes every pidfd.
+
+        ### Returns
+        - Nothing.
+        """
+        for record in self._instances.values():
+            if record.pidfd is not None:
+                os.close(record.pidfd)
+                record.pidfd = None
+
+
+    def _track(
+            self,
+            record : SupervisedInstance,
+            state,
+    ) -> None:
+        """
+        Holds the JVM recorded in the state of a managed instance through a pidfd.
+
+        ### Returns
+        - Nothing.
+        """
+        record.pid = state.pid
+        record.status = SupervisedInstance.RUNNING
+        try:
+            record.pidfd = os.pidfd_open(state.pid)
+        except ProcessLookupError:
+            # Already gone
+            self._exited(record)
+            return
+
+        # Verified once the pidfd is held so that it cannot refer to another process reusing the PID
+        if not ProcessIdentity.verify(state):
+            self._exited(record)
+            return
+        self._selector.register(record.pidfd, selectors.EVENT_READ, lambda pidfd: self._exited(record))
+
+
+    def _untrack(
+            self,
+            record : SupervisedInstance,
+    ) -> None:
+        """
+        Releases the pidfd of a managed instance.
+
+        ### Returns
+        - Nothing.
+        """
+        if record.pidfd is not None:
+            if record.pidfd in self._selector.get_map():
+                self._selector.unregister(record.pidfd)
+            os.close(record.pidfd)
+            record.pidfd = None
+
+
+    def _exited(
+            self,
+            record : SupervisedInstance,
+    ) -> None:
+        """
+        Records the exit of the JVM of a managed instance, whether it was expected is decided once settled.
+
+        ### Returns
+        - Nothing.
+        """
+        self._untrack(record)
+        record.status = SupervisedInstance.EXITED
+        record.last_exit = time.time()
+        record.deadline = time.monotonic() + Supervisor.SETTLE
+
+
+    def _settled(
+            self,
+            record : SupervisedInstance,
+    ) -> None:
+        """
+        Decides whether the exit of the JVM of a managed instance was expected and schedules its restart if not.
+
+        ### Returns
+        - Nothing.
+        """
+        conf = config.Config.load()
+        state = InstanceStateManager.load(conf).state_for(record.name) if conf.instance(record.name) else None
+        if state is None or state.pid != record.pid:
+            # Stopped, or started again, by other means
+            record.pid = None
+            record.status = SupervisedInstance.STOPPED
+            self.reconcile([ record.name ])
+            return
+
+        now = time.monotonic()
+        record.exits = [ x for x in record.exits if now - x < Supervisor.WINDOW ] + [ now ]
+        if len(record.exits) >= Supervisor.MAXIMUM_EXITS:
+            record.status = SupervisedInstance.CRASH_LOOP
+            print(f"Instance {record.name} exited {len(record.exits)} times within {Supervisor.WINDOW:.0f} s, "
+                  f"no longer restarting it", flush = True)
+            return
+
+        delay = min(Supervisor.INITIAL_BACKOFF * 2 ** (len(record.exits) - 1), Supervisor.MAXIMUM_BACKOFF)
+        record.status = SupervisedInstance.BACKOFF
+        record.deadline = now + delay
+        print(f"Instance {record.name} with PID {record.pid} exited unexpectedly, restarting it in {delay:.0f} s",
+              flush = True)
+
+
+    def _restart(
+            self,
+            record : SupervisedInstance,
+    ) -> None:
+        """
+        Starts the JVM of a managed instance again in a child process.
+
+        ### Returns
+        - Nothing.
+        """
+        def start() -> int:
+            result = InstanceImpl(record.name).start(background = True)
+            return 0 if result.success else 1
+
+        def restarted(status : int) -> None:
+            record.status = SupervisedInstance.STOPPED
+            if status != 0:
+                # Counts as another exit
+                record.status = SupervisedInstance.EXITED
+                self._settled(record)
+                return
+            record.restarts = record.restarts + 1
+            self.reconcile([ record.name ])
+
+        record.status = SupervisedInstance.RESTARTING
+        self._spawn(start, restarted)
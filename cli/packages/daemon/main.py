@@ -0,0 +1,142 @@
+import datetime
+import os
+import subprocess
+import sys
+import time
+
+import typer
+from rich import print
+
+app = typer.Typer(rich_markup_mode="rich")
+
+import daemon.impl
+import paths
+import util
+
+
+STATUS_COLUMNS = [
+    util.Column("pid", "PID", style = "green"),
+    util.Column("started", "Started", format = lambda x: datetime.datetime.fromtimestamp(x).isoformat(timespec = "seconds")),
+    util.Column("served", "Served", justify = "right"),
+    util.Column("active", "Active", justify = "right"),
+    util.Column("supervising", "Supervising"),
+]
+
+SUPERVISION_COLUMNS = [
+    util.Column("name", "Name", style = "green"),
+    util.Column("pid", "PID"),
+    util.Column("status", "Status", style = "yellow"),
+    util.Column("exits", "Recent exits", justify = "right"),
+    util.Column("restarts", "Restarts", justify = "right"),
+    util.Column("last_exit", "Last exit", format = lambda x: datetime.datetime.fromtimestamp(x).isoformat(timespec = "seconds")),
+]
+
+
+#=====
+# Build the CLI
+@app.command()
+def run(
+    supervise: bool = typer.Option(False, help="Restart instances whose JVM exits unexpectedly"),
+):
+    """
+    Run the daemon in the foreground, e.g. under a service manager
+    """
+    # The server pulls in the instance commands, only the commands launching it import it
+    from daemon.impl.server import DaemonServer
+
+    try:
+        DaemonServer(supervise = supervise).serve()
+    except BlockingIOError:
+        print("The daemon is already running")
+        raise typer.Exit(code = 1)
+
+
+@app.command()
+def start(
+    supervise: bool = typer.Option(False, help="Restart instances whose JVM exits unexpectedly"),
+    timeout: float = typer.Option(10, help="Seconds to wait for the daemon to accept commands"),
+):
+    """
+    Start the daemon in the background, instance commands are then forwarded to it
+    """
+    client = daemon.impl.DaemonClient()
+    if client.ping() is not None:
+        print("The daemon is already running")
+        return
+
+    from daemon.impl.server import DaemonServer
+
+    os.makedirs(paths.Paths.daemon(), mode = 0o700, exist_ok = True)
+    with open(f"{paths.Paths.daemon()}/daemon.log", "ab") as log:
+        subprocess.Popen(
+            [ sys.executable, DaemonServer.program(), "daemon", "run" ] + ([ "--supervise" ] if supervise else []),
+            stdin = subprocess.DEVNULL, stdout = log, stderr = subprocess.STDOUT, start_new_session = True)
+
+    deadline = time.monotonic() + timeout
+    while client.ping() is None:
+        if time.monotonic() > deadline:
+            print(f"The daemon did not start, see {paths.Paths.daemon()}/daemon.log")
+            raise typer.Exit(code = 1)
+        time.sleep(0.05)
+    print("Started the daemon")
+
+
+@app.command()
+def stop(
+    timeout: float = typer.Option(60, help="Seconds to wait for the commands being run by the daemon to complete"),
+):
+    """
+    Stop the daemon once the commands it is running completed
+    """
+    client = daemon.impl.DaemonClient()
+    if not client.shutdown():
+        print("The daemon is not running")
+        return
+
+    deadline = time.monotonic() + timeout
+    while os.path.exists(daemon.impl.DaemonClient.socket_path()):
+        if time.monotonic() > deadline:
+            print("The daemon did not stop in time")
+            raise typer.Exit(code = 1)
+        time.sleep(0.05)
+    print("Stopped the daemon")
+
+
+@app.command()
+def status(
+    output: util.OutputFormat = typer.Option(util.OutputFormat.TABLE, "--output", "-o", help="Output format"),
+):
+    """
+    Show daemon status
+    """
+    result = daemon.impl.DaemonClient().ping()
+    if result is None:
+        print("The daemon is not running")
+        raise typer.Exit(code = 1)
+    with util.OutputWriter(output, STATUS_COLUMNS) as writer:
+        writer.write(result)
+
+
+@app.command()
+def supervision(
+    output: util.OutputFormat = typer.Option(util.OutputFormat.TABLE, "--output", "-o", help="Output format"),
+):
+    """
+    Show the instances supervised by the daemon
+    """
+    try:
+        result = daemon.impl.DaemonClient().request({ "op": "supervision" })
+    except (FileNotFoundError, ConnectionRefusedError):
+        print("The daemon is not running")
+        raise typer.Exit(code = 1)
+    if "error" in result:
+        print("The daemon is not supervising instances, start it with --supervise")
+        raise typer.Exit(code = 1)
+    with util.OutputWriter(output, SUPERVISION_COLUMNS) as writer:
+        for record in result["instances"]:
+            writer.write(record)
+#-----
+
+
+if __name__ == "__main__":
+    app()
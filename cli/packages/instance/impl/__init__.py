@@ -1,3 +1,12 @@
 __version__ = "0.0.1"
 
 from .main import InstanceImpl
+from .cli import CliResult, CliSession, CliSessionPool
+from .process import ChildDiscovery, WrapperExitError
+from .batch import InstanceBatch
+from .manager import InstanceManager
+from .result import InstanceStatus, OperationResult
+from .metrics import ProcessMetrics
+from .provision import Provisioner, ProvisionStats
+from .readiness import Readiness, ReadinessWatcher
+from .template import TemplateCache
@@ -0,0 +1,339 @@
+from box import Box
+import fnmatch
+import threading
+import yaml
+
+from .cli import CliSession
+from .manager import InstanceManager
+from .readiness import ReadinessWatcher
+from .result import OperationResult
+import config
+import schema
+
+
+class InstanceBatch:
+    """
+    Performs lifecycle operations against many managed instances at once.
+
+    - Instances are selected either by name, by a glob pattern matched against the instance names or all of them.
+
+    - Lifecycle operations are performed by an `InstanceManager`, which loads the configuration and the instance
+      states once for the whole batch and saves the instance states once after every operation completed. The batch
+      is its synchronous counterpart, the command line interface being built upon it, a single named instance being
+      a batch of one.
+
+    - An optional listener is notified of the outcome of every operation as soon as it completes.
+    """
+    _names : list
+    _pattern : str
+    _select_all : bool
+    _parallel : int
+    _listener : object
+    _lock : threading.Lock
+
+    DEFAULT_PARALLELISM = InstanceManager.DEFAULT_PARALLELISM
+
+    def __init__(
+            self,
+            names : list = None,
+            pattern : str = None,
+            select_all : bool = False,
+            parallel : int = DEFAULT_PARALLELISM,
+            listener = None,
+    ):
+        """
+        Creates an instance.
+
+        ### Arguments
+        - names : list[str]
+            - Explicit managed instance names to operate on.
+        - pattern : str
+            - Glob pattern to select managed instances by name.
+        - select_all : bool
+            - Whether or not to operate on all managed instances.
+        - parallel : int
+            - Maximum number of operations to perform concurrently.
+        - listener : callable
+            - Callable accepting an `OperationResult`, called, one at a time, as soon as every operation completes.
+        """
+        self._names = names or []
+        self._pattern = pattern
+        self._select_all = select_all
+        self._parallel = max(1, parallel)
+        self._listener = listener
+        self._lock = threading.Lock()
+
+
+    def select(
+            self,
+            conf : config.Config,
+    ) -> list:
+        """
+        Determines the managed instances this batch operates on.
+
+        ### Arguments
+        - conf : config.Config
+            - Configuration file instance which serves as the source of truth for all managed instances.
+
+        ### Returns
+        - List of managed instance names, in configuration order for selections.
+        """
+        if self._select_all:
+            return conf.instance_names()
+        if self._pattern:
+            return fnmatch.filter(conf.instance_names(), self._pattern)
+        return list(self._names)
+
+
+    def add(
+            self,
+            instances : list,
+            link : bool = False,
+    ) -> list:
+        """
+        Adds many managed instances at once within a single configuration transaction, see `InstanceManager.add()`.
+        The selection of the batch is not used.
+
+        ### Arguments
+        - instances : list[Box]
+            - Managed instance configurations, see `load_manifest()`.
+        - link : bool
+            - Whether or not to hard link the assets rather than copying them when possible.
+
+        ### Returns
+        - List of `OperationResult`, one per managed instance in the order of `instances`.
+        """
+        return self._manage(lambda manager, names: manager.add(instances, link = link))
+
+
+    @staticmethod
+    def load_manifest(
+            path : str,
+    ) -> list:
+        """
+        Loads the managed instances to add from a manifest. A manifest is a YAML document whose `instances` are managed
+        instance configurations, just like in the configuration.
+
+        ### Arguments
+        - path : str
+            - Path to the manifest.
+
+        ### Returns
+        - List of managed instance configurations.
+
+        ### Raises
+        - ValueError
+            - If the manifest has no list of `instances`.
+        - jsonschema.ValidationError
+            - If a managed instance configuration is not valid.
+        """
+        with open(path, "rb") as f:
+            data = yaml.load(f.read(), Loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader))
+        if not isinstance(data, dict) or not isinstance(data.get("instances"), list):
+            raise ValueError(f"Manifest {path} must have a list of instances")
+
+        conf_schema = schema.Schema.load(config.Config.schema())
+        for instance in data["instances"]:
+            conf_schema.validate(instance, definition = "Instance")
+
+        return [ Box(x) for x in data["instances"] ]
+
+
+    @staticmethod
+    def numbered(
+            prefix : str,
+            count : int,
+    ) -> list:
+        """
+        Names managed instances to add after a prefix followed by a sequence number, skipping the names of the
+        existing managed instances.
+
+        ### Arguments
+        - prefix : str
+            - Managed instance name prefix.
+        - count : int
+            - Number of managed instances.
+
+        ### Returns
+        - List of managed instance configurations.
+        """
+        existing = set(config.Config.load().instance_names())
+        result = []
+        number = 1
+        while len(result) < count:
+            if f"{prefix}{number}" not in existing:
+                result.append(Box(name = f"{prefix}{number}"))
+            number = number + 1
+
+        return result
+
+
+    def remove(
+            self,
+    ) -> list:
+        """
+        Removes the selected managed instances that are not running, see `InstanceManager.remove()`.
+
+        ### Returns
+        - List of `OperationResult`, one per selected managed instance.
+        """
+        return self._manage(lambda manager, names: manager.remove(names))
+
+
+    def start(
+            self,
+            wait_ready : bool = False,
+            ready_timeout : float = ReadinessWatcher.DEFAULT_TIMEOUT,
+    ) -> list:
+        """
+        Starts the selected managed instances in the background, see `InstanceManager.start()`.
+
+        ### Arguments
+        - wait_ready : bool
+            - Whether or not to wait until every started managed instance logged that its boot completed. All of them
+              are followed at once by a single `ReadinessWatcher` and the outcomes are only final once they booted.
+        - ready_timeout : float
+            - Maximum time, in seconds, every managed instance is given to boot.
+
+        ### Returns
+        - List of `OperationResult`, one per selected managed instance.
+        """
+        return self._manage(lambda manager, names:
+            manager.start(names, wait_ready = wait_ready, ready_timeout = ready_timeout))
+
+
+    def stop(
+            self,
+    ) -> list:
+        """
+        Stops the selected managed instances within a single shared graceful shutdown window, see
+        `InstanceManager.stop()`.
+
+        ### Returns
+        - List of `OperationResult`, one per selected managed instance.
+        """
+        return self._manage(lambda manager, names: manager.stop(names))
+
+
+    def kill(
+            self,
+    ) -> list:
+        """
+        Forcefully stops the selected managed instances, see `InstanceManager.kill()`.
+
+        ### Returns
+        - List of `OperationResult`, one per selected managed instance.
+        """
+        return self._manage(lambda manager, names: manager.kill(names))
+
+
+    def restart(
+            self,
+    ) -> list:
+        """
+        Restarts the selected managed instances. All of them are first stopped within a single shared graceful shutdown
+        window and then started concurrently, see `InstanceManager.restart()`.
+
+        ### Returns
+        - List of `OperationResult`, one per selected managed instance.
+        """
+        return self._manage(lambda manager, names: manager.restart(names))
+
+
+    def rolling_restart(
+            self,
+            max_unavailable : int = 1,
+            ready_timeout : float = ReadinessWatcher.DEFAULT_TIMEOUT,
+    ) -> list:
+        """
+        Restarts the selected managed instances a few at a time so that the others keep serving, aborting on the
+        first failure, see `InstanceManager.rolling_restart()`.
+
+        ### Arguments
+        - max_unavailable : int
+            - Maximum number of managed instances restarting at once.
+        - ready_timeout : float
+            - Maximum time, in seconds, every managed instance is given to boot.
+
+        ### Returns
+        - List of `OperationResult`, one per selected managed instance; those not restarted because the rollout was
+          aborted are unsuccessful.
+        """
+        return self._manage(lambda manager, names:
+            manager.rolling_restart(names, max_unavailable = max_unavailable, ready_timeout = ready_timeout))
+
+
+    def status(
+            self,
+    ) -> list:
+        """
+        Checks whether or not the selected managed instances are running, see `InstanceManager.check()`.
+
+        ### Returns
+        - List of `OperationResult`, one per selected managed instance, successful for the running ones.
+        """
+        return self._manage(lambda manager, names: manager.check(names))
+
+
+    def cli(
+            self,
+            commands : list = None,
+            file : str = None,
+            timeout : float = CliSession.DEFAULT_TIMEOUT,
+    ) -> list:
+        """
+        Performs the same CLI commands against the selected managed instances concurrently, see
+        `InstanceManager.cli()`. The output of every managed instance is captured in its outcome rather than printed so
+        that the outputs are not interleaved.
+
+        ### Arguments
+        - commands : list[str]
+            - CLI commands to execute.
+        - file : str
+            - File containing CLI commands to execute after `commands`, read once for all managed instances.
+        - timeout : float
+            - Maximum time, in seconds, the commands may take per managed instance.
+
+        ### Returns
+        - List of `OperationResult`, one per selected managed instance, with the captured output.
+        """
+        return self._manage(lambda manager, names:
+            manager.cli(names, commands = commands, file = file, timeout = timeout))
+
+
+    def _manage(
+            self,
+            operation,
+    ) -> list:
+        """
+        Performs a lifecycle operation against the selected managed instances with an `InstanceManager` sharing the
+        configuration and the instance states loaded once for the whole batch, on an event loop run for the
+        operation.
+
+        ### Arguments
+        - operation : callable
+            - Callable accepting the manager and the selected managed instance names and returning the coroutine of
+              the operation.
+
+        ### Returns
+        - List of `OperationResult`, one per selected managed instance.
+        """
+        import asyncio
+
+        manager = InstanceManager(parallel = self._parallel, listener = self._notify, quiet = False)
+        return asyncio.run(operation(manager, self.select(manager.conf)))
+
+
+    def _notify(
+            self,
+            result : OperationResult,
+    ) -> None:
+        """
+        Notifies the listener, if any, of the outcome of an operation.
+
+        ### Returns
+        - Nothing.
+        """
+        if self._listener is not None:
+            with self._lock:
+                self._listener(result)
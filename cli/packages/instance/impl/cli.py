@@ -0,0 +1,689 @@
+import collections
+import os
+import select
+import selectors
+import signal
+import subprocess
+import threading
+import time
+
+from base import BoundedBuffer
+
+
+class CliResult:
+    """
+    Outcome of a command, or block of commands, performed by the JBoss CLI, see `CliSession`.
+    """
+    command : str
+    success : bool
+    output : str
+
+    def __init__(
+            self,
+            command : str,
+            success : bool = True,
+            output : str = "",
+    ):
+        """
+        Creates an instance.
+
+        ### Arguments
+        - command : str
+            - Command, or block of commands separated by new lines.
+        - success : bool
+            - Whether or not the command succeeded.
+        - output : str
+            - Output of the command, standard output and standard error combined.
+        """
+        self.command = command
+        self.success = success
+        self.output = output
+
+
+    def to_dict(
+            self,
+    ) -> dict:
+        """
+        Returns a dictionary representation suitable for use with YAML or JSON output.
+
+        ### Returns
+        - Dictionary representation of this result.
+        """
+        return {
+            "command": self.command,
+            "success": self.success,
+            "output": self.output,
+        }
+
+
+class _Request:
+    """
+    Commands submitted at once to a session, performed one after the other.
+    """
+    units : list
+    done : object
+    deadline : float
+    results : list
+    output : BoundedBuffer
+    marker : str
+
+    def __init__(
+            self,
+            units : list,
+            done,
+            deadline : float,
+    ):
+        self.units = units
+        self.done = done
+        self.deadline = deadline
+        self.results = []
+        self.output = None
+        self.marker = None
+
+
+class CliSession:
+    """
+    Long lived JBoss CLI process connected to a managed instance, to which commands are piped one at a time so that
+    the JVM startup and the management connection handshake are only paid once.
+
+    - Every command is followed by an `echo` of a unique marker, the output of the command is everything the CLI
+      writes until the marker. Blocks which the CLI only performs once complete, i.e. `batch`, `if`, `try` and `for`,
+      are sent as a single unit, see `group()`. At most `MAXIMUM_OUTPUT` bytes of it, the most recent ones, are kept.
+
+    - A command fails when its outcome is `failed` or the CLI exits while performing it, which it does upon errors
+      when not interactive. The remaining commands of the request are then not performed.
+
+    - Requests are performed in the order submitted. The session is driven either by an event loop, which calls
+      `readable()` whenever `fileno()` is readable and `expire()` periodically, or by the blocking `run()`.
+    """
+    name : str
+    args : list
+    last_used : float
+    _proc : subprocess.Popen
+    _buffer : bytes
+    _requests : collections.deque
+    _counter : int
+    _lock : threading.Lock
+
+    MARKER = "jbadm-cli-done-"
+    DEFAULT_TIMEOUT = 300
+    MAXIMUM_OUTPUT = 1024 * 1024
+    CLOSE_TIMEOUT = 5
+
+    # Commands opening a block, and those closing it
+    BLOCKS = {
+        "batch": ("run-batch", "discard-batch"),
+        "if": ("end-if",),
+        "try": ("end-try",),
+        "for": ("done",),
+    }
+
+    def __init__(
+            self,
+            name : str,
+            args : list,
+            env : dict = None,
+    ):
+        """
+        Creates an instance and launches the CLI.
+
+        ### Arguments
+        - name : str
+            - Managed instance name.
+        - args : list[str]
+            - Command line of the CLI, see `InstanceImpl.composeCliCommand()`.
+        - env : dict
+            - Environment of the CLI, inherited when not provided.
+
+        ### Raises
+        - OSError
+            - If the CLI cannot be launched.
+        """
+        self.name = name
+        self.args = args
+        self.last_used = time.monotonic()
+        self._buffer = b""
+        self._requests = collections.deque()
+        self._counter = 0
+        self._lock = threading.Lock()
+        self._proc = subprocess.Popen(
+            args, stdin = subprocess.PIPE, stdout = subprocess.PIPE, stderr = subprocess.STDOUT, env = env,
+            start_new_session = True)
+        os.set_blocking(self._proc.stdout.fileno(), False)
+
+
+    @staticmethod
+    def group(
+            commands : list,
+    ) -> list:
+        """
+        Splits commands into the units performed one at a time: blank lines and comments are dropped and blocks are
+        kept together. Grouping units again returns them unchanged.
+
+        ### Arguments
+        - commands : list[str]
+            - Commands, each possibly spanning many lines, e.g. the lines of a CLI script.
+
+        ### Returns
+        - List of units, each a command or a block of commands separated by new lines.
+        """
+        result = []
+        block = []
+        closing = []
+        for line in "\n".join(commands).splitlines():
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            word = line.split(None, 1)[0]
+            if word in CliSession.BLOCKS:
+                closing.append(CliSession.BLOCKS[word])
+            elif closing and word in closing[-1]:
+                closing.pop()
+            block.append(line)
+            if not closing:
+                result.append("\n".join(block))
+                block = []
+
+        # An unterminated block is left to the CLI to report
+        if block:
+            result.append("\n".join(block))
+
+        return result
+
+
+    @property
+    def alive(
+            self,
+    ) -> bool:
+        """
+        Whether or not the CLI is still running.
+        """
+        return self._proc.poll() is None
+
+
+    @property
+    def busy(
+            self,
+    ) -> bool:
+        """
+        Whether or not requests are pending.
+        """
+        return bool(self._requests)
+
+
+    def deadline(
+            self,
+    ) -> float:
+        """
+        Returns the time by which the current request must complete.
+
+        ### Returns
+        - Monotonic time or `None` if idle.
+        """
+        return self._requests[0].deadline if self._requests else None
+
+
+    def fileno(
+            self,
+    ) -> int:
+        """
+        Returns the descriptor which becomes readable when the CLI writes output or exits.
+
+        ### Returns
+        - File descriptor.
+        """
+        return self._proc.stdout.fileno()
+
+
+    def submit(
+            self,
+            commands : list,
+            done,
+            timeout : float = DEFAULT_TIMEOUT,
+    ) -> None:
+        """
+        Submits commands to perform once the requests submitted before completed.
+
+        ### Arguments
+        - commands : list[str]
+            - Commands, see `group()`.
+        - done : callable
+            - Callable invoked with the list of `CliResult` once the request completed, one per unit performed.
+        - timeout : float
+            - Maximum time, in seconds, the request may take once submitted, no limit when `None`.
+
+        ### Returns
+        - Nothing.
+        """
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        self._requests.append(_Request(CliSession.group(commands), done, deadline))
+        if len(self._requests) == 1:
+            self._next()
+
+
+    def run(
+            self,
+            commands : list,
+            timeout : float = DEFAULT_TIMEOUT,
+    ) -> list:
+        """
+        Performs commands and waits for them to complete. May be called from any thread, calls are serialized.
+
+        ### Arguments
+        - commands : list[str]
+            - Commands, see `group()`.
+        - timeout : float
+            - Maximum time, in seconds, the commands may take, no limit when `None`.
+
+        ### Returns
+        - List of `CliResult`, one per unit performed.
+        """
+        with self._lock:
+            results = []
+            self.submit(commands, results.extend, timeout)
+            while self._requests:
+                deadline = self.deadline()
+                remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+                ready, _, _ = select.select([ self.fileno() ], [], [], remaining)
+                if ready:
+                    self.readable()
+                else:
+                    self.expire()
+
+            return results
+
+
+    def readable(
+            self,
+    ) -> None:
+        """
+        Consumes the output of the CLI, completing the commands whose marker was written.
+
+        ### Returns
+        - Nothing.
+        """
+        exited = False
+        while True:
+            try:
+                data = os.read(self.fileno(), 64 * 1024)
+            except BlockingIOError:
+                break
+            if not data:
+                exited = True
+                break
+            self._buffer = self._buffer + data
+
+        *lines, self._buffer = self._buffer.split(b"\n")
+        if exited and self._buffer:
+            lines.append(self._buffer)
+            self._buffer = b""
+        for line in lines:
+            if not self._requests:
+                # Output of the CLI itself, e.g. when connecting
+                continue
+            request = self._requests[0]
+            if line.strip() == request.marker.encode():
+                self._completed(request)
+            else:
+                # Only the most recent output is kept, where the outcome is
+                request.output.write(line.rstrip(b"\r") + b"\n")
+
+        if exited:
+            self._failed(f"CLI exited with status {self._proc.wait()}")
+
+
+    def expire(
+            self,
+            now : float = None,
+    ) -> None:
+        """
+        Terminates the CLI if the current request is past its deadline. Its state is then unknown so it cannot be
+        used any longer.
+
+        ### Arguments
+        - now : float
+            - Current monotonic time, read when not provided.
+
+        ### Returns
+        - Nothing.
+        """
+        deadline = self.deadline()
+        if deadline is not None and (now or time.monotonic()) >= deadline:
+            self._kill()
+            self._failed("Timed out")
+
+
+    def close(
+            self,
+    ) -> None:
+        """
+        Ends the CLI, failing the pending requests.
+
+        ### Returns
+        - Nothing.
+        """
+        if self.alive:
+            try:
+                self._proc.stdin.close()
+                self._proc.wait(CliSession.CLOSE_TIMEOUT)
+            except (OSError, subprocess.TimeoutExpired):
+                self._kill()
+        self._proc.stdout.close()
+        self._failed("Session closed")
+
+
+    def detach(
+            self,
+    ) -> None:
+        """
+        Closes the pipes of this session without ending the CLI, for use in a child forked by the owner of the
+        session.
+
+        ### Returns
+        - Nothing.
+        """
+        for pipe in (self._proc.stdin, self._proc.stdout):
+            try:
+                os.close(pipe.fileno())
+            except (OSError, ValueError):
+                pass
+
+
+    def _kill(
+            self,
+    ) -> None:
+        """
+        Forcefully ends the CLI together with every process of its session, `jboss-cli.sh` launching the CLI JVM as a
+        child which would otherwise be left behind holding the pipes open.
+
+        ### Returns
+        - Nothing.
+        """
+        try:
+            os.killpg(self._proc.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        self._proc.wait()
+
+
+    def _next(
+            self,
+    ) -> None:
+        """
+        Sends the next unit of the current request, or completes it if none is left.
+
+        ### Returns
+        - Nothing.
+        """
+        while self._requests:
+            request = self._requests[0]
+            if len(request.results) < len(request.units):
+                break
+            self._requests.popleft()
+            self.last_used = time.monotonic()
+            request.done(request.results)
+        else:
+            return
+
+        self._counter = self._counter + 1
+        request.marker = f"{CliSession.MARKER}{self._counter}"
+        request.output = BoundedBuffer(CliSession.MAXIMUM_OUTPUT)
+        unit = request.units[len(request.results)]
+        try:
+            self._proc.stdin.write(f"{unit}\necho {request.marker}\n".encode())
+            self._proc.stdin.flush()
+        except OSError:
+            # Exited, which is reported once its output is consumed
+            pass
+
+
+    def _completed(
+            self,
+            request : _Request,
+    ) -> None:
+        """
+        Records the outcome of the unit of the current request whose marker was written.
+
+        ### Returns
+        - Nothing.
+        """
+        output = request.output.getvalue().decode(errors = "replace").rstrip("\n")
+        unit = request.units[len(request.results)]
+        request.results.append(CliResult(unit, success = '"outcome" => "failed"' not in output, output = output))
+        if not request.results[-1].success:
+            # The remaining units depend on this one
+            request.units = request.units[:len(request.results)]
+        self._next()
+
+
+    def _failed(
+            self,
+            reason : str,
+    ) -> None:
+        """
+        Fails the current unit and every pending request once the CLI exited.
+
+        ### Returns
+        - Nothing.
+        """
+        requests = self._requests
+        self._requests = collections.deque()
+        for request in requests:
+            if request.marker is not None and len(request.results) < len(request.units):
+                output = request.output.getvalue().decode(errors = "replace") + reason
+                request.results.append(CliResult(request.units[len(request.results)], success = False, output = output))
+            request.done(request.results)
+
+
+class CliSessionPool:
+    """
+    Keeps one `CliSession` per managed instance and ends those idle for longer than `ttl`.
+
+    - Sessions are created on first use and replaced when their CLI exited or the command line of the managed instance
+      changed.
+
+    - With a selector every session is registered with it, see `CliSession`, and the owner of the event loop calls
+      `tick()` once `timeout()` elapsed. Otherwise idle sessions are evicted whenever a session is requested or
+      `evict()` is called.
+    """
+    _ttl : float
+    _selector : object
+    _sessions : dict
+    _lock : threading.Lock
+
+    DEFAULT_TTL = 300
+
+    def __init__(
+            self,
+            ttl : float = DEFAULT_TTL,
+            selector = None,
+    ):
+        """
+        Creates an instance.
+
+        ### Arguments
+        - ttl : float
+            - Time, in seconds, after which an idle session is ended.
+        - selector : selectors.BaseSelector
+            - Selector of the event loop driving the sessions, if any. The data of their registrations is the callback
+              to invoke with the descriptor once it becomes readable.
+        """
+        self._ttl = ttl
+        self._selector = selector
+        self._sessions = dict()
+        self._lock = threading.Lock()
+
+
+    def __enter__(
+            self,
+    ):
+        return self
+
+
+    def __exit__(
+            self,
+            exc_type,
+            exc_value,
+            traceback,
+    ) -> None:
+        self.close()
+
+
+    def session(
+            self,
+            name : str,
+            args : list,
+            env : dict = None,
+    ) -> CliSession:
+        """
+        Returns the session of a managed instance, launching its CLI if needed.
+
+        ### Arguments
+        - name : str
+            - Managed instance name.
+        - args : list[str]
+            - Command line of the CLI, see `InstanceImpl.composeCliCommand()`.
+        - env : dict
+            - Environment of the CLI, inherited when not provided.
+
+        ### Returns
+        - Session.
+
+        ### Raises
+        - OSError
+            - If the CLI cannot be launched.
+        """
+        if self._selector is None:
+            self.evict()
+        with self._lock:
+            session = self._sessions.get(name)
+            if session is not None and (not session.alive or session.args != args) and not session.busy:
+                self._discard(session)
+                session = None
+            if session is None:
+                session = self._sessions[name] = CliSession(name, args, env)
+                if self._selector is not None:
+                    self._selector.register(session.fileno(), selectors.EVENT_READ, lambda fd: self._readable(session))
+            return session
+
+
+    def busy(
+            self,
+    ) -> bool:
+        """
+        Returns whether or not any session has pending requests.
+
+        ### Returns
+        - True if requests are pending, False otherwise.
+        """
+        return any(x.busy for x in self._sessions.values())
+
+
+    def timeout(
+            self,
+    ) -> float:
+        """
+        Returns the time until the next request deadline or idle session expiry.
+
+        ### Returns
+        - Time in seconds or `None` if there is no session.
+        """
+        deadlines = []
+        for session in self._sessions.values():
+            deadline = session.deadline()
+            deadlines.append(deadline if deadline is not None or session.busy else session.last_used + self._ttl)
+        deadlines = [ x for x in deadlines if x is not None ]
+        if not deadlines:
+            return None
+        return max(0.0, min(deadlines) - time.monotonic())
+
+
+    def tick(
+            self,
+    ) -> None:
+        """
+        Fails the requests past their deadline and ends the sessions idle for longer than the TTL.
+
+        ### Returns
+        - Nothing.
+        """
+        now = time.monotonic()
+        for session in list(self._sessions.values()):
+            session.expire(now)
+        self.evict()
+
+
+    def evict(
+            self,
+    ) -> None:
+        """
+        Ends the sessions idle for longer than the TTL and those whose CLI exited.
+
+        ### Returns
+        - Nothing.
+        """
+        now = time.monotonic()
+        with self._lock:
+            for session in list(self._sessions.values()):
+                if not session.busy and (not session.alive or now - session.last_used >= self._ttl):
+                    self._discard(session)
+
+
+    def close(
+            self,
+    ) -> None:
+        """
+        Ends every session.
+
+        ### Returns
+        - Nothing.
+        """
+        with self._lock:
+            for session in list(self._sessions.values()):
+                self._discard(session)
+
+
+    def detach(
+            self,
+    ) -> None:
+        """
+        Closes the pipes of every session without ending them, see `CliSession.detach()`.
+
+        ### Returns
+        - Nothing.
+        """
+        for session in self._sessions.values():
+            session.detach()
+
+
+    def _readable(
+            self,
+            session : CliSession,
+    ) -> None:
+        """
+        Drives a session registered with the selector, discarding it once its CLI exited.
+
+        ### Returns
+        - Nothing.
+        """
+        session.readable()
+        if not session.alive and not session.busy:
+            with self._lock:
+                self._discard(session)
+
+
+    def _discard(
+            self,
+            session : CliSession,
+    ) -> None:
+        """
+        Ends a session and forgets it.
+
+        ### Returns
+        - Nothing.
+        """
+        if self._sessions.get(session.name) is session:
+            del self._sessions[session.name]
+        if self._selector is not None and session.fileno() in self._selector.get_map():
+            self._selector.unregister(session.fileno())
+        session.close()
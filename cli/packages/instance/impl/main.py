@@ -1,18 +1,20 @@
 from box import Box
-from rich import print as rprint
-from rich.console import Console
-from rich.table import Table
-import fnmatch
-import json
+import contextlib
 import os
 import psutil
 import shutil
-import time
-import yaml
 
 from base import *
+from .cli import CliSession, CliSessionPool
+from .metrics import ProcessMetrics
+from .process import ChildDiscovery, ProcessIdentity, is_standalone_jvm, terminate
+from .provision import ProvisionStats
+from .readiness import Readiness, ReadinessWatcher
+from .result import InstanceStatus, OperationResult
 from .state import InstanceStateManager, InstanceState
+from .template import TemplateCache
 import config
+import daemon.impl
 import util
 
 
@@ -29,6 +31,7 @@ class InstanceImpl(Command):
       (Process IDentifier) of the instance.
     """
     _name : str
+    _report : object
     _path : str
     _profile : str
     _jboss_properties : util.Properties
@@ -39,6 +42,7 @@ class InstanceImpl(Command):
     def __init__(
             self,
             name : str,
+            progress = print,
     ):
         """
         Creates an instace.
@@ -46,92 +50,144 @@ class InstanceImpl(Command):
         ### Arguments
         - name : str
             - Instance name.
+        - progress : callable
+            - Callable accepting a progress message, `None` to refrain from reporting progress, the outcomes report it
+              anyway. Called from whichever thread performs the lifecycle operation.
         """
         self._name = name
+        self._report = progress
 
 
     # TODO Consider adding support for providing Java properties to add to the configuration for the instance.
     # TODO Consider adding support for providing JVM options to add to the configuration for the instance.
     def add(
             self,
-    ) -> None:
+            link : bool = False,
+    ) -> OperationResult:
         """
-        Adds a managed instance.
+        Adds a managed instance by cloning the allowed assets of the base installation from the template cache, see
+        `TemplateCache`.
+
+        ### Arguments
+        - link : bool
+            - Whether or not to hard link the assets rather than copying them when possible. The managed instance then
+              shares their content with the template.
 
         ### Returns
-        - Nothing.
+        - Outcome of the operation.
         """
-        # Load configuration
-        conf = config.Config.load()
+        instance_path = None
+        try:
+            with config.Config.transaction() as conf:
+                # Check if instance already exists
+                if self.exists(conf):
+                    raise NameError(self._name, f"Instance {self._name} already exists")
 
-        # Check if instance already exists
-        if self.exists(conf):
-            raise NameError(self._name, f"Instance {self._name} already exists")
+                # Copy assets from base install
+                stats = self.provision(conf, link = link)
+                instance_path = f"{conf.paths.instances}/{self._name}"
+                self._progress(f"Provisioned instance {self._name}: {stats}")
+
+                # Update configuration, saved when the transaction completes
+                conf.add_instance(Box(name = self._name))
+        except BaseException:
+            if instance_path is not None:
+                shutil.rmtree(instance_path, ignore_errors = True)
+            raise
+
+        return OperationResult(self._name, "add", message = f"Added, {stats}", elapsed = stats.elapsed)
+
+
+    def provision(
+            self,
+            conf : config.Config,
+            link : bool = False,
+    ) -> ProvisionStats:
+        """
+        Creates the directory of this managed instance from the template cache without adding it to the
+        configuration.
 
-        # Copy assets from base install
+        ### Arguments
+        - conf : config.Config
+            - Configuration file instance which serves as the source of truth for all managed instances.
+        - link : bool
+            - Whether or not to hard link the assets rather than copying them when possible.
+
+        ### Returns
+        - Amount of work performed.
+
+        ### Raises
+        - FileExistsError
+            - If the directory of this managed instance already exists.
+        """
         src_path = f"{conf.paths.jboss}/standalone"
         dst_path = f"{conf.paths.instances}/{self._name}"
 
-        self.src_path = src_path
-        self.allowed = [
+        allowed = [
             f"configuration",
             f"configuration/*.properties",
             f"configuration/{conf.defaults.jboss.profile}",
             f"deployments",
         ]
-        shutil.copytree(
-            src = src_path,
-            dst = dst_path,
-            ignore = self.filter_paths,
-        )
-        del(self.src_path)
-        del(self.allowed)
-
-        # Update and save configuration
-        instance = Box(name = self._name)
-        conf.instances.append(instance)
-        conf.save()
+        return TemplateCache(src_path, allowed).clone(dst_path, link = link)
 
 
     def remove(
         self,
-    ) -> None:
+        state_manager : InstanceStateManager = None,
+    ) -> OperationResult:
         """
         Removes a managed instance.
 
-        ### Returns
-        - Nothing.
-        """
-        # Load configuration
-        conf = config.Config.load()
+        ### Arguments
+        - state_manager : InstanceStateManager
+            - Instance state manager to determine whether or not the instance is running with; loaded when not
+              provided.
 
-        # Validate instance exists
-        if not self.exists(conf):
-            raise NameError(self._name, f"Instance {self._name} does not exist")
-        
-        # Determine current instance state
-        state_manager = InstanceStateManager.load(conf)
-        instance_state : InstanceState
-        if state_manager.is_running(self._name):
-            # Instance is running, nothing more to do
-            instance_state = state_manager.state_for(self._name)
-            print(f"Instance {self._name} is running, please stop the instance first")
-            return
+        ### Returns
+        - Outcome of the operation.
 
-        # Remove instance from file system
+        ### Raises
+        - NameError
+            - If the instance does not exist.
+        """
+        with config.Config.transaction() as conf:
+            # Validate instance exists
+            if not self.exists(conf):
+                raise NameError(self._name, f"Instance {self._name} does not exist")
+
+            # Determine current instance state
+            if state_manager is None:
+                state_manager = InstanceStateManager.load(conf)
+            instance_state : InstanceState
+            if state_manager.is_running(self._name):
+                # Instance is running, nothing more to do
+                instance_state = state_manager.state_for(self._name)
+                self._progress(f"Instance {self._name} is running, please stop the instance first")
+                return OperationResult(
+                    self._name, "remove", success = False, pid = instance_state.pid, message = "Running, stop it first")
+
+            # Update configuration, saved when the transaction completes
+            conf.remove_instance(self._name)
+
+        # Remove instance from file system only once the configuration no longer refers to it
         shutil.rmtree(path = f"{conf.paths.instances}/{self._name}")
+        self._progress(f"Removed instance {self._name}")
 
-        # Update and save configuration
-        for i, x in enumerate(conf.instances):
-            if x.name == self._name:
-                del conf.instances[i]
-        conf.save()
+        return OperationResult(self._name, "remove", message = "Removed")
 
 
     @staticmethod
-    def list() -> None:
+    def list(
+            output : util.OutputFormat = util.OutputFormat.TABLE,
+    ) -> None:
         """
-        Lists known managed instances.
+        Lists known managed instances together with the live resource metrics of the running ones, see
+        `ProcessMetrics`.
+
+        ### Arguments
+        - output : util.OutputFormat
+            - Output format, every managed instance is written as soon as it is known with the streaming formats.
 
         ### Returns
         - Nothing.
@@ -140,77 +196,134 @@ class InstanceImpl(Command):
         conf = config.Config.load()
         state_manager = InstanceStateManager.load(conf)
 
-        # Gather instances information
-        result = []
-        for instance in conf.instances:
-            state = state_manager.state_for(instance.name)
-            instance_info = Box(name = instance.name, status = "Not Running")
-            instance_info.setdefault("pid", "n/a")
-            if state is not None:
-                instance_info.status = "Running"
-                instance_info.pid = state.pid
-            result.append(instance_info.to_dict())
-
         # Output information in desired format
-        format = util.OutputFormat.TABLE
-        if format == util.OutputFormat.JSON:
-            rprint(json.dumps(result, indent = 4, sort_keys = True))
-        elif format == util.OutputFormat.YAML:
-            rprint(yaml.dump(result, indent = 4, sort_keys = True))
-        elif format == util.OutputFormat.TABLE:
-            console = Console()
-            table = Table(show_lines = True)
-            table.add_column("Name", style = "green")
-            table.add_column("PID", style = "gray93")
-            table.add_column("Status", style = "yellow")
-            for instance in result:
-                instance = Box(instance)
-                row = [ instance.name, str(instance.pid), instance.status ]
-                table.add_row(instance.name, str(instance.pid), instance.status)
-            console.print(table)
-        elif format == util.OutputFormat.TEXT:
-            for instance in result:
-                instance = Box(instance)
-                print(f"Name: {instance.name}")
-                print(f"PID: {instance.pid}")
-                print(f"Status: {instance.status}")
-                print()
-        else:
-            raise ValueError("Unknown output format")
+        with util.OutputWriter(output, InstanceStatus.COLUMNS) as writer:
+            for status in InstanceImpl.statuses(conf.instance_names(), conf, state_manager):
+                writer.write(status.to_dict())
+
+
+    @staticmethod
+    def statuses(
+            names : list,
+            conf : config.Config,
+            state_manager : InstanceStateManager,
+    ):
+        """
+        Determines the status of many managed instances at once together with the live resource metrics of the running
+        ones. Every recorded process is verified at once and the metrics of all of them are gathered over a single
+        shared interval, see `ProcessMetrics.iterate()`. Every status is provided as soon as it is known so that it can
+        be written right away. The instance states are left untouched.
+
+        ### Arguments
+        - names : list[str]
+            - Managed instance names.
+        - conf : config.Config
+            - Configuration file instance which serves as the source of truth for all managed instances.
+        - state_manager : InstanceStateManager
+            - Instance state manager holding the recorded processes.
+
+        ### Returns
+        - Generator of `InstanceStatus`, one per managed instance in the order of `names`.
+        """
+        known = [ x for x in names if conf.instance(x) is not None ]
+        running = state_manager.reconcile(known)
+        metrics = ProcessMetrics([ running[x].pid for x in known if x in running ]).iterate()
+
+        for name in names:
+            if conf.instance(name) is None:
+                yield InstanceStatus(name, "Unknown")
+            elif name in running:
+                pid, sample = next(metrics)
+                yield InstanceStatus(name, "Running", pid = pid, metrics = sample)
+            else:
+                yield InstanceStatus(name, "Not Running")
+
+
+    @staticmethod
+    def migrate() -> dict:
+        """
+        Migrates the configuration and the instance states to the sharded layout, see `config.Config.is_sharded()`.
+        No other operation should be performed while migrating.
+
+        ### Returns
+        - Number of migrated managed instances and instance states.
+        """
+        # Load configuration
+        conf = config.Config.load()
+        if conf.is_sharded():
+            print("Configuration is sharded already")
+            return { "instances": 0, "states": 0 }
+
+        # Instance states are located using the configuration layout, the monolithic ones are kept until it switched
+        with InstanceStateManager.migrate(conf) as states:
+            instances = config.Config.migrate()
+
+        print(f"Migrated {instances} instance(s) to {config.Config.conf_dir()} and {states} instance state(s) to {conf.paths.run}")
+
+        return { "instances": instances, "states": states }
+
 
     def start(
             self,
             background: bool = False,
-    ) -> None:
+            conf : config.Config = None,
+            state_manager : InstanceStateManager = None,
+            wait_ready : bool = False,
+            ready_timeout : float = ReadinessWatcher.DEFAULT_TIMEOUT,
+            watcher : ReadinessWatcher = None,
+            loop = None,
+    ) -> OperationResult:
         """
         Starts this managed instance.
 
         ### Arguments
         - background :  bool
             - Whether or not to start the instance in the background and detached from the TTY.
+        - conf : config.Config
+            - Configuration to use; loaded when not provided.
+        - state_manager : InstanceStateManager
+            - Instance state manager to record the instance state with. When provided the caller is responsible for
+              saving it, otherwise it is loaded and saved by this method.
+        - wait_ready : bool
+            - Whether or not to wait, when started in the background, until the instance logged that its boot
+              completed, see `ReadinessWatcher`. The outcome is then only successful if it booted successfully.
+        - ready_timeout : float
+            - Maximum time, in seconds, to wait for the instance to boot.
+        - watcher : ReadinessWatcher
+            - Readiness watcher shared with other managed instances to register the instance with instead. The caller
+              is then responsible for waiting upon it, see `ready()`.
+        - loop : asyncio.AbstractEventLoop
+            - Event loop to reap `standalone.sh` with once it exits, see `ProcessEngine.spawn()`.
 
         ### Returns
-        - Nothing.
+        - Outcome of the operation.
 
         ### Raises
         - NameError
             - If the instance does not exist.
+        - WrapperExitError
+            - If `standalone.sh` exits before launching the JVM.
+        - TimeoutError
+            - If `standalone.sh` does not launch the JVM within `ChildDiscovery.DEFAULT_TIMEOUT`.
         """
         # Load configuration
-        conf = config.Config.load()
+        if conf is None:
+            conf = config.Config.load()
 
         # Validate instance exists
         if not self.exists(conf):
             raise NameError(self._name, f"Instance {self._name} does not exist")
         
         # Determine current instance state
-        state_manager = InstanceStateManager.load(conf)
+        save_state = state_manager is None
+        if save_state:
+            state_manager = InstanceStateManager.load(conf)
         instance_state : InstanceState
         if state_manager.is_running(self._name):
             # Instance is running, nothing more to do
             instance_state = state_manager.state_for(self._name)
-            print(f"Instance {self._name} is already running and has PID {instance_state.pid}")
-            return
+            self._progress(f"Instance {self._name} is already running and has PID {instance_state.pid}")
+            return OperationResult(self._name, "start", pid = instance_state.pid, message = "Already running")
         
         # Compose JBoss properties
         self._jboss_properties = self.composeJBossProperties(conf = conf)
@@ -220,214 +333,457 @@ class InstanceImpl(Command):
         java_opts : str = ""
         for k, v in self._jvm_options.items():
             java_opts = java_opts + f"{k}{v} "
-        os.environ["JAVA_OPTS"] = java_opts.strip()
+        env = dict(os.environ, JAVA_OPTS = java_opts.strip())
 
         # Compose command to execute
         command = f"{conf.paths.jboss}/bin/standalone.sh"
         args = []
         args = args + self._jboss_properties.compose_as_list(util.Properties.ComposeForm.CLI)
 
-        # Execute command
-        print(f"Starting instance {self._name}")
-        pid_or_exit_status = self.execute(command = command, args = args, debug = False, background = background)
-        if background:
-            # Obtain PID of JVM which is a child process of the executed command, but we must wait for it to be created
-            # so we have to poll.
-            proc = psutil.Process(pid_or_exit_status)
-            while len(proc.children()) == 0:
-                time.sleep(1)
+        # Follow the server log from right before launching so that nothing logged by this boot is missed
+        owned = background and wait_ready and watcher is None
+        if owned:
+            watcher = ReadinessWatcher(timeout = ready_timeout)
+        if background and watcher is not None:
+            log_dir = self._jboss_properties.get("jboss.server.log.dir", f"{conf.paths.instances}/{self._name}/log")
+            watcher.watch(self._name, log_dir)
 
-            instance_state = Box(name = self._name, pid = proc.children()[0].pid)
-            state_manager.update(instance_state)
+        try:
+            # Execute command
+            self._progress(f"Starting instance {self._name}")
+            pid_or_exit_status = self.execute(
+                command = command, args = args, debug = False, background = background, env = env, loop = loop,
+                hold = background)
+            if not background:
+                return OperationResult(
+                    self._name, "start",
+                    success = pid_or_exit_status == 0,
+                    message = f"Exited with status {pid_or_exit_status}",
+                )
+
+            # Obtain PID of JVM which is a child process of the executed command, but we must wait for it to be created
+            # The wrapper is only reaped by the event loop once discovered, so that its exit status is not lost
+            try:
+                proc = ChildDiscovery(pid_or_exit_status, reap = Command.engine.release).wait()
+            finally:
+                Command.engine.release(pid_or_exit_status)
+        except BaseException:
+            if background and watcher is not None:
+                watcher.forget(self._name)
+                if owned:
+                    watcher.close()
+            raise
+
+        # The identity of the JVM tells it apart from any later process reusing its PID
+        instance_state = Box(name = self._name, pid = proc.pid, **ProcessIdentity.of(proc.pid))
+        state_manager.update(instance_state)
+        if save_state:
             state_manager.save(conf)
 
+        result = OperationResult(self._name, "start", pid = instance_state.pid, message = "Started")
+        if watcher is not None:
+            watcher.attach(self._name, proc.pid)
+        if owned:
+            result = InstanceImpl.ready(result, watcher.wait()[self._name], progress = self._report)
+
+        return result
+
+
+    @staticmethod
+    def ready(
+            result : OperationResult,
+            readiness : Readiness,
+            progress = print,
+    ) -> OperationResult:
+        """
+        Completes the outcome of starting a managed instance with the outcome of its boot.
+
+        ### Arguments
+        - result : OperationResult
+            - Outcome of starting the managed instance.
+        - readiness : Readiness
+            - Outcome of its boot, see `ReadinessWatcher.wait()`.
+        - progress : callable
+            - Callable accepting a message reporting the outcome, `None` to refrain from reporting it.
+
+        ### Returns
+        - `result`, which is only successful if the managed instance booted successfully.
+        """
+        # Time to ready is measured from right before launching, i.e. it covers the launch itself
+        result.elapsed = max(result.elapsed, readiness.elapsed)
+        if readiness.ready:
+            result.message = f"Ready in {readiness.elapsed:.2f} s"
+            if progress is not None:
+                progress(f"Instance {result.name} is ready after {readiness.elapsed:.2f} s")
+        else:
+            result.success = False
+            result.message = f"Not ready after {readiness.elapsed:.2f} s: {readiness.message}"
+            if progress is not None:
+                progress(f"Instance {result.name} is not ready after {readiness.elapsed:.2f} s: {readiness.message}")
+
+        return result
+
 
     def stop(
             self,
-    ) -> None:
+            conf : config.Config = None,
+            state_manager : InstanceStateManager = None,
+    ) -> OperationResult:
         """
         Stops this managed instance. First the instance is requested to gracefully termimate and then after
-        `TERMINATE_WAIT_TIME` forcefully terminates it.
+        `TERMINATE_WAIT_TIME` forcefully terminates it. See `stop_many()`.
+
+        ### Arguments
+        - conf : config.Config
+            - Configuration to use; loaded when not provided.
+        - state_manager : InstanceStateManager
+            - Instance state manager to record the instance state with. When provided the caller is responsible for
+              saving it, otherwise it is loaded and saved by this method.
 
         ### Returns
-        - Nothing.
+        - Outcome of the operation.
 
         ### Raises
         - NameError
             - If the instance does not exist.
         """
         # Load configuration
-        conf = config.Config.load()
+        if conf is None:
+            conf = config.Config.load()
 
         # Validate instance exists
         if not self.exists(conf):
             raise NameError(self._name, f"Instance {self._name} does not exist")
         
         # Determine current instance state
-        state_manager = InstanceStateManager.load(conf)
-        instance_state : InstanceState = None
-        proc : psutil.Process = state_manager.is_running(self._name)
-        if proc:
-            # Instance is running, ensure that it a JBoss JVM process
-            instance_state = state_manager.state_for(self._name)
-            print(f"Stopping instance {self._name} with PID {instance_state.pid}")
-            if proc.name() == "java" and len(proc.cmdline()) > 1 and proc.cmdline()[1] == "-D[Standalone]":
-                # Gracefully stop and wait for 10 seconds and then forcefully terminate
-                proc.terminate()
+        save_state = state_manager is None
+        if save_state:
+            state_manager = InstanceStateManager.load(conf)
+        result = InstanceImpl.stop_many([ self._name ], conf, state_manager, progress = self._report)[0]
+
+        if save_state:
+            state_manager.save(conf)
+
+        return result
+
+
+    @staticmethod
+    def stop_many(
+            names : list,
+            conf : config.Config,
+            state_manager : InstanceStateManager,
+            timeout : float = TERMINATE_WAIT_TIME,
+            progress = print,
+    ) -> list:
+        """
+        Stops many managed instances at once. Every instance is requested to gracefully terminate at the same time,
+        they are then waited upon together and only those still running once `timeout` elapsed are forcefully
+        terminated. Stopping any number of instances therefore takes at most `timeout` seconds.
+
+        The instance states are removed but not saved, the caller is responsible for saving them.
+
+        ### Arguments
+        - names : list[str]
+            - Managed instance names.
+        - conf : config.Config
+            - Configuration file instance which serves as the source of truth for all managed instances.
+        - state_manager : InstanceStateManager
+            - Instance state manager to remove the instance states from.
+        - timeout : float
+            - Time, in seconds, shared by all instances to gracefully terminate.
+        - progress : callable
+            - Callable accepting a progress message, `None` to refrain from reporting progress.
+
+        ### Returns
+        - List of `OperationResult`, one per managed instance in the order of `names`.
+        """
+        results = dict()
+        procs = dict()
+
+        running = state_manager.reconcile([ x for x in names if InstanceImpl(x).exists(conf) ])
+        for name in names:
+            if not InstanceImpl(name).exists(conf):
+                if progress is not None:
+                    progress(f"Instance {name} does not exist")
+                results[name] = OperationResult(name, "stop", success = False, message = f"Instance {name} does not exist")
+                continue
+
+            # Determine current instance state
+            proc : psutil.Process = None
+            if name in running:
                 try:
-                    proc.wait(self.TERMINATE_WAIT_TIME)
+                    proc = psutil.Process(running[name].pid)
                 except psutil.NoSuchProcess:
                     pass
-                except psutil.TimeoutExpired:
-                    proc.kill()
-        else:
-            # Instance is not running
-            print(f"Instance {self._name} is not running")
-            instance_state = Box(name = self._name)
-
-        # Remove instance state
-        state_manager.remove(instance_state)
-        state_manager.save(conf)
+            if proc:
+                # Instance is running, ensure that it a JBoss JVM process
+                if progress is not None:
+                    progress(f"Stopping instance {name} with PID {proc.pid}")
+                if is_standalone_jvm(proc):
+                    procs[name] = proc
+                    results[name] = OperationResult(name, "stop", message = "Stopped")
+                else:
+                    results[name] = OperationResult(name, "stop", message = f"PID {proc.pid} is not a JBoss JVM")
+            else:
+                # Instance is not running
+                if progress is not None:
+                    progress(f"Instance {name} is not running")
+                results[name] = OperationResult(name, "stop", message = "Not running")
+
+            # Remove instance state
+            state_manager.remove(Box(name = name))
+
+        # Gracefully stop all at once and forcefully terminate the stragglers
+        killed = terminate(list(procs.values()), timeout)
+        for name, proc in procs.items():
+            if proc in killed:
+                results[name].message = "Killed"
+
+        return [ results[x] for x in names ]
 
 
     def restart(
             self,
-    ) -> None:
+            conf : config.Config = None,
+            state_manager : InstanceStateManager = None,
+            wait_ready : bool = False,
+            ready_timeout : float = ReadinessWatcher.DEFAULT_TIMEOUT,
+            loop = None,
+    ) -> OperationResult:
         """
         Restarts this  managed instance using the semantics described by `stop()` and `start()`.
 
+        ### Arguments
+        - conf : config.Config
+            - Configuration to use; loaded when not provided.
+        - state_manager : InstanceStateManager
+            - Instance state manager to record the instance state with. When provided the caller is responsible for
+              saving it, otherwise it is loaded and saved by this method.
+        - wait_ready : bool
+            - Whether or not to wait until the instance logged that its boot completed, see `start()`.
+        - ready_timeout : float
+            - Maximum time, in seconds, to wait for the instance to boot.
+        - loop : asyncio.AbstractEventLoop
+            - Event loop to reap `standalone.sh` with once it exits, see `start()`.
+
         ### Returns
-        - Nothing.
+        - Outcome of the operation.
 
         ### Raises
         - NameError
             - If the instance does not exist.
         """
-        # Load configuration
-        conf = config.Config.load()
+        # Load configuration and instance states once for both operations
+        if conf is None:
+            conf = config.Config.load()
+        save_state = state_manager is None
+        if save_state:
+            state_manager = InstanceStateManager.load(conf)
+
+        self.stop(conf = conf, state_manager = state_manager)
+        try:
+            result = self.start(
+                background = True, conf = conf, state_manager = state_manager,
+                wait_ready = wait_ready, ready_timeout = ready_timeout, loop = loop)
+        finally:
+            # The instance is stopped even if starting it fails
+            if save_state:
+                state_manager.save(conf)
+        result.action = "restart"
 
-        self.stop()
-        self.start(background = True)
+        return result
 
 
     def status(
             self,
-    ) -> None:
+            conf : config.Config = None,
+            state_manager : InstanceStateManager = None,
+    ) -> OperationResult:
         """
-        Displays the current state of this managed instance.
+        Displays the current state of this managed instance. The instance state of a managed instance that is not
+        running is removed.
+
+        ### Arguments
+        - conf : config.Config
+            - Configuration to use; loaded when not provided.
+        - state_manager : InstanceStateManager
+            - Instance state manager to determine the instance state with. When provided the caller is responsible for
+              saving it, otherwise it is loaded and saved by this method.
 
         ### Returns
-        - Nothing.
+        - Outcome of the operation, successful if the managed instance is running.
 
         ### Raises
         - NameError
             - If the instance does not exist.
         """
         # Load configuration
-        conf = config.Config.load()
+        if conf is None:
+            conf = config.Config.load()
 
         # Validate instance exists
         if not self.exists(conf):
             raise NameError(self._name, f"Instance {self._name} does not exist")
         
         # Determine current instance state
-        state_manager = InstanceStateManager.load(conf)
+        save_state = state_manager is None
+        if save_state:
+            state_manager = InstanceStateManager.load(conf)
         instance_state : InstanceState
         if state_manager.is_running(self._name):
             # Instance is running
             instance_state = state_manager.state_for(self._name)
-            print(f"Instance {self._name} is running and has PID {instance_state.pid}")
+            self._progress(f"Instance {self._name} is running and has PID {instance_state.pid}")
+            return OperationResult(self._name, "status", pid = instance_state.pid, message = "Running")
         else:
             # Instance is not running, remove state
-            print(f"Instance {self._name} is not running")
+            self._progress(f"Instance {self._name} is not running")
             instance_state = Box(name = self._name)
             state_manager.remove(instance_state)
-            state_manager.save(conf)
-        
+            if save_state:
+                state_manager.save(conf)
+            return OperationResult(self._name, "status", success = False, message = "Not running")
+
 
     def kill(
             self,
-    ) -> None:
+            conf : config.Config = None,
+            state_manager : InstanceStateManager = None,
+    ) -> OperationResult:
         """
         Forcefully stops this managed instance.
 
+        ### Arguments
+        - conf : config.Config
+            - Configuration to use; loaded when not provided.
+        - state_manager : InstanceStateManager
+            - Instance state manager to remove the instance state from. When provided the caller is responsible for
+              saving it, otherwise it is loaded and saved by this method.
+
         ### Returns
-        - Nothing.
+        - Outcome of the operation.
 
         ### Raises
         - NameError
             - If the instance does not exist.
         """
         # Load configuration
-        conf = config.Config.load()
+        if conf is None:
+            conf = config.Config.load()
 
         # Validate instance exists
         if not self.exists(conf):
             raise NameError(self._name, f"Instance {self._name} does not exist")
         
         # Determine current instance state
-        state_manager = InstanceStateManager.load(conf)
+        save_state = state_manager is None
+        if save_state:
+            state_manager = InstanceStateManager.load(conf)
         instance_state : InstanceState = None
         proc : psutil.Process = state_manager.is_running(self._name)
         if proc:
             # Instance is running, ensure that it a JBoss JVM process
             instance_state = state_manager.state_for(self._name)
-            print(f"Stopping instance {self._name} with PID {instance_state.pid}")
-            if proc.name() == "java" and len(proc.cmdline()) > 1 and proc.cmdline()[1] == "-D[Standalone]":
+            self._progress(f"Stopping instance {self._name} with PID {instance_state.pid}")
+            if is_standalone_jvm(proc):
                 # Forcefully terminate
                 proc.kill()
         else:
             # Instance is not running
-            print(f"Instance {self._name} is not running")
+            self._progress(f"Instance {self._name} is not running")
             instance_state = Box(name = self._name)
 
         # Remove instance state
         state_manager.remove(instance_state)
-        state_manager.save(conf)
+        if save_state:
+            state_manager.save(conf)
+
+        return OperationResult(self._name, "kill", message = "Killed" if proc else "Not running")
 
 
-    # TODO Handle 3 cases: 1) interactive; 2) non-interactive command execution; 3) non-interactive file execution
     def cli(
             self,
-            command: str,
-            file: str,
-    ) -> None:
+            commands : list = None,
+            file : str = None,
+            timeout : float = CliSession.DEFAULT_TIMEOUT,
+            conf : config.Config = None,
+            pool : CliSessionPool = None,
+            echo : bool = True,
+    ) -> OperationResult:
         """
-        Executes the JBoss CLI against this managed instance. Ixf both are specified then `command` is performed first
-        and then the CLI commands contained in `file` are processed. If neither is provided then an interactive
+        Executes the JBoss CLI against this managed instance. If both are specified then `commands` are performed
+        first and then the CLI commands contained in `file` are processed. If neither is provided then an interactive
         session is created.
 
+        Commands are performed by a pooled `CliSession` of the daemon when it is running, so that the CLI is only
+        launched and connected once and kept for further commands, see `CliSessionPool`. Otherwise they are performed
+        by a session of `pool`, or of this process which is ended afterwards.
+
         ### Arguments
-        - command : str
-            - CLI command to execute.
+        - commands : list[str]
+            - CLI commands to execute.
         - file : str
             - File containing CLI commands to execute.
+        - timeout : float
+            - Maximum time, in seconds, the commands may take.
+        - conf : config.Config
+            - Configuration to use; loaded when not provided.
+        - pool : CliSessionPool
+            - Session pool to use when the daemon is not running, the caller is responsible for closing it.
+        - echo : bool
+            - Whether or not to print the output of the commands as well as capturing it in the outcome.
 
         ### Returns
-        - Nothing.
+        - Outcome of the operation, successful if every command succeeded.
 
         ### Raises
         - NameError
             - If the instance does not exist.
         """
         # Load configuration
-        conf = config.Config.load()
+        if conf is None:
+            conf = config.Config.load()
 
         # Validate instance exists
         if not self.exists(conf):
             raise NameError(self._name, f"Instance {self._name} does not exist")
 
-        # Compose JBoss properties
-        self._jboss_properties = self.composeJBossProperties(conf = conf)
-
         # Compose command to execute
-        command = f"{conf.paths.jboss}/bin/jboss-cli.sh"
-        args = []
-        args = args + self._jboss_properties.compose_as_list(util.Properties.ComposeForm.CLI)
-
-        # Execute command
-        print(f"Start CLI instance {self._name}")
-        pid_or_exit_status = self.execute(command = command, args = args, debug = False, background = False)
+        args = self.composeCliCommand(conf = conf)
+
+        if not commands and file is None:
+            # Execute command
+            self._progress(f"Start CLI instance {self._name}")
+            pid_or_exit_status = self.execute(command = args[0], args = args[1:], debug = False, background = False)
+
+            return OperationResult(
+                self._name, "cli", success = pid_or_exit_status == 0, message = f"Exited with status {pid_or_exit_status}")
+
+        commands = list(commands or [])
+        if file is not None:
+            with open(file, "r") as f:
+                commands.append(f.read())
+        units = CliSession.group(commands)
+
+        results = daemon.impl.DaemonClient().cli(self._name, units, timeout)
+        if results is None:
+            with contextlib.nullcontext(pool) if pool is not None else CliSessionPool() as sessions:
+                results = sessions.session(self._name, args).run(units, timeout)
+
+        output = []
+        for result in results:
+            if result.output:
+                output.append(result.output)
+            if not result.success:
+                output.append(f"Command failed: {result.command}")
+        output = "\n".join(output)
+        if echo and output:
+            print(output)
+
+        succeeded = sum(1 for x in results if x.success)
+        return OperationResult(
+            self._name, "cli", success = succeeded == len(units),
+            message = f"{succeeded} of {len(units)} command(s) succeeded", output = output)
 
 
     def exists(
@@ -444,8 +800,21 @@ class InstanceImpl(Command):
         ### Returns
         - True if the managed instance exists, False otherwise.
         """
-        instance = next((x for x in conf.instances if x.name == self._name), None)
-        return instance and os.path.isdir(f"{conf.paths.instances}/{self._name}")
+        return conf.instance(self._name) is not None and os.path.isdir(f"{conf.paths.instances}/{self._name}")
+
+
+    def _progress(
+            self,
+            message : str,
+    ) -> None:
+        """
+        Reports a progress message unless this managed instance is quiet.
+
+        ### Returns
+        - Nothing.
+        """
+        if self._report is not None:
+            self._report(message)
     
 
     def composeJBossProperties(
@@ -483,7 +852,7 @@ class InstanceImpl(Command):
            pass
        
        # Add instance JVM properties from configuration
-       instance = next((x for x in conf.instances if x.name == self._name), None)
+       instance = conf.instance(self._name)
        try:
            for k, v in instance.java.properties.items():
                result.add(k, v)
@@ -493,6 +862,33 @@ class InstanceImpl(Command):
        return result
     
 
+    def composeCliCommand(
+            self,
+            conf : config.Config,
+    ) -> list:
+        """
+        Composes the command line of the JBoss CLI connected to the management interface of this managed instance,
+        whose address and port are those of the defaults unless overridden by its properties.
+
+        ### Arguments
+        - conf : config.Config
+             - Configuration file instance which serves as the source of truth for all managed instances.
+
+        ### Returns
+        - Command line, starting with the path to `jboss-cli.sh`.
+        """
+        properties = self.composeJBossProperties(conf = conf)
+
+        address = properties.get("jboss.bind.address.management", "localhost")
+        if address in ("0.0.0.0", "::"):
+            address = "localhost"
+        port = int(properties.get("jboss.management.http.port", 9990))
+        port = port + int(properties.get("jboss.socket.binding.port-offset", 0))
+
+        return [ f"{conf.paths.jboss}/bin/jboss-cli.sh", "--connect", f"--controller={address}:{port}" ] + \
+            properties.compose_as_list(util.Properties.ComposeForm.CLI)
+
+
     def composeJvmOptions(
             self,
             conf : config.Config,
@@ -518,7 +914,7 @@ class InstanceImpl(Command):
             pass
 
         # Instance options
-        instance = next((x for x in conf.instances if x.name == self._name), None)
+        instance = conf.instance(self._name)
         try:
             for k, v in instance.jvm.options.items():
                 result[k] = v
@@ -526,42 +922,3 @@ class InstanceImpl(Command):
             pass
 
         return result
-
-
-    def filter_paths(
-            self,
-            dir : str,
-            dir_contents : list,
-    ) -> list:
-        """
-        Filters a directory contents based on a set of patterns. This must be used specifically with
-        `shutil.copytree()`.
-
-        This requires that the following attributes are present in the object instance:
-        - src_path : str
-            - Top-level directory that is being recursively filtered.
-        - allowed : list[str]
-            - List of glob patterns, relative to `src_path`, to allow; e.g., not exclude from `shutil.copytree()`.
-
-        ### Arguments
-        - dir : str
-            - Directory path to filter.
-        - dir_contents : list[str]
-            - Directory contents (just the base names).
-
-        ### Returns
-        - List of base names to be ignored / excluded where each item is a string.
-        """
-        result = []
-
-        paths = [ f"{dir}/" + s for s in dir_contents ]
-        paths = [ s.removeprefix(f"{self.src_path}/") for s in paths ]
-        allowed = []
-        for pattern in self.allowed:
-            matches = fnmatch.filter(names = paths, pat = pattern)
-            if matches:
-                allowed = allowed + matches
-        ignored = list(set(paths) - set(allowed))
-        result = [ s.removeprefix(f"{os.path.dirname(s)}/") for s in ignored ]
-
-        return result
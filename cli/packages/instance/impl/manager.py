@@ -0,0 +1,690 @@
+import concurrent.futures
+import fnmatch
+import shutil
+import threading
+import time
+
+from .cli import CliSession, CliSessionPool
+from .main import InstanceImpl
+from .readiness import ReadinessWatcher
+from .result import InstanceStatus, OperationResult
+from .state import InstanceStateManager
+import config
+
+
+class InstanceManager:
+    """
+    Asynchronous API performing lifecycle operations against managed instances, for embedding in orchestration code:
+
+        manager = InstanceManager()
+        await manager.add([ Box(name = "web-3") ])
+        results = await manager.start(manager.names("web-*"), wait_ready = True)
+        statuses = await manager.status_all()
+
+    - The configuration and the instance states are loaded once, when the manager is created, and shared by every
+      operation, see `refresh()`. Every operation saves the instance states it changed once it completed.
+
+    - Operations are coroutines and any number of them may be awaited concurrently on the same event loop. Within an
+      operation the managed instances are operated on concurrently, the blocking parts, e.g. discovering the launched
+      JVM, being performed on a bounded pool of worker threads.
+
+    - Outcomes are typed, `OperationResult` for lifecycle operations and `InstanceStatus` for statuses. Nothing is
+      printed unless asked for and failures, including managed instances that do not exist, are unsuccessful outcomes
+      rather than exceptions. An optional listener is notified on the event loop of every outcome as soon as its
+      operation completes.
+
+    `asyncio` is only imported by the operations, it is costly to import for short lived processes.
+    """
+    conf : config.Config
+    state_manager : InstanceStateManager
+    _parallel : int
+    _listener : object
+    _progress : object
+    _lock : threading.Lock
+
+    DEFAULT_PARALLELISM = 8
+
+    def __init__(
+            self,
+            conf : config.Config = None,
+            state_manager : InstanceStateManager = None,
+            parallel : int = DEFAULT_PARALLELISM,
+            listener = None,
+            quiet : bool = True,
+    ):
+        """
+        Creates an instance.
+
+        ### Arguments
+        - conf : config.Config
+            - Configuration to share; loaded when not provided.
+        - state_manager : InstanceStateManager
+            - Instance state manager to share; loaded when not provided.
+        - parallel : int
+            - Maximum number of managed instances an operation works on concurrently.
+        - listener : callable
+            - Callable accepting an `OperationResult`, called on the event loop as soon as every operation completes.
+        - quiet : bool
+            - Whether or not to refrain from printing progress messages. They are printed one at a time, never
+              interleaved with each other nor with the notifications of the listener.
+        """
+        self.conf = conf if conf is not None else config.Config.load()
+        self.state_manager = state_manager if state_manager is not None else InstanceStateManager.load(self.conf)
+        self._parallel = max(1, parallel)
+        self._listener = listener
+        self._progress = None if quiet else self._print
+        self._lock = threading.Lock()
+
+
+    def refresh(
+            self,
+    ) -> None:
+        """
+        Loads the configuration and the instance states again, e.g. once managed instances were added or removed by
+        other means. Must not be called while operations are in progress.
+
+        ### Returns
+        - Nothing.
+        """
+        self.conf = config.Config.load()
+        self.state_manager = InstanceStateManager.load(self.conf)
+
+
+    def names(
+            self,
+            pattern : str = None,
+    ) -> list:
+        """
+        Returns the names of the managed instances.
+
+        ### Arguments
+        - pattern : str
+            - Glob pattern the names must match, all of them when not provided.
+
+        ### Returns
+        - List of managed instance names, in configuration order.
+        """
+        names = self.conf.instance_names()
+        return fnmatch.filter(names, pattern) if pattern else names
+
+
+    async def add(
+            self,
+            instances : list,
+            link : bool = False,
+    ) -> list:
+        """
+        Adds many managed instances at once within a single configuration transaction. Their directories are
+        provisioned concurrently and the configuration is then saved once with every managed instance whose directory
+        was provisioned. Managed instances that already exist or appear more than once are rejected, and should anything
+        fail before the configuration is saved then every directory provisioned by the operation is removed again.
+
+        The configuration of this manager is loaded again once the managed instances were added.
+
+        ### Arguments
+        - instances : list[Box]
+            - Managed instance configurations, see `InstanceBatch.load_manifest()`.
+        - link : bool
+            - Whether or not to hard link the assets rather than copying them when possible.
+
+        ### Returns
+        - List of `OperationResult`, one per managed instance in the order of `instances`.
+        """
+        import asyncio
+
+        # The transaction holds the configuration lock, it is not waited upon by the event loop
+        results = await self._run(self._add, instances, link, asyncio.get_running_loop())
+        self.conf = await self._run(config.Config.load)
+        for result in results:
+            self._notify(result)
+
+        return results
+
+
+    async def remove(
+            self,
+            names : list,
+    ) -> list:
+        """
+        Removes managed instances that are not running, see `InstanceImpl.remove()`. The configuration of this manager
+        is loaded again once they were removed.
+
+        ### Arguments
+        - names : list[str]
+            - Managed instance names.
+
+        ### Returns
+        - List of `OperationResult`, one per managed instance in the order of `names`.
+        """
+        results = await self._execute("remove", self._select(names), lambda target:
+            target.remove(state_manager = self.state_manager))
+        self.conf = await self._run(config.Config.load)
+
+        return results
+
+
+    async def start(
+            self,
+            names : list = None,
+            wait_ready : bool = False,
+            ready_timeout : float = ReadinessWatcher.DEFAULT_TIMEOUT,
+    ) -> list:
+        """
+        Starts managed instances in the background.
+
+        ### Arguments
+        - names : list[str]
+            - Managed instance names, all of them when not provided.
+        - wait_ready : bool
+            - Whether or not to wait until every started managed instance logged that its boot completed. All of them
+              are followed at once by a single `ReadinessWatcher`.
+        - ready_timeout : float
+            - Maximum time, in seconds, every managed instance is given to boot.
+
+        ### Returns
+        - List of `OperationResult`, one per managed instance in the order of `names`.
+        """
+        return await self._start("start", self._select(names), wait_ready, ready_timeout)
+
+
+    async def stop(
+            self,
+            names : list = None,
+            timeout : float = InstanceImpl.TERMINATE_WAIT_TIME,
+    ) -> list:
+        """
+        Stops managed instances within a single shared graceful shutdown window, see `InstanceImpl.stop_many()`.
+
+        ### Arguments
+        - names : list[str]
+            - Managed instance names, all of them when not provided.
+        - timeout : float
+            - Time, in seconds, shared by all managed instances to gracefully terminate.
+
+        ### Returns
+        - List of `OperationResult`, one per managed instance in the order of `names`.
+        """
+        names = self._select(names)
+
+        started = time.monotonic()
+        results = await self._stop(names, timeout)
+        for result in results:
+            result.elapsed = time.monotonic() - started
+            self._notify(result)
+
+        # Persist every state change of the operation at once
+        await self._run(self.state_manager.save, self.conf)
+
+        return results
+
+
+    async def kill(
+            self,
+            names : list = None,
+    ) -> list:
+        """
+        Forcefully stops managed instances, see `InstanceImpl.kill()`.
+
+        ### Arguments
+        - names : list[str]
+            - Managed instance names, all of them when not provided.
+
+        ### Returns
+        - List of `OperationResult`, one per managed instance in the order of `names`.
+        """
+        results = await self._execute("kill", self._select(names), lambda target:
+            target.kill(conf = self.conf, state_manager = self.state_manager))
+
+        # Persist every state change of the operation at once
+        await self._run(self.state_manager.save, self.conf)
+
+        return results
+
+
+    async def restart(
+            self,
+            names : list = None,
+            wait_ready : bool = False,
+            ready_timeout : float = ReadinessWatcher.DEFAULT_TIMEOUT,
+    ) -> list:
+        """
+        Restarts managed instances. All of them are first stopped within a single shared graceful shutdown window and
+        then started concurrently.
+
+        ### Arguments
+        - names : list[str]
+            - Managed instance names, all of them when not provided.
+        - wait_ready : bool
+            - Whether or not to wait until every restarted managed instance logged that its boot completed.
+        - ready_timeout : float
+            - Maximum time, in seconds, every managed instance is given to boot.
+
+        ### Returns
+        - List of `OperationResult`, one per managed instance in the order of `names`.
+        """
+        names = self._select(names)
+        stopped = { x.name: x for x in await self._stop(names, InstanceImpl.TERMINATE_WAIT_TIME) }
+
+        return await self._start("restart", names, wait_ready, ready_timeout, stopped)
+
+
+    async def rolling_restart(
+            self,
+            names : list = None,
+            max_unavailable : int = 1,
+            ready_timeout : float = ReadinessWatcher.DEFAULT_TIMEOUT,
+    ) -> list:
+        """
+        Restarts managed instances a few at a time so that the others keep serving. At most `max_unavailable` managed
+        instances are restarting at any time and the next one is only restarted once one of them logged that its boot
+        completed, see `ReadinessWatcher`. The rollout is aborted on the first failure: the restarts in progress
+        complete but no further managed instance is restarted.
+
+        Every instance state change is saved as soon as the managed instance is restarted.
+
+        ### Arguments
+        - names : list[str]
+            - Managed instance names, in the order to restart them, all of them when not provided.
+        - max_unavailable : int
+            - Maximum number of managed instances restarting at once.
+        - ready_timeout : float
+            - Maximum time, in seconds, every managed instance is given to boot.
+
+        ### Returns
+        - List of `OperationResult`, one per managed instance in the order of `names`; those not restarted because the
+          rollout was aborted are unsuccessful.
+        """
+        import asyncio
+
+        aborted = threading.Event()
+        loop = asyncio.get_running_loop()
+
+        def restart(target : InstanceImpl) -> OperationResult:
+            if aborted.is_set():
+                return OperationResult(target._name, "restart", success = False, message = "Skipped, rollout aborted")
+            try:
+                result = target.restart(
+                    conf = self.conf, state_manager = self.state_manager, wait_ready = True,
+                    ready_timeout = ready_timeout, loop = loop)
+                self.state_manager.save(self.conf)
+            except BaseException:
+                aborted.set()
+                raise
+            if not result.success:
+                aborted.set()
+            return result
+
+        # Workers take the managed instances in order, one becomes available whenever a restart completes
+        return await self._execute("restart", self._select(names), restart, parallel = max_unavailable)
+
+
+    async def check(
+            self,
+            names : list = None,
+    ) -> list:
+        """
+        Checks whether or not managed instances are running, see `InstanceImpl.status()`. Unlike `status_all()` the
+        instance states of the managed instances that are not running are removed.
+
+        ### Arguments
+        - names : list[str]
+            - Managed instance names, all of them when not provided.
+
+        ### Returns
+        - List of `OperationResult`, one per managed instance in the order of `names`, successful for the running ones.
+        """
+        results = await self._execute("status", self._select(names), lambda target:
+            target.status(conf = self.conf, state_manager = self.state_manager))
+
+        # Persist every state change of the operation at once
+        await self._run(self.state_manager.save, self.conf)
+
+        return results
+
+
+    async def status(
+            self,
+            name : str,
+    ) -> InstanceStatus:
+        """
+        Determines the status of a single managed instance, see `status_all()`.
+
+        ### Arguments
+        - name : str
+            - Managed instance name.
+
+        ### Returns
+        - Status of the managed instance.
+        """
+        return (await self.status_all([ name ]))[0]
+
+
+    async def status_all(
+            self,
+            names : list = None,
+    ) -> list:
+        """
+        Determines the status of managed instances together with the live resource metrics of the running ones, see
+        `InstanceImpl.statuses()`. The recorded processes are verified again, the instance states are left untouched.
+
+        ### Arguments
+        - names : list[str]
+            - Managed instance names, all of them when not provided.
+
+        ### Returns
+        - List of `InstanceStatus`, one per managed instance in the order of `names`.
+        """
+        names = self._select(names)
+        return await self._run(lambda: list(InstanceImpl.statuses(names, self.conf, self.state_manager)))
+
+
+    async def cli(
+            self,
+            names : list = None,
+            commands : list = None,
+            file : str = None,
+            timeout : float = CliSession.DEFAULT_TIMEOUT,
+    ) -> list:
+        """
+        Performs the same CLI commands against managed instances concurrently, see `InstanceImpl.cli()`. The output
+        of every managed instance is captured in its outcome rather than printed.
+
+        ### Arguments
+        - names : list[str]
+            - Managed instance names, all of them when not provided.
+        - commands : list[str]
+            - CLI commands to execute.
+        - file : str
+            - File containing CLI commands to execute after `commands`, read once for all managed instances.
+        - timeout : float
+            - Maximum time, in seconds, the commands may take per managed instance.
+
+        ### Returns
+        - List of `OperationResult`, one per managed instance in the order of `names`, with the captured output.
+        """
+        commands = list(commands or [])
+        if file is not None:
+            with open(file, "r") as f:
+                commands.append(f.read())
+
+        # Used only when the daemon, which keeps sessions of its own, is not running
+        with CliSessionPool() as pool:
+            return await self._execute("cli", self._select(names), lambda target:
+                target.cli(commands, timeout = timeout, conf = self.conf, pool = pool, echo = False))
+
+
+    def _select(
+            self,
+            names : list,
+    ) -> list:
+        """
+        Determines the managed instances an operation works on.
+
+        ### Returns
+        - List of managed instance names.
+        """
+        if names is None:
+            return self.conf.instance_names()
+        if isinstance(names, str):
+            return [ names ]
+        return list(names)
+
+
+    def _add(
+            self,
+            instances : list,
+            link : bool,
+            loop,
+    ) -> list:
+        """
+        Adds managed instances within a configuration transaction, on a worker thread, their directories being
+        provisioned by the workers of the event loop.
+
+        ### Returns
+        - List of `OperationResult`, one per managed instance in the order of `instances`.
+        """
+        import asyncio
+
+        results = []
+        provisioned = []
+        added = []
+        created = []
+        try:
+            with config.Config.transaction() as conf:
+                # Reject managed instances that cannot be added before provisioning anything
+                entries = dict()
+                for instance in instances:
+                    if instance.name in entries:
+                        results.append(OperationResult(
+                            instance.name, "add", success = False, message = "Listed more than once"))
+                    elif conf.instance(instance.name) is not None:
+                        results.append(OperationResult(instance.name, "add", success = False, message = "Already exists"))
+                    else:
+                        entries[instance.name] = instance
+                        results.append(None)
+                        continue
+                    if self._progress is not None:
+                        self._progress(f"Instance {instance.name} not added: {results[-1].message}")
+
+                def provision(target : InstanceImpl) -> OperationResult:
+                    stats = target.provision(conf, link = link)
+                    created.append(target._name)
+                    target._progress(f"Provisioned instance {target._name}: {stats}")
+                    return OperationResult(target._name, "add", message = f"Added, {stats}")
+
+                # The outcomes are only final once the configuration is saved
+                provisioned = asyncio.run_coroutine_threadsafe(
+                    self._execute("add", list(entries.keys()), provision, notify = False), loop).result()
+
+                # Every managed instance is saved at once when the transaction completes
+                added = [ x for x in provisioned if x.success ]
+                for result in added:
+                    conf.add_instance(entries[result.name])
+        except BaseException as e:
+            # Whatever failed, e.g. provisioning itself or saving the configuration, no directory is left behind
+            for name in created:
+                shutil.rmtree(f"{conf.paths.instances}/{name}", ignore_errors = True)
+            if not added or not isinstance(e, Exception):
+                raise
+            for result in added:
+                result.success = False
+                result.message = f"Rolled back, saving the configuration failed: {e}"
+                if self._progress is not None:
+                    self._progress(f"Instance {result.name} not added: {result.message}")
+
+        provisioned = iter(provisioned)
+        return [ x or next(provisioned) for x in results ]
+
+
+    async def _start(
+            self,
+            action : str,
+            names : list,
+            wait_ready : bool,
+            ready_timeout : float,
+            stopped : dict = None,
+    ) -> list:
+        """
+        Starts managed instances in the background, once stopped when restarting them.
+
+        ### Arguments
+        - action : str
+            - Name of the lifecycle operation.
+        - names : list[str]
+            - Managed instance names.
+        - wait_ready : bool
+            - Whether or not to wait until every started managed instance logged that its boot completed.
+        - ready_timeout : float
+            - Maximum time, in seconds, every managed instance is given to boot.
+        - stopped : dict
+            - Outcome of stopping every managed instance by name when restarting them, only those stopped successfully
+              are started.
+
+        ### Returns
+        - List of `OperationResult`, one per managed instance in the order of `names`.
+        """
+        import asyncio
+
+        watcher = ReadinessWatcher(timeout = ready_timeout) if wait_ready else None
+        # The launched wrappers are reaped by the event loop rather than the worker threads launching them
+        loop = asyncio.get_running_loop()
+
+        def start(target : InstanceImpl) -> OperationResult:
+            result = stopped[target._name] if stopped is not None else None
+            if result is None or result.success:
+                result = target.start(
+                    background = True, conf = self.conf, state_manager = self.state_manager, watcher = watcher,
+                    loop = loop)
+            result.action = action
+            return result
+
+        try:
+            results = await self._execute(action, names, start, notify = not wait_ready)
+
+            # Persist every state change of the operation at once
+            await self._run(self.state_manager.save, self.conf)
+        except BaseException:
+            if watcher is not None:
+                watcher.close()
+            raise
+
+        if wait_ready:
+            readiness = await self._run(watcher.wait)
+            for result in results:
+                if result.name in readiness:
+                    InstanceImpl.ready(result, readiness[result.name], progress = self._progress)
+                self._notify(result)
+
+        return results
+
+
+    async def _stop(
+            self,
+            names : list,
+            timeout : float,
+    ) -> list:
+        """
+        Stops managed instances within a single shared graceful shutdown window without saving the instance states.
+
+        ### Returns
+        - List of `OperationResult`, one per managed instance in the order of `names`.
+        """
+        return await self._run(InstanceImpl.stop_many, names, self.conf, self.state_manager, timeout, self._progress)
+
+
+    async def _execute(
+            self,
+            action : str,
+            names : list,
+            operation,
+            notify : bool = True,
+            parallel : int = None,
+    ) -> list:
+        """
+        Performs an operation against every managed instance using a bounded pool of worker threads.
+
+        ### Arguments
+        - action : str
+            - Name of the lifecycle operation.
+        - names : list[str]
+            - Managed instance names.
+        - operation : callable
+            - Callable accepting an `InstanceImpl` and returning an `OperationResult`.
+        - notify : bool
+            - Whether or not to notify the listener as soon as every operation completes.
+        - parallel : int
+            - Maximum number of operations to perform concurrently instead of the one of this manager.
+
+        ### Returns
+        - List of `OperationResult`, one per managed instance in the order of `names`.
+        """
+        import asyncio
+
+        if not names:
+            return []
+
+        loop = asyncio.get_running_loop()
+        workers = max(1, parallel) if parallel is not None else self._parallel
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers = min(workers, len(names)))
+
+        async def perform(name : str) -> OperationResult:
+            result = await loop.run_in_executor(executor, self._perform, action, name, operation)
+            if notify:
+                self._notify(result)
+            return result
+
+        try:
+            return await asyncio.gather(*[ perform(x) for x in names ])
+        finally:
+            # Operations not started yet are abandoned should the caller be cancelled
+            executor.shutdown(wait = False, cancel_futures = True)
+
+
+    def _perform(
+            self,
+            action : str,
+            name : str,
+            operation,
+    ) -> OperationResult:
+        """
+        Performs an operation against a single managed instance capturing any failure as the outcome.
+
+        ### Returns
+        - Outcome of the operation.
+        """
+        started = time.monotonic()
+        target = InstanceImpl(name, progress = self._progress)
+        try:
+            result = operation(target)
+        except Exception as e:
+            message = e.args[-1] if e.args else repr(e)
+            target._progress(str(message))
+            result = OperationResult(name, action, success = False, message = str(message))
+        result.elapsed = time.monotonic() - started
+
+        return result
+
+
+    async def _run(
+            self,
+            function,
+            *args,
+    ):
+        """
+        Calls a blocking function on a worker thread.
+
+        ### Returns
+        - Whatever the function returns.
+        """
+        import asyncio
+
+        return await asyncio.get_running_loop().run_in_executor(None, function, *args)
+
+
+    def _notify(
+            self,
+            result : OperationResult,
+    ) -> None:
+        """
+        Notifies the listener, if any, of the outcome of an operation.
+
+        ### Returns
+        - Nothing.
+        """
+        if self._listener is not None:
+            with self._lock:
+                self._listener(result)
+
+
+    def _print(
+            self,
+            message : str,
+    ) -> None:
+        """
+        Prints a progress message, possibly from a worker thread.
+
+        ### Returns
+        - Nothing.
+        """
+        with self._lock:
+            print(message, flush = True)
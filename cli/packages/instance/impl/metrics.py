@@ -0,0 +1,145 @@
+import psutil
+import time
+
+
+class ProcessMetrics:
+    """
+    Gathers live resource metrics of many processes at once.
+
+    - Every metric of a process is read within a single `psutil.Process.oneshot()` block so that the underlying `/proc`
+      files are read once per process.
+
+    - CPU utilization is measured over one interval shared by all processes: every process is sampled, a single sleep
+      is performed and every process is sampled again. The cost therefore does not grow with the number of processes.
+    """
+    _pids : list
+
+    DEFAULT_INTERVAL = 0.1
+
+    def __init__(
+            self,
+            pids : list,
+    ):
+        """
+        Creates an instance.
+
+        ### Arguments
+        - pids : list[int]
+            - PIDs of the processes to gather metrics for.
+        """
+        self._pids = pids
+
+
+    def collect(
+            self,
+            interval : float = DEFAULT_INTERVAL,
+    ) -> dict:
+        """
+        Gathers the metrics of every process.
+
+        ### Arguments
+        - interval : float
+            - Time, in seconds, over which CPU utilization is measured.
+
+        ### Returns
+        - Dictionary of metrics by PID, processes which no longer exist are omitted, see `iterate()`.
+        """
+        return { pid: metrics for pid, metrics in self.iterate(interval) if metrics is not None }
+
+
+    def iterate(
+            self,
+            interval : float = DEFAULT_INTERVAL,
+    ):
+        """
+        Gathers the metrics of every process, providing those of each process as soon as they are read. Every process
+        is sampled at once before the shared interval, the first metrics are therefore provided after `interval`
+        however many processes there are, and the remaining ones are read one process at a time.
+
+        ### Arguments
+        - interval : float
+            - Time, in seconds, over which CPU utilization is measured.
+
+        ### Returns
+        - Generator of tuples of the PID and its metrics, in the order of the PIDs, the metrics being `None` when the
+          process no longer exists. The metrics are `cpu_percent`, `rss` in bytes, `threads`, `fds`, or `None` when
+          not accessible, and `uptime` in seconds.
+        """
+        procs = []
+        for pid in self._pids:
+            try:
+                proc = psutil.Process(pid)
+                # The first call only records the CPU times the utilization is later computed against
+                proc.cpu_percent(None)
+            except psutil.NoSuchProcess:
+                proc = None
+            procs.append((pid, proc))
+
+        if any(proc is not None for _, proc in procs):
+            time.sleep(interval)
+
+        for pid, proc in procs:
+            metrics = None
+            if proc is not None:
+                try:
+                    with proc.oneshot():
+                        metrics = {
+                            "cpu_percent": proc.cpu_percent(None),
+                            "rss": proc.memory_info().rss,
+                            "threads": proc.num_threads(),
+                            "fds": ProcessMetrics._num_fds(proc),
+                            "uptime": max(0.0, time.time() - proc.create_time()),
+                        }
+                except psutil.NoSuchProcess:
+                    pass
+            yield pid, metrics
+
+
+    @staticmethod
+    def format_bytes(
+            value : int,
+    ) -> str:
+        """
+        Formats an amount of bytes for display.
+
+        ### Returns
+        - Amount in the largest binary unit it is at least one of.
+        """
+        for unit in ("B", "KiB", "MiB", "GiB"):
+            if value < 1024:
+                return f"{value:.0f} {unit}" if unit == "B" else f"{value:.1f} {unit}"
+            value = value / 1024
+        return f"{value:.1f} TiB"
+
+
+    @staticmethod
+    def format_duration(
+            seconds : float,
+    ) -> str:
+        """
+        Formats a duration for display.
+
+        ### Returns
+        - Duration as `[<days>d ]HH:MM:SS`.
+        """
+        minutes, seconds = divmod(int(seconds), 60)
+        hours, minutes = divmod(minutes, 60)
+        days, hours = divmod(hours, 24)
+        result = f"{hours:02d}:{minutes:02d}:{seconds:02d}"
+        return f"{days}d {result}" if days else result
+
+
+    @staticmethod
+    def _num_fds(
+            proc : psutil.Process,
+    ) -> int:
+        """
+        Counts the open file descriptors of a process.
+
+        ### Returns
+        - Number of open file descriptors or `None` if they cannot be inspected, e.g. for processes of other users.
+        """
+        try:
+            return proc.num_fds()
+        except psutil.AccessDenied:
+            return None
@@ -0,0 +1,415 @@
+import glob
+import hashlib
+import os
+import psutil
+import select
+import time
+
+
+def is_standalone_jvm(
+        proc : psutil.Process,
+) -> bool:
+    """
+    Returns whether or not a process is a JBoss standalone JVM as launched by `standalone.sh`.
+
+    ### Arguments
+    - proc : psutil.Process
+        - Process to inspect.
+
+    ### Returns
+    - True if the process is a JBoss standalone JVM, False otherwise.
+    """
+    try:
+        cmdline = proc.cmdline()
+        return proc.name() == "java" and len(cmdline) > 1 and cmdline[1] == "-D[Standalone]"
+    except (psutil.NoSuchProcess, psutil.AccessDenied):
+        return False
+
+
+def terminate(
+        procs : list,
+        timeout : float,
+) -> list:
+    """
+    Gracefully terminates processes concurrently. Every process is sent `SIGTERM` at once, all of them are then waited
+    upon together and only those still alive once the shared `timeout` elapsed are sent `SIGKILL`.
+
+    ### Arguments
+    - procs : list[psutil.Process]
+        - Processes to terminate.
+    - timeout : float
+        - Time, in seconds, shared by all processes to gracefully terminate.
+
+    ### Returns
+    - List of processes that had to be forcefully terminated.
+    """
+    for proc in procs:
+        try:
+            proc.terminate()
+        except psutil.NoSuchProcess:
+            pass
+
+    _, alive = psutil.wait_procs(procs, timeout = timeout)
+    for proc in alive:
+        try:
+            proc.kill()
+        except psutil.NoSuchProcess:
+            pass
+    psutil.wait_procs(alive, timeout = timeout)
+
+    return alive
+
+
+class ProcessIdentity:
+    """
+    Identity of a process which, unlike its PID, is not reused: its start time together with a fingerprint of its
+    command line, both recorded in the instance states when the JVM is launched.
+
+    - Both are read straight from `/proc/<pid>/stat` and `/proc/<pid>/cmdline`. The start time is kept in clock ticks
+      since boot, as the kernel reports it, so that it is not affected by the wall clock being stepped.
+
+    - `verify_many()` checks any number of processes with a single listing of `/proc`, only the processes still listed
+      are inspected further.
+
+    - Instance states recorded before identities were, which lack them, are verified by their PID only. Those recorded
+      with a `create_time`, in seconds since the epoch, are compared like `psutil` computes it, i.e. relative to the
+      boot time, which moves with the wall clock.
+    """
+
+    # Creation times of older instance states are derived from the boot time, which is shifted when the clock is stepped
+    LEGACY_TOLERANCE = 1.0
+
+    @staticmethod
+    def of(
+            pid : int,
+    ) -> dict:
+        """
+        Returns the identity of a process.
+
+        ### Arguments
+        - pid : int
+            - PID of the process.
+
+        ### Returns
+        - Dictionary of the `start_time`, in clock ticks since boot, and the command line `fingerprint`.
+
+        ### Raises
+        - psutil.NoSuchProcess
+            - If the process does not exist.
+        """
+        result = ProcessIdentity._read(pid)
+        if result is None:
+            raise psutil.NoSuchProcess(pid)
+        return result
+
+
+    @staticmethod
+    def verify(
+            state,
+    ) -> bool:
+        """
+        Returns whether or not the process recorded in an instance state is still running.
+
+        ### Arguments
+        - state : InstanceState
+            - Instance state.
+
+        ### Returns
+        - True if the process is running and its identity matches the recorded one, False otherwise.
+        """
+        return ProcessIdentity._matches(state, ProcessIdentity._read(state.pid))
+
+
+    @staticmethod
+    def verify_many(
+            states : list,
+    ) -> list:
+        """
+        Verifies the processes recorded in many instance states at once, see `verify()`.
+
+        ### Arguments
+        - states : list[InstanceState]
+            - Instance states.
+
+        ### Returns
+        - List of the identity of the process, see `of()`, if it is still running and `None` otherwise, in the order of
+          `states`.
+        """
+        listed = { int(x) for x in os.listdir("/proc") if x.isdigit() }
+        result = []
+        for state in states:
+            identity = ProcessIdentity._read(state.pid) if state.pid in listed else None
+            result.append(identity if ProcessIdentity._matches(state, identity) else None)
+        return result
+
+
+    @staticmethod
+    def _matches(
+            state,
+            identity : dict,
+    ) -> bool:
+        """
+        Returns whether or not the identity of a process matches the one recorded in an instance state.
+
+        ### Returns
+        - True if it matches, False otherwise or if the process does not exist.
+        """
+        if identity is None:
+            return False
+        start_time = getattr(state, "start_time", None)
+        create_time = getattr(state, "create_time", None)
+        if start_time is not None:
+            if start_time != identity["start_time"]:
+                return False
+        elif create_time is not None:
+            started = psutil.boot_time() + identity["start_time"] / os.sysconf("SC_CLK_TCK")
+            if abs(create_time - started) > ProcessIdentity.LEGACY_TOLERANCE:
+                return False
+        fingerprint = getattr(state, "fingerprint", None)
+        return fingerprint is None or fingerprint == identity["fingerprint"]
+
+
+    @staticmethod
+    def _read(
+            pid : int,
+    ) -> dict:
+        """
+        Reads the identity of a process.
+
+        ### Arguments
+        - pid : int
+            - PID of the process.
+
+        ### Returns
+        - Identity or `None` if the process does not exist.
+        """
+        try:
+            with open(f"/proc/{pid}/stat", "rb") as f:
+                stat = f.read()
+            with open(f"/proc/{pid}/cmdline", "rb") as f:
+                cmdline = f.read()
+        except (FileNotFoundError, ProcessLookupError):
+            return None
+
+        # The command name may contain anything, the fields following it are space separated from field 3 onwards
+        return {
+            "start_time": int(stat.rsplit(b")", 1)[1].split()[19]),
+            "fingerprint": hashlib.sha256(cmdline.rstrip(b"\0")).hexdigest()[:16],
+        }
+
+
+class WrapperExitError(ChildProcessError):
+    """
+    Raised when a wrapper process exits before the process it is expected to launch appeared.
+    """
+    pid : int
+    exit_code : int
+
+    def __init__(
+            self,
+            pid : int,
+            exit_code : int,
+    ):
+        """
+        Creates an instance.
+
+        ### Arguments
+        - pid : int
+            - PID of the wrapper process.
+        - exit_code : int
+            - Exit code of the wrapper process or `None` if it could not be determined.
+        """
+        self.pid = pid
+        self.exit_code = exit_code
+        status = "an unknown status" if exit_code is None else f"status {exit_code}"
+        super().__init__(f"Process {pid} exited with {status} before launching the JVM")
+
+
+class ChildDiscovery:
+    """
+    Discovers the JVM launched by a wrapper process such as `standalone.sh`.
+
+    - Children are read directly from `/proc/<pid>/task/<tid>/children` rather than by scanning every process on the
+      host, falling back to `psutil` when that interface is unavailable.
+
+    - Between attempts the wrapper is waited upon through a pidfd, when supported, with an exponentially growing
+      sub-second timeout. The wrapper exiting therefore interrupts the wait immediately and is reported together with
+      its exit code.
+    """
+    _pid : int
+    _timeout : float
+    _match : object
+    _reaper : object
+
+    INITIAL_INTERVAL = 0.001
+    MAXIMUM_INTERVAL = 0.05
+    DEFAULT_TIMEOUT = 30
+
+    def __init__(
+            self,
+            pid : int,
+            timeout : float = DEFAULT_TIMEOUT,
+            match = is_standalone_jvm,
+            reap = None,
+    ):
+        """
+        Creates an instance.
+
+        ### Arguments
+        - pid : int
+            - PID of the wrapper process.
+        - timeout : float
+            - Maximum time, in seconds, to wait for the child to appear.
+        - match : callable
+            - Predicate accepting a `psutil.Process` that determines whether a child is the one being discovered.
+        - reap : callable
+            - Callable accepting the PID of the exited wrapper, reaping it and returning its exit code, e.g.
+              `ProcessEngine.release()` for a wrapper whose reaping is held off. The wrapper is reaped directly when
+              not provided.
+        """
+        self._pid = pid
+        self._timeout = timeout
+        self._match = match
+        self._reaper = reap
+
+
+    def wait(
+            self,
+    ) -> psutil.Process:
+        """
+        Waits for the child to appear.
+
+        ### Returns
+        - The discovered child process.
+
+        ### Raises
+        - WrapperExitError
+            - If the wrapper exits before the child appears.
+        - TimeoutError
+            - If the child does not appear within the timeout.
+        """
+        deadline = time.monotonic() + self._timeout
+        interval = self.INITIAL_INTERVAL
+        pidfd = self._open_pidfd()
+        try:
+            while True:
+                child = self._find_child()
+                if child is not None:
+                    return child
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f"Process {self._pid} did not launch the JVM within {self._timeout} seconds")
+
+                if self._wait_exit(pidfd, min(interval, remaining)):
+                    # The wrapper may have launched the child right before exiting
+                    child = self._find_child()
+                    if child is not None:
+                        return child
+                    raise WrapperExitError(self._pid, self._reap())
+                interval = min(interval * 2, self.MAXIMUM_INTERVAL)
+        finally:
+            if pidfd is not None:
+                os.close(pidfd)
+
+
+    def _find_child(
+            self,
+    ) -> psutil.Process:
+        """
+        Finds the first child of the wrapper accepted by the predicate.
+
+        ### Returns
+        - The child process or `None` if there is none yet.
+        """
+        for pid in self._children():
+            try:
+                proc = psutil.Process(pid)
+            except psutil.NoSuchProcess:
+                continue
+            if self._match(proc):
+                return proc
+        return None
+
+
+    def _children(
+            self,
+    ) -> list:
+        """
+        Returns the PIDs of the direct children of the wrapper.
+
+        ### Returns
+        - List of PIDs.
+        """
+        result = []
+
+        files = glob.glob(f"/proc/{self._pid}/task/*/children")
+        if not files:
+            try:
+                return [ x.pid for x in psutil.Process(self._pid).children() ]
+            except psutil.NoSuchProcess:
+                return result
+        for file in files:
+            try:
+                with open(file, "r") as f:
+                    result = result + [ int(x) for x in f.read().split() ]
+            except FileNotFoundError:
+                pass
+
+        return result
+
+
+    def _open_pidfd(
+            self,
+    ) -> int:
+        """
+        Opens a pidfd for the wrapper.
+
+        ### Returns
+        - File descriptor or `None` if pidfds are not supported.
+        """
+        try:
+            return os.pidfd_open(self._pid)
+        except (AttributeError, OSError):
+            return None
+
+
+    def _wait_exit(
+            self,
+            pidfd : int,
+            timeout : float,
+    ) -> bool:
+        """
+        Waits up to `timeout` seconds for the wrapper to exit.
+
+        ### Returns
+        - True if the wrapper exited, False otherwise.
+        """
+        if pidfd is not None:
+            poller = select.poll()
+            poller.register(pidfd, select.POLLIN)
+            return bool(poller.poll(timeout * 1000))
+
+        time.sleep(timeout)
+        try:
+            return psutil.Process(self._pid).status() == psutil.STATUS_ZOMBIE
+        except psutil.NoSuchProcess:
+            return True
+
+
+    def _reap(
+            self,
+    ) -> int:
+        """
+        Reaps the exited wrapper.
+
+        ### Returns
+        - Exit code of the wrapper or `None` if it is not a child of this process or was already reaped.
+        """
+        if self._reaper is not None:
+            return self._reaper(self._pid)
+        try:
+            pid, status = os.waitpid(self._pid, os.WNOHANG)
+            return os.waitstatus_to_exitcode(status) if pid else None
+        except ChildProcessError:
+            return None
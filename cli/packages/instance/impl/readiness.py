@@ -0,0 +1,378 @@
+import os
+import selectors
+import threading
+import time
+
+import util
+
+
+class Readiness:
+    """
+    Outcome of following the boot of a managed instance, see `ReadinessWatcher`.
+    """
+    name : str
+    ready : bool
+    elapsed : float
+    message : str
+
+    def __init__(
+            self,
+            name : str,
+            ready : bool,
+            elapsed : float,
+            message : str,
+    ):
+        """
+        Creates an instance.
+
+        ### Arguments
+        - name : str
+            - Managed instance name.
+        - ready : bool
+            - Whether or not the managed instance booted successfully.
+        - elapsed : float
+            - Time, in seconds, from starting to follow the boot until its outcome was known.
+        - message : str
+            - Human readable description of the outcome.
+        """
+        self.name = name
+        self.ready = ready
+        self.elapsed = elapsed
+        self.message = message
+
+
+class _Boot:
+    """
+    Progress of reading the server log of a single managed instance.
+    """
+    name : str
+    path : str
+    started : float
+    inode : int
+    offset : int
+    carry : bytes
+    pidfd : int
+    outcome : Readiness
+
+    def __init__(
+            self,
+            name : str,
+            path : str,
+    ):
+        self.name = name
+        self.path = path
+        self.started = time.monotonic()
+        self.inode = None
+        self.offset = 0
+        self.carry = b""
+        self.pidfd = None
+        self.outcome = None
+
+
+class ReadinessWatcher:
+    """
+    Follows the server logs of any number of booting managed instances at once and reports as soon as each of them
+    logged that its boot completed or failed.
+
+    - The log directories are watched with `inotify` and every server log is read incrementally from where it was
+      when the instance was registered, so only what the booting server appends is ever read. A log rotated or
+      truncated at boot is read again from its beginning.
+
+    - The markers are searched in whatever was appended at once, only the incomplete last line is carried over to the
+      next read.
+
+    - Everything is waited upon by the calling thread with `selectors`, together with a pidfd of every JVM so that a JVM
+      exiting before booting is reported immediately. There is no thread per instance.
+
+    - A boot that completed with errors, i.e. some services or deployments failed to start, is not ready, whatever the
+      product generation: serving from such a server, or carrying on with a rolling restart, is not safe.
+    """
+    _timeout : float
+    _inotify : util.Inotify
+    _boots : dict
+    _directories : dict
+    _lock : threading.Lock
+
+    # WildFly, respectively JBoss AS 7 and EAP 6, message identifiers logged once the boot completed, completed with
+    # errors or failed
+    READY = (b"WFLYSRV0025", b"JBAS015874")
+    FAILED = (b"WFLYSRV0026", b"JBAS015875", b"WFLYSRV0056")
+
+    LOG_FILE = "server.log"
+    DEFAULT_TIMEOUT = 300
+    MAXIMUM_LINE = 64 * 1024
+
+    _MASK = util.Inotify.IN_MODIFY | util.Inotify.IN_CREATE | util.Inotify.IN_MOVED_TO | util.Inotify.IN_CLOSE_WRITE
+    _CHUNK = 1024 * 1024
+
+    def __init__(
+            self,
+            timeout : float = DEFAULT_TIMEOUT,
+    ):
+        """
+        Creates an instance.
+
+        ### Arguments
+        - timeout : float
+            - Maximum time, in seconds, every managed instance is given to boot from when it is registered.
+
+        ### Raises
+        - OSError
+            - If `inotify` is not available.
+        """
+        self._timeout = timeout
+        self._inotify = util.Inotify()
+        self._boots = dict()
+        self._directories = dict()
+        self._lock = threading.Lock()
+
+
+    def watch(
+            self,
+            name : str,
+            log_dir : str,
+    ) -> None:
+        """
+        Registers a managed instance about to be started, which must be done before starting it so that nothing it
+        logs is missed. Its time to ready is measured from now on. May be called from any thread.
+
+        ### Arguments
+        - name : str
+            - Managed instance name.
+        - log_dir : str
+            - Directory of its server log, created if it does not exist yet.
+
+        ### Returns
+        - Nothing.
+        """
+        os.makedirs(log_dir, exist_ok = True)
+        boot = _Boot(name, f"{log_dir}/{ReadinessWatcher.LOG_FILE}")
+
+        # Whatever was logged by previous boots is skipped
+        try:
+            stat = os.stat(boot.path)
+            boot.inode = stat.st_ino
+            boot.offset = stat.st_size
+        except FileNotFoundError:
+            pass
+
+        with self._lock:
+            self._inotify.add_watch(log_dir, ReadinessWatcher._MASK)
+            self._boots[name] = boot
+            self._directories[log_dir] = boot
+
+
+    def attach(
+            self,
+            name : str,
+            pid : int,
+    ) -> None:
+        """
+        Associates the JVM of a registered managed instance so that it exiting before booting is noticed. May be
+        called from any thread.
+
+        ### Arguments
+        - name : str
+            - Managed instance name.
+        - pid : int
+            - PID of its JVM.
+
+        ### Returns
+        - Nothing.
+        """
+        try:
+            pidfd = os.pidfd_open(pid)
+        except (AttributeError, OSError):
+            # Then only the timeout applies
+            return
+        with self._lock:
+            self._boots[name].pidfd = pidfd
+
+
+    def forget(
+            self,
+            name : str,
+    ) -> None:
+        """
+        Unregisters a managed instance, e.g. because it failed to start or was running already. May be called from
+        any thread.
+
+        ### Arguments
+        - name : str
+            - Managed instance name.
+
+        ### Returns
+        - Nothing.
+        """
+        with self._lock:
+            boot = self._boots.pop(name, None)
+            if boot is None:
+                return
+            self._directories.pop(os.path.dirname(boot.path), None)
+            if boot.pidfd is not None:
+                os.close(boot.pidfd)
+
+
+    def wait(
+            self,
+    ) -> dict:
+        """
+        Waits until every registered managed instance booted, failed to boot, exited or ran out of time, and then
+        releases every resource of this watcher.
+
+        ### Returns
+        - Dictionary of `Readiness` by managed instance name.
+        """
+        selector = selectors.DefaultSelector()
+        try:
+            selector.register(self._inotify, selectors.EVENT_READ)
+            for boot in self._boots.values():
+                if boot.pidfd is not None:
+                    selector.register(boot.pidfd, selectors.EVENT_READ, boot)
+
+            # Anything logged before waiting is read right away
+            for boot in self._boots.values():
+                self._read(boot)
+
+            pending = [ x for x in self._boots.values() if x.outcome is None ]
+            while pending:
+                deadline = min(x.started for x in pending) + self._timeout
+                for key, _ in selector.select(max(0.0, deadline - time.monotonic())):
+                    if key.data is None:
+                        self._changed()
+                    else:
+                        self._exited(key.data, selector)
+
+                now = time.monotonic()
+                for boot in pending:
+                    if boot.outcome is None and now - boot.started >= self._timeout:
+                        boot.outcome = Readiness(
+                            boot.name, False, now - boot.started, f"Not ready within {self._timeout:g} s")
+                pending = [ x for x in pending if x.outcome is None ]
+        finally:
+            selector.close()
+            self.close()
+
+        return { x.name: x.outcome for x in self._boots.values() }
+
+
+    def close(
+            self,
+    ) -> None:
+        """
+        Releases every resource of this watcher.
+
+        ### Returns
+        - Nothing.
+        """
+        for boot in self._boots.values():
+            if boot.pidfd is not None:
+                os.close(boot.pidfd)
+                boot.pidfd = None
+        self._inotify.close()
+
+
+    def _changed(
+            self,
+    ) -> None:
+        """
+        Reads the server logs that changed.
+
+        ### Returns
+        - Nothing.
+        """
+        for path, mask, name in self._inotify.read():
+            if path is None:
+                # Queue overflow, any log may have changed
+                for boot in self._boots.values():
+                    self._read(boot)
+            elif name == ReadinessWatcher.LOG_FILE and path in self._directories:
+                self._read(self._directories[path])
+
+
+    def _exited(
+            self,
+            boot : _Boot,
+            selector : selectors.BaseSelector,
+    ) -> None:
+        """
+        Reports a JVM that exited, unless it logged the outcome of its boot right before exiting.
+
+        ### Returns
+        - Nothing.
+        """
+        selector.unregister(boot.pidfd)
+        os.close(boot.pidfd)
+        boot.pidfd = None
+
+        self._read(boot)
+        if boot.outcome is None:
+            boot.outcome = Readiness(
+                boot.name, False, time.monotonic() - boot.started, "Exited before its boot completed")
+
+
+    def _read(
+            self,
+            boot : _Boot,
+    ) -> None:
+        """
+        Reads what was appended to the server log of a managed instance since the last read and looks for the
+        markers.
+
+        ### Returns
+        - Nothing.
+        """
+        if boot.outcome is not None:
+            return
+        try:
+            fd = os.open(boot.path, os.O_RDONLY | os.O_CLOEXEC)
+        except FileNotFoundError:
+            return
+        try:
+            stat = os.fstat(fd)
+            if stat.st_ino != boot.inode or stat.st_size < boot.offset:
+                # Created, rotated or truncated since
+                boot.inode = stat.st_ino
+                boot.offset = 0
+                boot.carry = b""
+
+            while True:
+                chunk = os.pread(fd, ReadinessWatcher._CHUNK, boot.offset)
+                if not chunk:
+                    return
+                boot.offset = boot.offset + len(chunk)
+                data = boot.carry + chunk
+                if self._search(boot, data):
+                    return
+
+                # The last line may still be incomplete, it is searched again once complete
+                boot.carry = data[data.rfind(b"\n") + 1:][-ReadinessWatcher.MAXIMUM_LINE:]
+        finally:
+            os.close(fd)
+
+
+    def _search(
+            self,
+            boot : _Boot,
+            data : bytes,
+    ) -> bool:
+        """
+        Looks for the first marker in a block of the server log of a managed instance and records the outcome.
+
+        ### Returns
+        - True if a marker was found, False otherwise.
+        """
+        found = None
+        for marker in ReadinessWatcher.READY + ReadinessWatcher.FAILED:
+            index = data.find(marker)
+            if index >= 0 and (found is None or index < found[0]):
+                found = (index, marker)
+        if found is None:
+            return False
+
+        index, marker = found
+        end = data.find(b"\n", index)
+        line = data[index:end if end >= 0 else len(data)].decode(errors = "replace").strip()
+        elapsed = time.monotonic() - boot.started
+        boot.outcome = Readiness(boot.name, marker in ReadinessWatcher.READY, elapsed, line)
+        return True
@@ -0,0 +1,168 @@
+from .metrics import ProcessMetrics
+import util
+
+
+class OperationResult:
+    """
+    Outcome of a lifecycle operation performed against a single managed instance.
+    """
+    name : str
+    action : str
+    success : bool
+    pid : int
+    message : str
+    elapsed : float
+    output : str
+
+    COLUMNS = [
+        util.Column("name", "Name", style = "green"),
+        util.Column("action", "Action"),
+        util.Column("success", "Result", style = "yellow", format = lambda x: "OK" if x else "[red]FAILED[/red]"),
+        util.Column("pid", "PID"),
+        util.Column("message", "Message"),
+        util.Column("elapsed", "Time (s)", justify = "right", format = lambda x: f"{x:.2f}"),
+    ]
+
+    def __init__(
+            self,
+            name : str,
+            action : str,
+            success : bool = True,
+            pid : int = None,
+            message : str = "",
+            elapsed : float = 0.0,
+            output : str = None,
+    ):
+        """
+        Creates an instance.
+
+        ### Arguments
+        - name : str
+            - Managed instance name.
+        - action : str
+            - Lifecycle operation that was performed; e.g., `start`.
+        - success : bool
+            - Whether or not the operation succeeded.
+        - pid : int
+            - PID of the managed instance after the operation or `None` if it is not running.
+        - message : str
+            - Human readable description of the outcome.
+        - elapsed : float
+            - Wall clock time, in seconds, the operation took.
+        - output : str
+            - Output captured while performing the operation, if any; e.g., of CLI commands.
+        """
+        self.name = name
+        self.action = action
+        self.success = success
+        self.pid = pid
+        self.message = message
+        self.elapsed = elapsed
+        self.output = output
+
+
+    def to_dict(
+            self,
+    ) -> dict:
+        """
+        Returns a dictionary representation suitable for use with YAML or JSON output.
+
+        ### Returns
+        - Dictionary representation of this result, the output is only included when captured.
+        """
+        result = {
+            "name": self.name,
+            "action": self.action,
+            "success": self.success,
+            "pid": self.pid,
+            "message": self.message,
+            "elapsed": round(self.elapsed, 3),
+        }
+        if self.output is not None:
+            result["output"] = self.output
+
+        return result
+
+
+
+class InstanceStatus:
+    """
+    Status of a single managed instance together with the live resource metrics of its JVM when running.
+    """
+    name : str
+    status : str
+    pid : int
+    cpu_percent : float
+    rss : int
+    threads : int
+    fds : int
+    uptime : float
+
+    METRICS = ("cpu_percent", "rss", "threads", "fds", "uptime")
+    COLUMNS = [
+        util.Column("name", "Name", style = "green"),
+        util.Column("pid", "PID"),
+        util.Column("status", "Status", style = "yellow"),
+        util.Column("cpu_percent", "CPU %", justify = "right", format = lambda x: f"{x:.1f}"),
+        util.Column("rss", "RSS", justify = "right", format = ProcessMetrics.format_bytes),
+        util.Column("threads", "Threads", justify = "right"),
+        util.Column("fds", "FDs", justify = "right"),
+        util.Column("uptime", "Uptime", justify = "right", format = ProcessMetrics.format_duration),
+    ]
+
+    def __init__(
+            self,
+            name : str,
+            status : str,
+            pid : int = None,
+            metrics : dict = None,
+    ):
+        """
+        Creates an instance.
+
+        ### Arguments
+        - name : str
+            - Managed instance name.
+        - status : str
+            - `Running`, `Not Running` or `Unknown` when the managed instance does not exist.
+        - pid : int
+            - PID of the JVM or `None` if it is not running.
+        - metrics : dict
+            - Resource metrics of the JVM, see `ProcessMetrics.iterate()`, `None` when not known.
+        """
+        self.name = name
+        self.status = status
+        self.pid = pid
+        metrics = metrics or dict()
+        for metric in InstanceStatus.METRICS:
+            setattr(self, metric, metrics.get(metric))
+
+
+    @property
+    def running(
+            self,
+    ) -> bool:
+        """
+        Whether or not the JVM of the managed instance is running.
+        """
+        return self.pid is not None
+
+
+    def to_dict(
+            self,
+    ) -> dict:
+        """
+        Returns a dictionary representation suitable for use with YAML or JSON output.
+
+        ### Returns
+        - Dictionary representation of this status.
+        """
+        result = {
+            "name": self.name,
+            "pid": self.pid,
+            "status": self.status,
+        }
+        for metric in InstanceStatus.METRICS:
+            result[metric] = getattr(self, metric)
+
+        return result
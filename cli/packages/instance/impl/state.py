@@ -1,11 +1,15 @@
-from box import Box
-from jsonschema import validate
+from box import Box, BoxList
+import contextlib
 import os
 import psutil
+import threading
 import yaml
 
+from .process import ProcessIdentity
 import config
 import paths
+import schema
+import store
 
 
 class InstanceState:
@@ -30,6 +34,13 @@ class InstanceStateManager:
     """
     Managed instance stage low level state manager. Responsible for persistence of the backing YAML file for instance
     states and provides an easy to use mechanism to update instance states.
+
+    Updates and removals are recorded and re-applied on top of the latest persisted instance states when saving, under
+    the lock of the backing YAML file, so that concurrent invocations never lose each other's updates.
+
+    When the configuration uses the sharded layout, see `config.Config.is_sharded()`, each managed instance state is
+    instead persisted in its own `<name>.state` file in the run directory. Only the files of the managed instances that
+    are looked up or changed are then read or written.
     """
     # TODO Consider instead just using in the configuration `paths.run` (which right now is just a directory)
     STATE_FILE = "instance-states.yaml"
@@ -41,11 +52,44 @@ class InstanceStateManager:
         """
         Creates an instance from an existing dictionary such that dictionary keys are exposed as members.
 
+        Members whose name starts with an underscore are private to the manager and are not persisted.
+
         ### Arguments
         - entries
             - Object or other iterable dictionary to dynamical;y create instance level members for.
         """
         self.__dict__.update(entries)
+        self._lock = threading.Lock()
+        self._index = { x.name: i for i, x in enumerate(self.instances) } if "instances" in self.__dict__ else None
+        self._records = dict()
+        self._changes = dict()
+
+
+    def __getattr__(
+            self,
+            name : str,
+    ) -> object:
+        """
+        Reads every managed instance state shard upon first access to the instance states in the sharded layout.
+
+        ### Arguments
+        - name : str
+            - Member name.
+
+        ### Returns
+        - Member value.
+        """
+        if name == "instances" and "_run" in self.__dict__:
+            shards = sorted(x for x in os.listdir(self._run) if x.endswith(".state")) if os.path.isdir(self._run) else []
+            records = [ self._read_shard(x.removesuffix(".state")) for x in shards ]
+            instances = BoxList(x for x in records if x is not None)
+            with self._lock:
+                # The index first, lookups rely on it as soon as the instance states are there
+                if "instances" not in self.__dict__:
+                    self._index = { x.name: i for i, x in enumerate(instances) }
+                    self.instances = instances
+            return self.instances
+        raise AttributeError(name)
 
 
     @staticmethod
@@ -59,6 +103,43 @@ class InstanceStateManager:
         return f"{paths.Paths.schemas()}/instance-state.schema.yaml"
 
 
+    @staticmethod
+    def state_file(
+            config : config.Config,
+    ) -> str:
+        """
+        Returns the absolute path to the managed instance states.
+
+        ### Arguments
+        - config : config.Config
+            - Managed instance configuration.
+
+        ### Returns
+        - Managed instance states path.
+        """
+        return f"{config.paths.run}/{InstanceStateManager.STATE_FILE}"
+
+
+    @staticmethod
+    def shard(
+            config : config.Config,
+            name : str,
+    ) -> str:
+        """
+        Returns the absolute path to the state of a managed instance in the sharded layout.
+
+        ### Arguments
+        - config : config.Config
+            - Managed instance configuration.
+        - name : str
+            - Managed instance name.
+
+        ### Returns
+        - Managed instance state path.
+        """
+        return f"{config.paths.run}/{name}.state"
+
+
     @classmethod
     def load(
             cls,
@@ -76,22 +157,26 @@ class InstanceStateManager:
         """
         result : InstanceStateManager = None
 
-        # Load schema
-        with open(InstanceStateManager.schema(), "r") as f:
-            schema = yaml.safe_load(f)
-
-        # Load configuration and validate against schema
-        state_data = {}
-        state_file = f"{config.paths.run}/{InstanceStateManager.STATE_FILE}"
-        try:
-            with open(state_file, "r") as f:
-                state_data = yaml.safe_load(f)
-            validate(state_data, schema)
-        except FileNotFoundError:
-            # State data does not exist
-            state_data = {
-                "instances": [],
-            }
+        # Managed instance states are read on demand in the sharded layout
+        if config.is_sharded():
+            return InstanceStateManager(_run = config.paths.run)
+
+        # Load instance states and validate against schema, unless this exact content was validated already
+        state_file = InstanceStateManager.state_file(config)
+        state_data = store.Memo.get(state_file)
+        if state_data is None:
+            try:
+                with open(state_file, "rb") as f:
+                    content = f.read()
+                state_data = yaml.load(content, Loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader))
+                schema.Schema.load(InstanceStateManager.schema()).validate(
+                    state_data, path = state_file, content = content)
+                store.Memo.put(state_file, state_data)
+            except FileNotFoundError:
+                # State data does not exist
+                state_data = {
+                    "instances": [],
+                }
 
         result = InstanceStateManager(**Box(state_data))
 
@@ -105,6 +190,10 @@ class InstanceStateManager:
         """
         Saves the managed instance states.
 
+        Under the lock of the backing YAML file the latest persisted instance states are reloaded, the updates and
+        removals performed through this manager are applied on top of them and the result is atomically written. This
+        manager then reflects the saved instance states.
+
         ### Arguments
         - config : config.Config
             - Managed instance configuration.
@@ -112,9 +201,30 @@ class InstanceStateManager:
         ### Returns
         - Nothing.
         """
-        state_file = f"{config.paths.run}/{InstanceStateManager.STATE_FILE}"
-        os.makedirs(os.path.dirname(state_file), exist_ok = True)
-        Box(vars(self)).to_yaml(filename = state_file, indent = 2, sort_keys = False, default_flow_style = False)
+        if "_run" in self.__dict__:
+            self._save_shards(config)
+            return
+
+        state_file = InstanceStateManager.state_file(config)
+        with store.Store.locked(state_file), self._lock:
+            # Validate only the changes, the persisted instance states they are applied to are validated when loaded
+            state_schema = schema.Schema.load(InstanceStateManager.schema())
+            current = InstanceStateManager.load(config)
+            for name, state in self._changes.items():
+                if state is None:
+                    current.remove(Box(name = name))
+                else:
+                    state_schema.validate(Box(state).to_dict(), definition = "Instance-State")
+                    current.update(state)
+
+            data = { k: v for k, v in vars(current).items() if not k.startswith("_") }
+            content = InstanceStateManager._dump(data)
+            store.Store.write(state_file, content)
+            state_schema.record(state_file, content.encode())
+
+            self.instances = current.instances
+            self._index = current._index
+            self._changes = dict()
 
 
     def state_for(
@@ -131,12 +241,7 @@ class InstanceStateManager:
         ### Returns
         - Managed instance state of `None` if it is unavailable.
         """
-        result =  None
-
-        state = next((x for x in self.instances if x.name == name), None)
-        if state:
-            result = InstanceState(**state)
-        return result
+        return self._states([ name ])[0]
 
 
     # TODO This really shouldn't be called this since it returns more than a boolean
@@ -152,28 +257,53 @@ class InstanceStateManager:
             - Managed instance name.
 
         ### Returrns
-        - Runtime information at the system process level or `None` if the managed instance is not in a running state.
+        - Runtime information at the system process level or `None` if the managed instance is not in a running state,
+          i.e. the recorded process is gone or its PID was reused by another process, see `ProcessIdentity`.
         """
         result : psutil.Process = None
 
         try:
             state = self.state_for(name)
-            if state:
-                proc = psutil.Process(state.pid)
-                if proc.is_running:
-                    result = proc
+            if state and ProcessIdentity.verify(state):
+                result = psutil.Process(state.pid)
         except psutil.NoSuchProcess:
             pass
         
         return result
 
 
+    def reconcile(
+            self,
+            names : list,
+    ) -> dict:
+        """
+        Batched counterpart of `is_running()` verifying the recorded processes of many managed instances with a single
+        listing of `/proc`, see `ProcessIdentity.verify_many()`.
+
+        ### Arguments
+        - names : list[str]
+            - Managed instance names.
+
+        ### Returns
+        - Dictionary of the instance states by managed instance name, for the managed instances in a running state only.
+          Unlike `is_running()` no `psutil.Process` is created, that is left to the callers needing one.
+        """
+        result = dict()
+
+        states = [ x for x in self._states(names) if x is not None ]
+        for state, identity in zip(states, ProcessIdentity.verify_many(states)):
+            if identity is not None:
+                result[state.name] = state
+
+        return result
+
+
     def update(
             self,
             state : InstanceState,
     ) -> None:
         """
-        Updates the managed instance state to what is provided.
+        Updates the managed instance state to what is provided. This is safe to call from multiple threads.
 
         ### Arguments
         - state : InstanceState
@@ -182,13 +312,17 @@ class InstanceStateManager:
         ### Returns
         - Nothing.
         """
-        instance_state = next((x for x in self.instances if x.name == state.name), None)
-        if instance_state is None:
-            self.instances.append(state)
-        else:
-            for i, x in enumerate(self.instances):
-                if x.name == state.name:
-                    self.instances[i] = state
+        with self._lock:
+            self._changes[state.name] = state
+            self._records[state.name] = state
+            if "instances" not in self.__dict__:
+                return
+            position = self._index.get(state.name)
+            if position is None:
+                self.instances.append(state)
+                self._index[state.name] = len(self.instances) - 1
+            else:
+                self.instances[position] = state
 
 
     def remove(
@@ -196,7 +330,7 @@ class InstanceStateManager:
             state : InstanceState,
     ) -> None:
         """
-        Removes tne managed instance state.
+        Removes tne managed instance state. This is safe to call from multiple threads.
 
         ### Arguments
         - state : InstanceState
@@ -205,6 +339,181 @@ class InstanceStateManager:
         ### Returns
         - Nothing.
         """
-        for i, x in enumerate(self.instances):
-            if x.name == state.name:
-                del self.instances[i]
+        with self._lock:
+            self._changes[state.name] = None
+            self._records[state.name] = None
+            if "instances" not in self.__dict__:
+                return
+            position = self._index.pop(state.name, None)
+            if position is None:
+                return
+            del self.instances[position]
+            for k, v in self._index.items():
+                if v > position:
+                    self._index[k] = v - 1
+
+
+    @classmethod
+    @contextlib.contextmanager
+    def migrate(
+            cls,
+            config : config.Config,
+    ):
+        """
+        Context manager converting the monolithic instance states to the sharded layout, one `<name>.state` file per
+        managed instance state, within which the configuration itself is to be migrated, see
+        `config.Config.migrate()`.
+
+        The shards are written when the context is entered and the backing YAML file is only removed once the context
+        exits, so that the states remain available in either layout. Should the context exit with an exception the
+        shards are removed instead. The lock of the backing YAML file is held for the duration of the context.
+
+        ### Arguments
+        - config : config.Config
+            - Managed instance configuration, still in the monolithic layout.
+
+        ### Returns
+        - Number of managed instance states migrated.
+        """
+        state_file = InstanceStateManager.state_file(config)
+        with store.Store.locked(state_file):
+            current = InstanceStateManager.load(config)
+            written = []
+            try:
+                for state in current.instances:
+                    shard = InstanceStateManager.shard(config, state.name)
+                    store.Store.write(shard, InstanceStateManager._dump(state))
+                    written.append(shard)
+                yield len(current.instances)
+            except BaseException:
+                for shard in written:
+                    try:
+                        os.unlink(shard)
+                    except FileNotFoundError:
+                        pass
+                raise
+
+            try:
+                os.unlink(state_file)
+            except FileNotFoundError:
+                pass
+            store.Memo.invalidate(state_file)
+
+
+    def _save_shards(
+            self,
+            config : config.Config,
+    ) -> None:
+        """
+        Saves the changed managed instance states in the sharded layout. As every managed instance state has its own
+        file which is atomically replaced no lock is needed. Nothing is written unless every changed managed instance
+        state is valid.
+
+        ### Arguments
+        - config : config.Config
+            - Managed instance configuration.
+
+        ### Returns
+        - Nothing.
+        """
+        state_schema = schema.Schema.load(InstanceStateManager.schema())
+        with self._lock:
+            staged = []
+            for name, state in self._changes.items():
+                content = None
+                if state is not None:
+                    data = Box(state).to_dict()
+                    state_schema.validate(data, definition = "Instance-State")
+                    content = InstanceStateManager._dump(data)
+                staged.append((InstanceStateManager.shard(config, name), content))
+
+            for shard, content in staged:
+                if content is None:
+                    try:
+                        os.unlink(shard)
+                    except FileNotFoundError:
+                        pass
+                    continue
+                store.Store.write(shard, content)
+                state_schema.record(shard, content.encode(), definition = "Instance-State")
+            self._changes = dict()
+
+
+    def _states(
+            self,
+            names : list,
+    ) -> list:
+        """
+        Looks up many managed instance states at once. The lookup is consistent with the updates and removals
+        performed concurrently by other threads, which renumber the instance states.
+
+        ### Arguments
+        - names : list[str]
+            - Managed instance names.
+
+        ### Returns
+        - List of `InstanceState`, or `None` where unavailable, in the order of `names`.
+        """
+        records = []
+
+        if "instances" not in self.__dict__:
+            # Shards are read outside of the lock, a concurrent update or removal takes precedence
+            with self._lock:
+                missing = [ x for x in names if x not in self._records ]
+            read = { x: self._read_shard(x) for x in missing }
+            with self._lock:
+                for name, state in read.items():
+                    self._records.setdefault(name, state)
+                records = [ self._records[x] for x in names ]
+        else:
+            with self._lock:
+                for name in names:
+                    position = self._index.get(name)
+                    records.append(self.instances[position] if position is not None else None)
+
+        return [ InstanceState(**x) if x is not None else None for x in records ]
+
+
+    def _read_shard(
+            self,
+            name : str,
+    ) -> Box:
+        """
+        Reads and validates the state of a managed instance in the sharded layout.
+
+        ### Arguments
+        - name : str
+            - Managed instance name.
+
+        ### Returns
+        - Managed instance state or `None` if there is none.
+        """
+        shard = f"{self._run}/{name}.state"
+        try:
+            with open(shard, "rb") as f:
+                content = f.read()
+        except FileNotFoundError:
+            return None
+        data = yaml.load(content, Loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader))
+        schema.Schema.load(InstanceStateManager.schema()).validate(
+            data, path = shard, content = content, definition = "Instance-State")
+        return Box(data)
+
+
+    @staticmethod
+    def _dump(
+            data : dict,
+    ) -> str:
+        """
+        Serializes instance states to YAML.
+
+        ### Returns
+        - YAML document.
+        """
+        return yaml.dump(
+            Box(data).to_dict(),
+            Dumper = getattr(yaml, "CSafeDumper", yaml.SafeDumper),
+            indent = 2,
+            sort_keys = False,
+            default_flow_style = False,
+        )
@@ -0,0 +1,184 @@
+import contextlib
+import hashlib
+import os
+import pickle
+import shutil
+
+from .provision import Provisioner, ProvisionStats
+import paths
+import store
+
+
+class TemplateCache:
+    """
+    Caches the managed instance skeleton, i.e. the allowed subset of the base installation, per base installation and
+    allow-list, which includes the JBoss profile, so that managed instances are cloned from it rather than derived
+    from the base installation every time.
+
+    - A manifest records the modification time, size, mode and inode of every directory and file the template was
+      built from. The template is only valid as long as none of those changed, which only requires to `stat()` them
+      rather than walking the base installation. Adding or removing a file changes the modification time of its
+      directory.
+
+    - Templates are built in a staging directory which is then renamed into place while holding the lock of the
+      manifest exclusively. Clones hold it shared so they proceed concurrently and never observe a partial template.
+    """
+    _source : str
+    _allowed : list
+    _key : str
+
+    def __init__(
+            self,
+            source : str,
+            allowed : list,
+    ):
+        """
+        Creates an instance.
+
+        ### Arguments
+        - source : str
+            - Absolute path to the directory the template is derived from.
+        - allowed : list[str]
+            - Glob patterns, relative to `source`, of the paths in the template, see `Provisioner`.
+        """
+        self._source = source
+        self._allowed = list(allowed)
+        self._key = hashlib.sha256("\0".join([ source ] + self._allowed).encode()).hexdigest()[:32]
+
+
+    @staticmethod
+    def cache_dir() -> str:
+        """
+        Returns the absolute path to the template cache.
+
+        ### Returns
+        - Template cache path.
+        """
+        return f"{paths.Paths.caches()}/templates"
+
+
+    def template_dir(
+            self,
+    ) -> str:
+        """
+        Returns the absolute path to the template.
+
+        ### Returns
+        - Template path.
+        """
+        return f"{TemplateCache.cache_dir()}/{self._key}"
+
+
+    def manifest(
+            self,
+    ) -> str:
+        """
+        Returns the absolute path to the manifest of the template.
+
+        ### Returns
+        - Manifest path.
+        """
+        return f"{TemplateCache.cache_dir()}/{self._key}.manifest"
+
+
+    def clone(
+            self,
+            destination : str,
+            link : bool = False,
+    ) -> ProvisionStats:
+        """
+        Creates a managed instance from the template, building it first if it is missing or stale.
+
+        ### Arguments
+        - destination : str
+            - Absolute path to the directory to create.
+        - link : bool
+            - Whether or not to hard link files from the template rather than copying them when possible. The managed
+              instance then shares their content with the template.
+
+        ### Returns
+        - Amount of work performed to clone the template.
+        """
+        while True:
+            with store.Store.locked(self.manifest(), shared = True):
+                if self._is_valid():
+                    return Provisioner(self.template_dir(), [ "*" ], link = link).copy(destination)
+
+            with store.Store.locked(self.manifest()):
+                if not self._is_valid():
+                    self._build()
+
+
+    def _is_valid(
+            self,
+    ) -> bool:
+        """
+        Returns whether or not the template exists and the base installation is unchanged since it was built.
+
+        ### Returns
+        - True if the template can be used, False otherwise.
+        """
+        try:
+            with open(self.manifest(), "rb") as f:
+                manifest = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return False
+        if manifest.get("source") != self._source or manifest.get("allowed") != self._allowed:
+            return False
+        if not os.path.isdir(self.template_dir()):
+            return False
+
+        for path, fingerprint in manifest["entries"].items():
+            try:
+                if TemplateCache._fingerprint(os.stat(f"{self._source}/{path}" if path else self._source)) != fingerprint:
+                    return False
+            except OSError:
+                return False
+
+        return True
+
+
+    def _build(
+            self,
+    ) -> None:
+        """
+        Builds the template and its manifest, replacing any previous one. Must be called with the manifest lock held.
+
+        ### Returns
+        - Nothing.
+        """
+        staging_dir = f"{self.template_dir()}.building"
+        shutil.rmtree(staging_dir, ignore_errors = True)
+
+        # The fingerprints are taken before copying so that changes made while copying invalidate the template
+        provisioner = Provisioner(self._source, self._allowed)
+        entries = { "": TemplateCache._fingerprint(os.stat(self._source)) }
+        for path, entry in provisioner.walk():
+            entries[path] = TemplateCache._fingerprint(entry.stat())
+        provisioner.copy(staging_dir)
+
+        # Invalidate the previous template before replacing it
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(self.manifest())
+        shutil.rmtree(self.template_dir(), ignore_errors = True)
+        os.rename(staging_dir, self.template_dir())
+
+        manifest = {
+            "source": self._source,
+            "allowed": self._allowed,
+            "entries": entries,
+        }
+        store.Store.write(self.manifest(), pickle.dumps(manifest, protocol = pickle.HIGHEST_PROTOCOL), durable = False)
+
+
+    @staticmethod
+    def _fingerprint(
+            stat : os.stat_result,
+    ) -> tuple:
+        """
+        Returns the fingerprint of a file or directory recorded in the manifest.
+
+        ### Returns
+        - Tuple of the modification time, size, mode and inode.
+        """
+        return (stat.st_mtime_ns, stat.st_size, stat.st_mode, stat.st_ino)
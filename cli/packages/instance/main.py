@@ -1,115 +1,328 @@
+import contextlib
 import sys
+import typing
 
+from box import Box
 import typer
 from rich import print
 
 app = typer.Typer(rich_markup_mode="rich")
 
 import instance.impl
+import util
 
 
 #=====
 # Build the CLI
 @app.command()
 def add(
-    name: str = typer.Argument(..., help="Instance name"),
+    name: str = typer.Argument(None, help="Instance name"),
+    manifest: str = typer.Option(None, "--from", help="Add the instances listed in this YAML manifest"),
+    count: int = typer.Option(None, help="Add this many instances named after --prefix and a number"),
+    prefix: str = typer.Option(None, help="Name prefix of the instances added with --count"),
+    parallel: int = typer.Option(instance.impl.InstanceBatch.DEFAULT_PARALLELISM, help="Maximum number of instances to add concurrently"),
+    link: bool = typer.Option(False, help="Hard link the instance assets from the template cache instead of copying them, they are then shared"),
+    output: util.OutputFormat = typer.Option(util.OutputFormat.TABLE, "--output", "-o", help="Output format"),
 ):
     """
     Add instance
     """
-    target = instance.impl.InstanceImpl(name)
-    target.add()
+    selectors = [ x for x in (name, manifest) if x ] + ([ "--count" ] if count is not None else [])
+    if len(selectors) != 1:
+        raise typer.BadParameter("Specify exactly one of an instance name, --from or --count")
+    if (count is None) != (prefix is None):
+        raise typer.BadParameter("--count and --prefix must be specified together")
+
+    if name:
+        instances = [ Box(name = name) ]
+    elif manifest:
+        instances = instance.impl.InstanceBatch.load_manifest(manifest)
+    else:
+        instances = instance.impl.InstanceBatch.numbered(prefix, count)
+
+    writer = util.OutputWriter(output, instance.impl.OperationResult.COLUMNS)
+    listener = (lambda x: writer.write(x.to_dict())) if writer.streaming else None
+    batch = instance.impl.InstanceBatch(parallel = parallel, listener = listener)
+    with _quiet(output):
+        results = batch.add(instances, link = link)
+    _summarize(results, writer, single = name is not None)
 
 
 @app.command()
 def remove(
     name: str = typer.Argument(..., help="Instance name"),
+    output: util.OutputFormat = typer.Option(util.OutputFormat.TABLE, "--output", "-o", help="Output format"),
 ):
     """
     Remove instance
     """
-    target = instance.impl.InstanceImpl(name)
-    target.remove()
+    writer = util.OutputWriter(output, instance.impl.OperationResult.COLUMNS)
+    batch = _batch(name, False, None, 1, writer)
+    with _quiet(output):
+        results = batch.remove()
+    _summarize(results, writer, single = True)
 
 
 @app.command()
 def list(
+    output: util.OutputFormat = typer.Option(util.OutputFormat.TABLE, "--output", "-o", help="Output format"),
 ):
     """
     List known instances
     """
-    instance.impl.InstanceImpl.list()
+    instance.impl.InstanceImpl.list(output)
+
+
+@app.command()
+def migrate(
+    output: util.OutputFormat = typer.Option(util.OutputFormat.TABLE, "--output", "-o", help="Output format"),
+):
+    """
+    Migrate to one configuration and state file per instance
+    """
+    with _quiet(output):
+        result = instance.impl.InstanceImpl.migrate()
+    if output != util.OutputFormat.TABLE:
+        with util.OutputWriter(output, []) as writer:
+            writer.write(result)
+
+
+def _batch(
+    name: str,
+    select_all: bool,
+    match: str,
+    parallel: int,
+    writer: util.OutputWriter,
+    transcript: bool = False,
+):
+    """
+    Creates a batch for the instance selection of a command, a single named instance being a batch of one. With
+    streaming output formats every outcome is written as soon as its operation completes, preceded by its captured
+    output with `transcript`.
+    """
+    selectors = [ x for x in (name, match) if x ] + ([ "--all" ] if select_all else [])
+    if len(selectors) != 1:
+        raise typer.BadParameter("Specify exactly one of an instance name, --all or --match")
+
+    def listener(result):
+        if transcript:
+            _transcript(result)
+        writer.write(result.to_dict())
+
+    return instance.impl.InstanceBatch(
+        names = [ name ] if name else None, pattern = match, select_all = select_all, parallel = parallel,
+        listener = listener if writer.streaming else None)
+
+
+def _transcript(
+    result,
+):
+    """
+    Writes the output captured by an operation under a header naming its instance.
+    """
+    if result.output:
+        typer.echo(f"==> {result.name} <==")
+        typer.echo(result.output)
+
+
+def _summarize(
+    results,
+    writer: util.OutputWriter,
+    single: bool = False,
+):
+    """
+    Writes the outcome of a batch, unless already streamed, and exits with a failure status if any operation failed.
+    The outcome of a `single` named instance is reported by its progress messages with the table output format.
+    """
+    if not single or writer.format != util.OutputFormat.TABLE:
+        if not writer.streaming:
+            for result in results:
+                writer.write(result.to_dict())
+        writer.close()
+    if not all(x.success for x in results):
+        raise typer.Exit(code = 1)
+
+
+def _quiet(
+    output: util.OutputFormat,
+):
+    """
+    Redirects progress messages to standard error so that standard output only holds machine readable output.
+    """
+    if output == util.OutputFormat.TABLE:
+        return contextlib.nullcontext()
+    return contextlib.redirect_stdout(sys.stderr)
+
+
+def _single(
+    operation,
+    output: util.OutputFormat,
+):
+    """
+    Performs an interactive operation against a single named instance, which cannot be performed by a batch. Its
+    outcome is reported by its progress messages with the table output format, otherwise it is written in the output
+    format. Returns the outcome.
+    """
+    with _quiet(output):
+        result = operation()
+    if output != util.OutputFormat.TABLE:
+        with util.OutputWriter(output, instance.impl.OperationResult.COLUMNS) as writer:
+            writer.write(result.to_dict())
+    return result
 
 
 @app.command()
 def start(
-    name: str = typer.Argument(..., help="Instance name"),
+    name: str = typer.Argument(None, help="Instance name"),
+    select_all: bool = typer.Option(False, "--all", help="Start all instances"),
+    match: str = typer.Option(None, help="Start instances whose name matches this glob pattern"),
+    parallel: int = typer.Option(instance.impl.InstanceBatch.DEFAULT_PARALLELISM, help="Maximum number of instances to start concurrently"),
     background: bool = typer.Option(True, help="Start in the background detached from the TTY"),
+    wait_ready: bool = typer.Option(False, help="Wait until the server log reports that the boot completed"),
+    ready_timeout: float = typer.Option(instance.impl.ReadinessWatcher.DEFAULT_TIMEOUT, help="Seconds every instance is given to boot with --wait-ready"),
+    output: util.OutputFormat = typer.Option(util.OutputFormat.TABLE, "--output", "-o", help="Output format"),
 ):
     """
     Start instance
     """
-    target = instance.impl.InstanceImpl(name)
-    target.start(background = background)
+    if wait_ready and not background:
+        raise typer.BadParameter("--wait-ready requires starting in the background")
+    writer = util.OutputWriter(output, instance.impl.OperationResult.COLUMNS)
+    batch = _batch(name, select_all, match, parallel, writer)
+    if not background:
+        if not name:
+            raise typer.BadParameter("--no-background requires an instance name")
+        # The instance is attached to the TTY until it exits, it is not a lifecycle operation of the manager
+        target = instance.impl.InstanceImpl(name)
+        _single(lambda: target.start(background = False), output)
+        return
+    with _quiet(output):
+        results = batch.start(wait_ready = wait_ready, ready_timeout = ready_timeout)
+    _summarize(results, writer, single = name is not None)
 
 
 @app.command()
 def stop(
-    name: str = typer.Argument(..., help="Instance name"),
+    name: str = typer.Argument(None, help="Instance name"),
+    select_all: bool = typer.Option(False, "--all", help="Stop all instances"),
+    match: str = typer.Option(None, help="Stop instances whose name matches this glob pattern"),
+    parallel: int = typer.Option(instance.impl.InstanceBatch.DEFAULT_PARALLELISM, help="Maximum number of instances to stop concurrently"),
+    output: util.OutputFormat = typer.Option(util.OutputFormat.TABLE, "--output", "-o", help="Output format"),
 ):
     """
     Stop instance
     """
-    target = instance.impl.InstanceImpl(name)
-    target.stop()
+    writer = util.OutputWriter(output, instance.impl.OperationResult.COLUMNS)
+    batch = _batch(name, select_all, match, parallel, writer)
+    with _quiet(output):
+        results = batch.stop()
+    _summarize(results, writer, single = name is not None)
 
 
 @app.command()
 def restart(
-    name: str = typer.Argument(..., help="Instance name"),
+    name: str = typer.Argument(None, help="Instance name"),
+    select_all: bool = typer.Option(False, "--all", help="Restart all instances"),
+    match: str = typer.Option(None, help="Restart instances whose name matches this glob pattern"),
+    parallel: int = typer.Option(instance.impl.InstanceBatch.DEFAULT_PARALLELISM, help="Maximum number of instances to restart concurrently"),
+    output: util.OutputFormat = typer.Option(util.OutputFormat.TABLE, "--output", "-o", help="Output format"),
 ):
     """
     Restart instance
     """
-    target = instance.impl.InstanceImpl(name)
-    target.restart()
+    writer = util.OutputWriter(output, instance.impl.OperationResult.COLUMNS)
+    batch = _batch(name, select_all, match, parallel, writer)
+    with _quiet(output):
+        results = batch.restart()
+    _summarize(results, writer, single = name is not None)
+
+
+@app.command("rolling-restart")
+def rolling_restart(
+    select_all: bool = typer.Option(False, "--all", help="Restart all instances"),
+    match: str = typer.Option(None, help="Restart instances whose name matches this glob pattern"),
+    max_unavailable: int = typer.Option(1, help="Maximum number of instances restarting at once"),
+    ready_timeout: float = typer.Option(instance.impl.ReadinessWatcher.DEFAULT_TIMEOUT, help="Seconds every instance is given to boot"),
+    output: util.OutputFormat = typer.Option(util.OutputFormat.TABLE, "--output", "-o", help="Output format"),
+):
+    """
+    Restart instances a few at a time, each once the previous ones are ready, aborting on the first failure
+    """
+    if select_all == bool(match):
+        raise typer.BadParameter("Specify exactly one of --all or --match")
+    writer = util.OutputWriter(output, instance.impl.OperationResult.COLUMNS)
+    batch = _batch(None, select_all, match, max_unavailable, writer)
+    with _quiet(output):
+        results = batch.rolling_restart(max_unavailable = max_unavailable, ready_timeout = ready_timeout)
+    _summarize(results, writer)
 
 
 @app.command()
 def status(
     name: str = typer.Argument(..., help="Instance name"),
+    output: util.OutputFormat = typer.Option(util.OutputFormat.TABLE, "--output", "-o", help="Output format"),
 ):
     """
     Show instance status
     """
-    target = instance.impl.InstanceImpl(name)
-    target.status()
+    writer = util.OutputWriter(output, instance.impl.OperationResult.COLUMNS)
+    batch = _batch(name, False, None, 1, writer)
+    with _quiet(output):
+        results = batch.status()
+    _summarize(results, writer, single = True)
 
 
 @app.command()
 def kill(
     name: str = typer.Argument(..., help="Instance name"),
+    output: util.OutputFormat = typer.Option(util.OutputFormat.TABLE, "--output", "-o", help="Output format"),
 ):
     """
     Forcefully stop an instance
     """
-    target = instance.impl.InstanceImpl(name)
-    target.kill()
+    writer = util.OutputWriter(output, instance.impl.OperationResult.COLUMNS)
+    batch = _batch(name, False, None, 1, writer)
+    with _quiet(output):
+        results = batch.kill()
+    _summarize(results, writer, single = True)
 
 
-# TODO Make `command` multi-value
 # TODO Make `command` and `file` mutually exclusive
 @app.command()
 def cli(
-    name: str = typer.Argument(..., help="Instance name"),
-    command: str = typer.Option(None, help="Command to execute"),
+    name: str = typer.Argument(None, help="Instance name"),
+    select_all: bool = typer.Option(False, "--all", help="Execute commands against all instances"),
+    match: str = typer.Option(None, help="Execute commands against instances whose name matches this glob pattern"),
+    parallel: int = typer.Option(instance.impl.InstanceBatch.DEFAULT_PARALLELISM, help="Maximum number of instances to execute commands against concurrently"),
+    command: typing.List[str] = typer.Option(None, help="Command to execute, may be repeated"),
     file: str = typer.Option(None, help="File containing commands to execute"),
+    timeout: float = typer.Option(instance.impl.CliSession.DEFAULT_TIMEOUT, help="Seconds the commands are given to complete per instance"),
+    output: util.OutputFormat = typer.Option(util.OutputFormat.TABLE, "--output", "-o", help="Output format"),
 ):
     """
-    Execute commands against an instance
+    Execute commands against instances, with the CLI sessions the daemon keeps for them when running
     """
-    target = instance.impl.InstanceImpl(name)
-    target.cli(command, file)
+    writer = util.OutputWriter(output, instance.impl.OperationResult.COLUMNS)
+    human = output in (util.OutputFormat.TABLE, util.OutputFormat.TEXT)
+    batch = _batch(name, select_all, match, parallel, writer, transcript = human)
+    if not command and file is None:
+        if not name:
+            raise typer.BadParameter("Specify --command or --file with --all or --match")
+        # The interactive session is attached to the TTY until it exits, it is not a lifecycle operation of the manager
+        target = instance.impl.InstanceImpl(name)
+        result = _single(target.cli, output)
+        if not result.success:
+            raise typer.Exit(code = 1)
+        return
+    with _quiet(output):
+        results = batch.cli(command, file, timeout = timeout)
+    if human and not writer.streaming:
+        for result in results:
+            _transcript(result)
+    if human and not name:
+        succeeded = sum(1 for x in results if x.success)
+        typer.echo(f"Commands succeeded against {succeeded} of {len(results)} instance(s)")
+    _summarize(results, writer, single = name is not None)
 #-----
 
 
@@ -1,15 +1,29 @@
-from box import Box
-from jsonschema import validate
+from box import Box, BoxList
+import contextlib
+import hashlib
 import os
+import pickle
+import shutil
 import yaml
 
 import paths
+import schema
+import store
 
 
 class Config:
     """
     Represents managed instance configuration et al. Responsible for persistence of the backing YAML file for
     the configuration.
+
+    Managed instances added and removed through `add_instance()` and `remove_instance()` are recorded and re-applied
+    on top of the latest persisted configuration when saving, under the lock of the backing YAML file, so that
+    concurrent invocations never lose each other's managed instances.
+
+    The configuration may alternatively use a sharded layout, see `is_sharded()`, where the backing YAML file only
+    holds the paths and the defaults and every managed instance is held in its own file in `conf_dir()`. Managed
+    instances are then only read and written on demand, one file each, and the defaults are merged into them when
+    their lifecycle operations are composed.
     """
     def __init__(
             self,
@@ -47,45 +61,274 @@ class Config:
         return f"{paths.Paths.configs()}/config.yaml"
 
 
+    @staticmethod
+    def conf_dir() -> str:
+        """
+        Returns the absolute path to the managed instance configurations of the sharded layout.
+
+        ### Returns
+        - Managed instance configurations path.
+        """
+        return f"{paths.Paths.configs()}/conf.d"
+
+
+    @staticmethod
+    def shard(
+            name : str,
+    ) -> str:
+        """
+        Returns the absolute path to the configuration of a managed instance in the sharded layout.
+
+        ### Arguments
+        - name : str
+            - Managed instance name.
+
+        ### Returns
+        - Managed instance configuration path.
+        """
+        return f"{Config.conf_dir()}/{name}.yaml"
+
+
+    @staticmethod
+    def snapshot() -> str:
+        """
+        Returns the absolute path to the binary snapshot of the parsed and validated configuration.
+
+        ### Returns
+        - Configuration snapshot path.
+        """
+        return f"{paths.Paths.configs()}/.config.yaml.snapshot"
+
+
     @classmethod
     def load(cls):
         """
         Loads the configuration, validates it against the configuration schema and returns the result as a dynamic object.
 
+        The parsed and validated configuration is snapshotted next to it and the snapshot is used instead of parsing
+        the configuration as long as its modification time, size and content hash are unchanged.
+
         ### Returns
         - Configuration with its backing data populated.
         """
         result : Config = None
 
-        # Load schema
-        with open(Config.schema(), "r") as f:
-            schema = yaml.safe_load(f)
-
-        # Load configuration and validate against schema
-        conf_data = {}
-        try:
-            with open(Config.config(), "r") as f:
-                conf_data = yaml.safe_load(f)
-            validate(conf_data, schema)
-        except FileNotFoundError:
-            # Config file does not exist
-            conf_data = {
-                "paths": {
-                    "jboss": "/opt/jboss",
-                    "instances": "/opt/app/jboss",
-                    "run": "/var/run/jboss",
-                },
-                "defaults": {
-                    "jboss": {
-                        "profile": "standalone-full.xml",
+        # Load configuration and validate against schema, unless this exact content was validated already
+        conf_data = store.Memo.get(Config.config())
+        if conf_data is None:
+            try:
+                conf_data = Config._read()
+                store.Memo.put(Config.config(), conf_data)
+            except FileNotFoundError:
+                # Config file does not exist
+                conf_data = {
+                    "paths": {
+                        "jboss": "/opt/jboss",
+                        "instances": "/opt/app/jboss",
+                        "run": "/var/run/jboss",
                     },
-                },
-                "instances": [],
-            }
+                    "defaults": {
+                        "jboss": {
+                            "profile": "standalone-full.xml",
+                        },
+                    },
+                    "instances": [],
+                }
 
-        result = Config(**Box(conf_data))
+        # Converting every managed instance to a dynamic object is costly for large configurations so it is deferred
+        # until the managed instances are actually accessed. In the sharded layout they are read on demand instead.
+        entries = { k: Box(v) if isinstance(v, dict) else v for k, v in conf_data.items() if k != "instances" }
+        if os.path.isdir(Config.conf_dir()):
+            result = Config(**entries, _sharded = True, _records = dict(), _changes = dict())
+        else:
+            result = Config(**entries, _instances_data = conf_data.get("instances", []))
 
         return result
+
+
+    def __getattr__(
+            self,
+            name : str,
+    ) -> object:
+        """
+        Converts the managed instances to dynamic objects upon first access.
+
+        ### Arguments
+        - name : str
+            - Member name.
+
+        ### Returns
+        - Member value.
+        """
+        if name == "instances" and self.is_sharded():
+            self.instances = BoxList(self.instance(x) for x in self.instance_names())
+            return self.instances
+        if name == "instances" and "_instances_data" in self.__dict__:
+            self.instances = BoxList(self.__dict__.pop("_instances_data"))
+            self.__dict__.pop("_records", None)
+            return self.instances
+        raise AttributeError(name)
+
+
+    def is_sharded(
+            self,
+    ) -> bool:
+        """
+        Returns whether or not this configuration uses the sharded layout, which is the case when `conf_dir()` exists.
+
+        ### Returns
+        - True if the configuration is sharded, False otherwise.
+        """
+        return self.__dict__.get("_sharded", False)
+
+
+    def instance(
+            self,
+            name : str,
+    ) -> Box:
+        """
+        Returns the configuration of a managed instance using the name index.
+
+        Should the managed instances not have been accessed yet then only the requested one is converted to a dynamic
+        object. Such a record is meant for reading only; use `add_instance()` and `remove_instance()` to mutate the
+        managed instances.
+
+        ### Arguments
+        - name : str
+            - Managed instance name.
+
+        ### Returns
+        - Managed instance configuration or `None` if there is no such managed instance.
+        """
+        if self.is_sharded():
+            if name not in self._records:
+                self._records[name] = Config._read_shard(name)
+            return self._records[name]
+
+        position = self._instance_index().get(name)
+        if position is None:
+            return None
+        if "_instances_data" not in self.__dict__:
+            return self.instances[position]
+
+        records = self.__dict__.setdefault("_records", dict())
+        if name not in records:
+            records[name] = Box(self._instances_data[position])
+        return records[name]
+
+
+    def add_instance(
+            self,
+            instance : Box,
+    ) -> Box:
+        """
+        Adds a managed instance to the configuration and the name index.
+
+        ### Arguments
+        - instance : Box
+            - Managed instance configuration, it must at least have a name.
+
+        ### Returns
+        - Managed instance configuration as stored in the configuration.
+
+        ### Raises
+        - NameError
+            - If a managed instance with the same name already exists.
+        """
+        if self.is_sharded():
+            if self.instance(instance.name) is not None:
+                raise NameError(instance.name, f"Instance {instance.name} already exists")
+            self._records[instance.name] = instance
+            self._changes[instance.name] = instance
+            if "instances" in self.__dict__:
+                self.instances.append(instance)
+            return instance
+
+        index = self._instance_index()
+        if instance.name in index:
+            raise NameError(instance.name, f"Instance {instance.name} already exists")
+
+        self.instances.append(instance)
+        index[instance.name] = len(self.instances) - 1
+        self._changes[instance.name] = self.instances[-1]
+
+        return self.instances[-1]
+
+
+    def remove_instance(
+            self,
+            name : str,
+    ) -> bool:
+        """
+        Removes a managed instance from the configuration and the name index.
+
+        ### Arguments
+        - name : str
+            - Managed instance name.
+
+        ### Returns
+        - True if the managed instance was removed, False if there is no such managed instance.
+        """
+        if self.is_sharded():
+            if self.instance(name) is None:
+                return False
+            self._records[name] = None
+            self._changes[name] = None
+            if "instances" in self.__dict__:
+                self.instances = BoxList(x for x in self.instances if x.name != name)
+            return True
+
+        index = self._instance_index()
+        position = index.pop(name, None)
+        if position is None:
+            return False
+        self._changes[name] = None
+
+        del self.instances[position]
+        for k, v in index.items():
+            if v > position:
+                index[k] = v - 1
+
+        return True
+
+
+    def instance_names(
+            self,
+    ) -> list:
+        """
+        Returns the names of all managed instances without requiring them to be converted to dynamic objects.
+
+        ### Returns
+        - List of managed instance names in configuration order, sorted by name in the sharded layout.
+        """
+        if self.is_sharded():
+            names = { x.removesuffix(".yaml") for x in os.listdir(Config.conf_dir()) if x.endswith(".yaml") }
+            for name, instance in self._changes.items():
+                if instance is None:
+                    names.discard(name)
+                else:
+                    names.add(name)
+            return sorted(names)
+        if "_instances_data" in self.__dict__:
+            return [ x["name"] for x in self._instances_data ]
+        return [ x.name for x in self.instances ]
+
+
+    def _instance_index(
+            self,
+    ) -> dict:
+        """
+        Returns the name index of the managed instances, building it upon first use.
+
+        ### Returns
+        - Dictionary of managed instance name to its position in the managed instances.
+        """
+        index = self.__dict__.get("_index")
+        if index is None:
+            index = { name: i for i, name in enumerate(self.instance_names()) }
+            self._index = index
+            self._changes = dict()
+        return index
     
 
     def save(
@@ -94,8 +337,341 @@ class Config:
         """
         Saves the configuration.
 
+        Under the lock of the backing YAML file the latest persisted configuration is reloaded, the managed instances
+        added and removed through this configuration are applied on top of it and the result is atomically written.
+        This configuration then reflects the saved managed instances.
+
+        In the sharded layout only the files of the added and removed managed instances are written or removed.
+
         ### Returns
         - Nothing.
+
+        ### Raises
+        - RuntimeError
+            - If this configuration belongs to a transaction, it is then saved when the transaction completes.
+        """
+        if "_transaction" in self.__dict__:
+            raise RuntimeError("Configuration is saved when its transaction completes")
+
+        if self.is_sharded():
+            self._save_shards()
+            return
+
+        with store.Store.locked(Config.config()):
+            current = Config.load()
+            for name, instance in self.__dict__.get("_changes", dict()).items():
+                current.remove_instance(name)
+                if instance is not None:
+                    current.add_instance(instance)
+
+            data = { k: v for k, v in vars(self).items() if not k.startswith("_") and k != "instances" }
+            data["instances"] = current.instances
+            store.Store.write(Config.config(), Config._dump(data))
+
+            for k in ("_instances_data", "_records", "_index", "_changes"):
+                self.__dict__.pop(k, None)
+            self.instances = current.instances
+
+
+    @classmethod
+    @contextlib.contextmanager
+    def transaction(cls):
+        """
+        Context manager providing a configuration to mutate freely, including modifying managed instances in place,
+        which is validated and written once when the context exits. The lock of the backing YAML file is held for the
+        duration of the context so no concurrent change can be lost, and nothing is written should the context exit
+        with an exception.
+
+        In the sharded layout only the files of the managed instances that were added, removed or modified are written.
+
+        ### Returns
+        - Configuration to mutate.
+
+        ### Raises
+        - jsonschema.ValidationError
+            - If the mutated configuration is not valid, nothing is written then.
         """
-        os.makedirs(os.path.dirname(Config.config()), exist_ok = True)
-        Box(vars(self)).to_yaml(filename = self.config(), indent = 2, sort_keys = False, default_flow_style = False)
+        with store.Store.locked(Config.config()):
+            conf = Config.load()
+            conf._transaction = True
+            if not conf.is_sharded():
+                # Managed instances modified in place must be part of the configuration being written
+                conf.instances
+            yield conf
+            del conf._transaction
+            conf._commit()
+
+
+    @classmethod
+    def migrate(
+            cls,
+    ) -> int:
+        """
+        Converts the monolithic configuration to the sharded layout. Every managed instance is written to its own file
+        in a staging directory which is then renamed to `conf_dir()`, thereby switching layouts atomically, after which
+        the managed instances are dropped from the backing YAML file.
+
+        ### Returns
+        - Number of managed instances migrated.
+
+        ### Raises
+        - ValueError
+            - If the configuration is sharded already.
+        """
+        with store.Store.locked(Config.config()):
+            conf = Config.load()
+            if conf.is_sharded():
+                raise ValueError("Configuration is sharded already")
+
+            staging_dir = f"{Config.conf_dir()}.migrating"
+            shutil.rmtree(staging_dir, ignore_errors = True)
+            os.makedirs(staging_dir)
+            for instance in conf.instances:
+                store.Store.write(f"{staging_dir}/{instance.name}.yaml", Config._dump(instance))
+            os.rename(staging_dir, Config.conf_dir())
+
+            data = { k: v for k, v in vars(conf).items() if not k.startswith("_") and k != "instances" }
+            store.Store.write(Config.config(), Config._dump(data))
+
+            return len(conf.instances)
+
+
+    def _commit(
+            self,
+    ) -> None:
+        """
+        Validates and writes whatever changed in this configuration. Must be called with the lock of the backing YAML
+        file held.
+
+        ### Returns
+        - Nothing.
+        """
+        conf_schema = schema.Schema.load(Config.schema())
+
+        data = { k: v for k, v in vars(self).items() if not k.startswith("_") }
+        if self.is_sharded():
+            data.pop("instances", None)
+        document = Box(data).to_dict()
+        content = Config._dump(document)
+        changed = content.encode() != Config._read_file(Config.config())
+        if changed:
+            conf_schema.validate(document)
+
+        # Everything is validated before anything is written so that an invalid managed instance leaves no trace
+        staged = []
+        if self.is_sharded():
+            for name, instance in self._records.items():
+                if instance is None or name in self._changes:
+                    continue
+                if Config._dump(instance).encode() != Config._read_file(Config.shard(name)):
+                    self._changes[name] = instance
+            staged = self._stage_shards()
+
+        if changed:
+            store.Store.write(Config.config(), content)
+            conf_schema.record(Config.config(), content.encode())
+        self._write_shards(staged)
+
+
+    @staticmethod
+    def _read_file(
+            path : str,
+    ) -> bytes:
+        """
+        Reads a file.
+
+        ### Returns
+        - File content or `None` if there is no such file.
+        """
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+
+    def _save_shards(
+            self,
+    ) -> None:
+        """
+        Saves the added and removed managed instances in the sharded layout. As every managed instance has its own
+        file which is atomically replaced no lock is needed. Nothing is written unless every added managed instance is
+        valid.
+
+        ### Returns
+        - Nothing.
+        """
+        self._write_shards(self._stage_shards())
+
+
+    def _stage_shards(
+            self,
+    ) -> list:
+        """
+        Validates and serializes the added and removed managed instances without writing anything.
+
+        ### Returns
+        - List of tuples of the managed instance name and the content of its file, `None` when removed.
+
+        ### Raises
+        - jsonschema.ValidationError
+            - If an added managed instance is not valid.
+        """
+        conf_schema = schema.Schema.load(Config.schema())
+        result = []
+        for name, instance in self._changes.items():
+            content = None
+            if instance is not None:
+                data = Box(instance).to_dict()
+                conf_schema.validate(data, definition = "Instance")
+                content = Config._dump(data)
+            result.append((name, content))
+
+        return result
+
+
+    def _write_shards(
+            self,
+            staged : list,
+    ) -> None:
+        """
+        Writes the managed instance files validated by `_stage_shards()`.
+
+        ### Arguments
+        - staged : list[tuple]
+            - Managed instance names and the content of their file, `None` to remove it.
+
+        ### Returns
+        - Nothing.
+        """
+        conf_schema = schema.Schema.load(Config.schema())
+        for name, content in staged:
+            if content is None:
+                try:
+                    os.unlink(Config.shard(name))
+                except FileNotFoundError:
+                    pass
+                continue
+            store.Store.write(Config.shard(name), content)
+            conf_schema.record(Config.shard(name), content.encode(), definition = "Instance")
+        self._changes = dict()
+
+
+    @staticmethod
+    def _read() -> dict:
+        """
+        Reads the configuration and validates it against the configuration schema, unless the snapshot holds this
+        exact content already.
+
+        ### Returns
+        - Parsed configuration.
+
+        ### Raises
+        - FileNotFoundError
+            - If there is no configuration.
+        """
+        with open(Config.config(), "rb") as f:
+            stat = os.fstat(f.fileno())
+            content = f.read()
+        fingerprint = {
+            "mtime_ns": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "digest": hashlib.sha256(content).hexdigest(),
+        }
+        snapshot = Config._read_snapshot()
+        if snapshot and snapshot["fingerprint"] == fingerprint:
+            return snapshot["data"]
+
+        result = yaml.load(content, Loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader))
+        schema.Schema.load(Config.schema()).validate(result, path = Config.config(), content = content)
+        Config._write_snapshot({ "fingerprint": fingerprint, "data": result })
+
+        return result
+
+
+    @staticmethod
+    def _read_shard(
+            name : str,
+    ) -> Box:
+        """
+        Reads and validates the configuration of a managed instance in the sharded layout.
+
+        ### Arguments
+        - name : str
+            - Managed instance name.
+
+        ### Returns
+        - Managed instance configuration or `None` if there is none.
+        """
+        try:
+            with open(Config.shard(name), "rb") as f:
+                content = f.read()
+        except FileNotFoundError:
+            return None
+        data = yaml.load(content, Loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader))
+        schema.Schema.load(Config.schema()).validate(
+            data, path = Config.shard(name), content = content, definition = "Instance")
+        return Box(data)
+
+
+    @staticmethod
+    def _dump(
+            data : dict,
+    ) -> str:
+        """
+        Serializes configuration to YAML.
+
+        ### Returns
+        - YAML document.
+        """
+        return yaml.dump(
+            Box(data).to_dict(),
+            Dumper = getattr(yaml, "CSafeDumper", yaml.SafeDumper),
+            indent = 2,
+            sort_keys = False,
+            default_flow_style = False,
+        )
+
+
+    @staticmethod
+    def _read_snapshot() -> dict:
+        """
+        Reads the configuration snapshot. A snapshot that cannot be read back, being truncated, corrupted or written
+        by an incompatible version, is removed so that the configuration is parsed again and a new one written.
+
+        ### Returns
+        - Snapshot or `None` if there is no usable one.
+        """
+        try:
+            with open(Config.snapshot(), "rb") as f:
+                snapshot = pickle.load(f)
+            return { "fingerprint": snapshot["fingerprint"], "data": snapshot["data"] }
+        except FileNotFoundError:
+            return None
+        except Exception:
+            try:
+                os.unlink(Config.snapshot())
+            except OSError:
+                pass
+            return None
+
+
+    @staticmethod
+    def _write_snapshot(
+            snapshot : dict,
+    ) -> None:
+        """
+        Writes the configuration snapshot. The snapshot is an optimization only so failing to write it is silently
+        ignored.
+
+        ### Arguments
+        - snapshot : dict
+            - Fingerprint of the configuration file together with its parsed data.
+
+        ### Returns
+        - Nothing.
+        """
+        try:
+            store.Store.write(Config.snapshot(), pickle.dumps(snapshot, protocol = pickle.HIGHEST_PROTOCOL), durable = False)
+        except OSError:
+            pass
@@ -24,6 +24,24 @@ class Paths:
             Paths._home = path
         return Paths._home
 
+    def caches() -> str:
+        """
+        Returns the absolute path to cache resources. Everything in it may be safely removed at any time.
+
+        ### Returns
+        - Path to cache resources.
+        """
+        return f"{Paths.resources()}/cache"
+
+    def daemon() -> str:
+        """
+        Returns the absolute path to the runtime resources of the daemon, i.e. its socket, lock and log.
+
+        ### Returns
+        - Path to daemon resources.
+        """
+        return f"{Paths.resources()}/daemon"
+
     def configs() -> str:
         """
         Returns the absolute path to configuration resources.
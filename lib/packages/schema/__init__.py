@@ -0,0 +1,3 @@
+__version__ = "0.0.1"
+
+from .main import Schema as Schema
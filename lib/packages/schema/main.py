@@ -0,0 +1,293 @@
+import hashlib
+import os
+import pickle
+import yaml
+
+import paths
+import store
+
+
+class Schema:
+    """
+    JSON schema validation with caching.
+
+    - The parsed schema is cached on disk keyed by the modification time, size and content hash of the schema file so
+      that the schema YAML is only parsed, and the schema itself only checked, when it actually changes.
+
+    - The compiled validator is built once per schema file and process, upon first use. `jsonschema` is therefore only
+      imported when a document actually needs validating.
+
+    - Documents are only validated when their content changed since their last successful validation against the same
+      schema, as recorded on disk per document path.
+    """
+    _path : str
+    _schema : dict
+    _digest : str
+    _validator : object
+    _definitions : dict
+
+    _loaded : dict = dict()
+
+    def __init__(
+            self,
+            path : str,
+            schema : dict,
+            digest : str,
+    ):
+        """
+        Creates an instance.
+
+        ### Arguments
+        - path : str
+            - Absolute path to the schema file.
+        - schema : dict
+            - Parsed schema.
+        - digest : str
+            - Content hash of the schema file.
+        """
+        self._path = path
+        self._schema = schema
+        self._digest = digest
+        self._validator = None
+        self._definitions = dict()
+
+
+    @classmethod
+    def load(
+            cls,
+            path : str,
+    ):
+        """
+        Loads a schema, from the cache when possible.
+
+        ### Arguments
+        - path : str
+            - Absolute path to the schema file.
+
+        ### Returns
+        - Schema ready for validation.
+        """
+        stat = os.stat(path)
+        key = (path, stat.st_mtime_ns, stat.st_size)
+        result = cls._loaded.get(key)
+        if result is not None:
+            return result
+
+        # Use the parsed schema from the cache when the schema file is unchanged
+        cache_file = f"{Schema._cache_dir()}/{os.path.basename(path)}.pickle"
+        cached = Schema._read_cache(cache_file)
+        if cached and (cached["mtime_ns"], cached["size"]) == (stat.st_mtime_ns, stat.st_size):
+            result = Schema(path, cached["schema"], cached["digest"])
+        else:
+            with open(path, "rb") as f:
+                content = f.read()
+            digest = hashlib.sha256(content).hexdigest()
+            if cached and cached["digest"] == digest:
+                schema = cached["schema"]
+            else:
+                from jsonschema import validators
+
+                schema = yaml.safe_load(content)
+                validators.validator_for(schema).check_schema(schema)
+            result = Schema(path, schema, digest)
+            Schema._write_cache(cache_file, {
+                "mtime_ns": stat.st_mtime_ns,
+                "size": stat.st_size,
+                "digest": digest,
+                "schema": schema,
+            })
+
+        cls._loaded[key] = result
+
+        return result
+
+
+    @property
+    def digest(
+            self,
+    ) -> str:
+        """
+        Returns the content hash of the schema file.
+
+        ### Returns
+        - Hexadecimal SHA-256 digest.
+        """
+        return self._digest
+
+
+    def validate(
+            self,
+            data : object,
+            path : str = None,
+            content : bytes = None,
+            definition : str = None,
+    ) -> None:
+        """
+        Validates a document against this schema. If both `path` and `content` are provided then validation is skipped
+        when the same content of the document at `path` was previously successfully validated against this schema.
+
+        ### Arguments
+        - data : object
+            - Parsed document to validate.
+        - path : str
+            - Absolute path to the document.
+        - content : bytes
+            - Raw content of the document that `data` was parsed from.
+        - definition : str
+            - Name of the type, from the schema `$defs`, to validate the document against instead of the whole schema.
+
+        ### Returns
+        - Nothing.
+
+        ### Raises
+        - jsonschema.ValidationError
+            - If the document is not valid.
+        """
+        if path is None or content is None:
+            self._compiled(definition).validate(data)
+            return
+
+        marker_file, marker = self._marker(path, content, definition)
+        try:
+            with open(marker_file, "r") as f:
+                if f.read() == marker:
+                    return
+        except OSError:
+            pass
+
+        self._compiled(definition).validate(data)
+
+        Schema._write_file(marker_file, marker.encode())
+
+
+    def record(
+            self,
+            path : str,
+            content : bytes,
+            definition : str = None,
+    ) -> None:
+        """
+        Records that the content of the document at `path` is valid against this schema without validating it. This
+        is meant for documents composed exclusively of previously validated parts, such as when saving.
+
+        ### Arguments
+        - path : str
+            - Absolute path to the document.
+        - content : bytes
+            - Raw content of the document.
+        - definition : str
+            - Name of the type, from the schema `$defs`, the document is valid against instead of the whole schema.
+
+        ### Returns
+        - Nothing.
+        """
+        marker_file, marker = self._marker(path, content, definition)
+        Schema._write_file(marker_file, marker.encode())
+
+
+    def _compiled(
+            self,
+            definition : str = None,
+    ) -> object:
+        """
+        Returns the compiled validator for the whole schema or for a type from the schema `$defs`, building it upon
+        first use.
+
+        ### Arguments
+        - definition : str
+            - Type name or `None` for the whole schema.
+
+        ### Returns
+        - Compiled validator.
+        """
+        from jsonschema import validators
+
+        if definition is None:
+            if self._validator is None:
+                self._validator = validators.validator_for(self._schema)(self._schema)
+            return self._validator
+
+        result = self._definitions.get(definition)
+        if result is None:
+            schema = { "$ref": f"#/$defs/{definition}", "$defs": self._schema.get("$defs", dict()) }
+            result = validators.validator_for(self._schema)(schema)
+            self._definitions[definition] = result
+        return result
+
+
+    def _marker(
+            self,
+            path : str,
+            content : bytes,
+            definition : str,
+    ) -> tuple:
+        """
+        Returns the validation marker for a document.
+
+        ### Returns
+        - Tuple of the marker file path and the marker content.
+        """
+        key = path if definition is None else f"{path}#{definition}"
+        marker_file = f"{Schema._cache_dir()}/validated/{hashlib.sha256(key.encode()).hexdigest()}"
+        marker = f"{self._digest} {hashlib.sha256(content).hexdigest()}"
+        return marker_file, marker
+
+
+    @staticmethod
+    def _cache_dir() -> str:
+        """
+        Returns the absolute path to the schema cache.
+
+        ### Returns
+        - Schema cache path.
+        """
+        return f"{paths.Paths.caches()}/schema"
+
+
+    @staticmethod
+    def _read_cache(
+            cache_file : str,
+    ) -> dict:
+        """
+        Reads a cached schema.
+
+        ### Returns
+        - Cache entry or `None` if there is no usable one.
+        """
+        try:
+            with open(cache_file, "rb") as f:
+                return pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            return None
+
+
+    @staticmethod
+    def _write_cache(
+            cache_file : str,
+            entry : dict,
+    ) -> None:
+        """
+        Writes a cached schema.
+
+        ### Returns
+        - Nothing.
+        """
+        Schema._write_file(cache_file, pickle.dumps(entry, protocol = pickle.HIGHEST_PROTOCOL))
+
+
+    @staticmethod
+    def _write_file(
+            path : str,
+            content : bytes,
+    ) -> None:
+        """
+        Replaces a cache file. Caches are an optimization only so failing to write them, e.g. on a read-only
+        installation, is silently ignored.
+
+        ### Returns
+        - Nothing.
+        """
+        try:
+            store.Store.write(path, content, durable = False)
+        except OSError:
+            pass
@@ -0,0 +1,4 @@
+__version__ = "0.0.1"
+
+from .main import Store as Store
+from .main import Memo as Memo
@@ -0,0 +1,219 @@
+import contextlib
+import fcntl
+import os
+import pickle
+import stat
+import tempfile
+import threading
+
+
+class Store:
+    """
+    Crash-safe persistence of backing files.
+
+    - Writers serialize through an advisory `fcntl` lock held on a sibling `.lock` file so that a read-modify-write
+      cycle performed under the lock never loses the updates of a concurrent writer.
+
+    - Files are never rewritten in place. The new content is written to a temporary file in the same directory,
+      flushed to disk and then renamed over the original so readers, which do not need the lock, always observe either
+      the previous or the new content and never a truncated file.
+    """
+
+    @staticmethod
+    def lock_file(
+            path : str,
+    ) -> str:
+        """
+        Returns the absolute path to the lock file guarding a backing file.
+
+        ### Arguments
+        - path : str
+            - Absolute path to the backing file.
+
+        ### Returns
+        - Lock file path.
+        """
+        return f"{path}.lock"
+
+
+    @staticmethod
+    @contextlib.contextmanager
+    def locked(
+            path : str,
+            shared : bool = False,
+            blocking : bool = True,
+    ):
+        """
+        Context manager holding the advisory lock of a backing file for its duration.
+
+        ### Arguments
+        - path : str
+            - Absolute path to the backing file.
+        - shared : bool
+            - Whether to acquire a shared lock rather than an exclusive one.
+        - blocking : bool
+            - Whether to wait for the lock to be available rather than failing immediately.
+
+        ### Returns
+        - Nothing.
+
+        ### Raises
+        - BlockingIOError
+            - If `blocking` is False and the lock is held by another process.
+        """
+        lock_file = Store.lock_file(path)
+        os.makedirs(os.path.dirname(lock_file), exist_ok = True)
+        fd = os.open(lock_file, os.O_RDWR | os.O_CREAT | os.O_CLOEXEC, 0o644)
+        try:
+            fcntl.flock(fd, (fcntl.LOCK_SH if shared else fcntl.LOCK_EX) | (0 if blocking else fcntl.LOCK_NB))
+            yield
+        finally:
+            # Closing the descriptor releases the lock
+            os.close(fd)
+
+
+    @staticmethod
+    def write(
+            path : str,
+            content,
+            durable : bool = True,
+    ) -> None:
+        """
+        Atomically replaces the content of a file.
+
+        ### Arguments
+        - path : str
+            - Absolute path to the file.
+        - content : str | bytes
+            - New content of the file.
+        - durable : bool
+            - Whether or not to flush the file and its directory to disk before returning. Only caches that can be
+              rebuilt at any time should be written without durability.
+
+        ### Returns
+        - Nothing.
+        """
+        if isinstance(content, str):
+            content = content.encode()
+
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok = True)
+        fd, temp_file = tempfile.mkstemp(dir = directory, prefix = f".{os.path.basename(path)}.", suffix = ".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                # Preserve the permissions of the file being replaced
+                try:
+                    os.fchmod(f.fileno(), stat.S_IMODE(os.stat(path).st_mode))
+                except FileNotFoundError:
+                    os.fchmod(f.fileno(), 0o644)
+                f.write(content)
+                if durable:
+                    f.flush()
+                    os.fsync(f.fileno())
+            os.replace(temp_file, path)
+            Memo.invalidate(path)
+        except BaseException:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(temp_file)
+            raise
+
+        if durable:
+            dir_fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+
+
+class Memo:
+    """
+    In-memory retention of parsed and validated backing files for long running processes, such as the daemon, that
+    would otherwise read them again for every operation.
+
+    - Retention is disabled unless `enable()` is called. The process is then responsible for calling `invalidate()`
+      whenever a retained file may have been changed by another process, e.g. upon file system events. Files written
+      through `Store.write()` are invalidated automatically.
+
+    - Entries are kept pickled and every lookup returns a fresh copy so that callers may freely mutate it.
+    """
+    _entries = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def enable() -> None:
+        """
+        Enables retention for the remainder of this process.
+
+        ### Returns
+        - Nothing.
+        """
+        with Memo._lock:
+            if Memo._entries is None:
+                Memo._entries = dict()
+
+
+    @staticmethod
+    def get(
+            path : str,
+    ) -> object:
+        """
+        Returns a copy of the data retained for a backing file.
+
+        ### Arguments
+        - path : str
+            - Absolute path to the backing file.
+
+        ### Returns
+        - Retained data or `None` if there is none or retention is disabled.
+        """
+        with Memo._lock:
+            entry = Memo._entries.get(path) if Memo._entries is not None else None
+        return pickle.loads(entry) if entry is not None else None
+
+
+    @staticmethod
+    def put(
+            path : str,
+            data : object,
+    ) -> None:
+        """
+        Retains the data parsed from a backing file, unless retention is disabled.
+
+        ### Arguments
+        - path : str
+            - Absolute path to the backing file.
+        - data : object
+            - Parsed and validated content of the backing file.
+
+        ### Returns
+        - Nothing.
+        """
+        if Memo._entries is None:
+            return
+        entry = pickle.dumps(data, protocol = pickle.HIGHEST_PROTOCOL)
+        with Memo._lock:
+            if Memo._entries is not None:
+                Memo._entries[path] = entry
+
+
+    @staticmethod
+    def invalidate(
+            path : str = None,
+    ) -> None:
+        """
+        Discards the data retained for a backing file.
+
+        ### Arguments
+        - path : str
+            - Absolute path to the backing file, every backing file when not provided.
+
+        ### Returns
+        - Nothing.
+        """
+        if Memo._entries is None:
+            return
+        with Memo._lock:
+            if path is None:
+                Memo._entries.clear()
+            else:
+                Memo._entries.pop(path, None)
@@ -1,13 +1,7 @@
-import enum
-
 __version__ = "0.0.1"
 
 from .main import Properties as Properties
-class OutputFormat(enum.Enum):
-    """
-    CLI output formats.
-    """
-    JSON = "json"
-    TABLE = "table"
-    TEXT = "text"
-    YAML = "yaml"
+from .output import Column as Column
+from .output import OutputFormat as OutputFormat
+from .output import OutputWriter as OutputWriter
+from .inotify import Inotify as Inotify
@@ -0,0 +1,178 @@
+import errno
+import os
+import struct
+
+
+class Inotify:
+    """
+    Minimal binding to the Linux `inotify` API, which reports file system events without polling.
+
+    - The descriptor is non-blocking and may be waited upon with `select`, `selectors` or `asyncio` through
+      `fileno()`; `read()` then returns every pending event at once.
+
+    - Watches are per directory, or file, and not recursive. Events of entries within a watched directory carry the
+      entry name.
+    """
+    _fd : int
+    _watches : dict
+
+    # From sys/inotify.h
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_MOVE_SELF = 0x00000800
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ISDIR = 0x40000000
+    IN_NONBLOCK = os.O_NONBLOCK
+    IN_CLOEXEC = os.O_CLOEXEC
+
+    # Events of a directory whose entries are replaced, created and removed
+    CHANGES = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+
+    _EVENT = struct.Struct("iIII")
+    _libc = None
+
+    def __init__(
+            self,
+    ):
+        """
+        Creates an instance.
+
+        ### Raises
+        - OSError
+            - If `inotify` is not available.
+        """
+        # ctypes is only imported when actually watching, it is costly to import for short lived processes
+        import ctypes
+        import ctypes.util
+
+        if Inotify._libc is None:
+            Inotify._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno = True)
+        self._fd = Inotify._libc.inotify_init1(Inotify.IN_NONBLOCK | Inotify.IN_CLOEXEC)
+        if self._fd < 0:
+            e = ctypes.get_errno()
+            raise OSError(e, os.strerror(e))
+        self._watches = dict()
+
+
+    def __enter__(
+            self,
+    ):
+        return self
+
+
+    def __exit__(
+            self,
+            exc_type,
+            exc_value,
+            traceback,
+    ) -> None:
+        self.close()
+
+
+    def fileno(
+            self,
+    ) -> int:
+        """
+        Returns the descriptor which becomes readable when events are pending.
+
+        ### Returns
+        - File descriptor.
+        """
+        return self._fd
+
+
+    def add_watch(
+            self,
+            path : str,
+            mask : int = CHANGES,
+    ) -> int:
+        """
+        Watches a directory or file, or updates the events watched for if it is watched already.
+
+        ### Arguments
+        - path : str
+            - Path to watch.
+        - mask : int
+            - Events to watch for.
+
+        ### Returns
+        - Watch descriptor.
+
+        ### Raises
+        - OSError
+            - If the path cannot be watched, e.g. it does not exist.
+        """
+        import ctypes
+
+        wd = Inotify._libc.inotify_add_watch(self._fd, os.fsencode(path), mask)
+        if wd < 0:
+            e = ctypes.get_errno()
+            raise OSError(e, os.strerror(e), path)
+        self._watches[wd] = path
+        return wd
+
+
+    def path(
+            self,
+            wd : int,
+    ) -> str:
+        """
+        Returns the watched path of a watch descriptor.
+
+        ### Returns
+        - Watched path or `None` if it is unknown, e.g. for queue overflow events.
+        """
+        return self._watches.get(wd)
+
+
+    def read(
+            self,
+    ) -> list:
+        """
+        Reads every pending event without blocking.
+
+        ### Returns
+        - List of tuples of the watched path, the event mask and the entry name, which is empty for events of the
+          watched path itself. The watched path is `None` for `IN_Q_OVERFLOW`.
+        """
+        result = []
+        while True:
+            try:
+                buffer = os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                return result
+            except OSError as e:
+                if e.errno == errno.EINTR:
+                    continue
+                raise
+
+            offset = 0
+            while offset < len(buffer):
+                wd, mask, _, length = Inotify._EVENT.unpack_from(buffer, offset)
+                offset = offset + Inotify._EVENT.size
+                name = buffer[offset:offset + length].rstrip(b"\0").decode(errors = "surrogateescape")
+                offset = offset + length
+                result.append((self._watches.get(wd), mask, name))
+                if mask & Inotify.IN_IGNORED:
+                    # The watch was removed, e.g. because the watched path was deleted
+                    self._watches.pop(wd, None)
+
+
+    def close(
+            self,
+    ) -> None:
+        """
+        Closes the descriptor, which removes every watch.
+
+        ### Returns
+        - Nothing.
+        """
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
@@ -43,7 +43,27 @@ class Properties:
         """
         self._properties[name] = value
         return self
-    
+
+
+    def get(
+            self,
+            name : str,
+            default : str = None,
+    ) -> str:
+        """
+        Returns the value of a property.
+
+        ### Arguments
+        - name : str
+            - Property name.
+        - default : str
+            - Value returned when the property was not added.
+
+        ### Returns
+        - Property value or `default`.
+        """
+        return self._properties.get(name, default)
+
 
     def compose_as_string(
             self,
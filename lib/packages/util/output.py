@@ -0,0 +1,207 @@
+import enum
+import json
+import sys
+
+
+class OutputFormat(enum.Enum):
+    """
+    CLI output formats.
+    """
+    JSON = "json"
+    NDJSON = "ndjson"
+    TABLE = "table"
+    TEXT = "text"
+    YAML = "yaml"
+
+
+class Column:
+    """
+    Describes how a record field is displayed in the human readable output formats.
+    """
+    key : str
+    header : str
+    style : str
+    justify : str
+    format : object
+
+    def __init__(
+            self,
+            key : str,
+            header : str,
+            style : str = "gray93",
+            justify : str = "left",
+            format = None,
+    ):
+        """
+        Creates an instance.
+
+        ### Arguments
+        - key : str
+            - Record field name.
+        - header : str
+            - Column header.
+        - style : str
+            - Rich style of the column in tables.
+        - justify : str
+            - Rich justification of the column in tables.
+        - format : callable
+            - Callable converting a field value to its displayed text, `None` values are displayed as `n/a` without
+              calling it.
+        """
+        self.key = key
+        self.header = header
+        self.style = style
+        self.justify = justify
+        self.format = format or str
+
+
+    def display(
+            self,
+            record : dict,
+    ) -> str:
+        """
+        Returns the displayed text of this field of a record.
+
+        ### Returns
+        - Displayed text.
+        """
+        value = record.get(self.key)
+        return "n/a" if value is None else self.format(value)
+
+
+class OutputWriter:
+    """
+    Writes records in one of the `OutputFormat` formats.
+
+    - `NDJSON` and `TEXT` are streamed: every record is written, and flushed, as soon as it is provided so consumers
+      can process them incrementally.
+
+    - `JSON`, `YAML` and `TABLE` are single documents written once all records were provided.
+
+    Use as a context manager, the buffered formats are written when the context exits without an exception.
+    """
+    _format : object
+    _columns : list
+    _file : object
+    _records : list
+
+    def __init__(
+            self,
+            format,
+            columns : list,
+            file = None,
+    ):
+        """
+        Creates an instance.
+
+        ### Arguments
+        - format : OutputFormat
+            - Output format.
+        - columns : list[Column]
+            - Fields displayed by the human readable formats, machine readable formats contain every field.
+        - file : file
+            - Output stream, defaults to the current standard output.
+        """
+        self._format = format
+        self._columns = columns
+        self._file = file or sys.stdout
+        self._records = []
+
+
+    def __enter__(
+            self,
+    ):
+        return self
+
+
+    def __exit__(
+            self,
+            exc_type,
+            exc_value,
+            traceback,
+    ) -> None:
+        if exc_type is None:
+            self.close()
+
+
+    @property
+    def format(
+            self,
+    ):
+        """
+        Returns the output format.
+
+        ### Returns
+        - Output format.
+        """
+        return self._format
+
+
+    @property
+    def streaming(
+            self,
+    ) -> bool:
+        """
+        Returns whether or not records are written as soon as they are provided.
+
+        ### Returns
+        - True for the streaming formats, False for the document formats.
+        """
+        return self._format in (OutputFormat.NDJSON, OutputFormat.TEXT)
+
+
+    def write(
+            self,
+            record : dict,
+    ) -> None:
+        """
+        Writes a record, or buffers it for the document formats.
+
+        ### Arguments
+        - record : dict
+            - Record whose values are JSON and YAML serializable.
+
+        ### Returns
+        - Nothing.
+        """
+        if self._format == OutputFormat.NDJSON:
+            self._file.write(json.dumps(record, sort_keys = True) + "\n")
+            self._file.flush()
+        elif self._format == OutputFormat.TEXT:
+            for column in self._columns:
+                self._file.write(f"{column.header}: {column.display(record)}\n")
+            self._file.write("\n")
+            self._file.flush()
+        elif self._format in (OutputFormat.JSON, OutputFormat.YAML, OutputFormat.TABLE):
+            self._records.append(record)
+        else:
+            raise ValueError("Unknown output format")
+
+
+    def close(
+            self,
+    ) -> None:
+        """
+        Writes the buffered records of the document formats.
+
+        ### Returns
+        - Nothing.
+        """
+        if self._format == OutputFormat.JSON:
+            self._file.write(json.dumps(self._records, indent = 4, sort_keys = True) + "\n")
+        elif self._format == OutputFormat.YAML:
+            import yaml
+
+            self._file.write(yaml.dump(
+                self._records, Dumper = getattr(yaml, "CSafeDumper", yaml.SafeDumper), indent = 4, sort_keys = True))
+        elif self._format == OutputFormat.TABLE:
+            from rich.console import Console
+            from rich.table import Table
+
+            table = Table(show_lines = True)
+            for column in self._columns:
+                table.add_column(column.header, style = column.style, justify = column.justify)
+            for record in self._records:
+                table.add_row(*[ x.display(record) for x in self._columns ])
+            Console(file = self._file).print(table)
+        self._records = []
@@ -0,0 +1,88 @@
+"""
+Shared fixtures: resolves the tool packages and provides a throw-away tool home per test.
+"""
+import os
+import sys
+
+import psutil
+import pytest
+import yaml
+
+
+#=====
+# Resolve our modules the same way `bin/jbadm` does
+HOME = os.path.realpath(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(1, f"{HOME}/cli/packages")
+sys.path.insert(2, f"{HOME}/lib/packages")
+
+import paths
+#-----
+
+
+@pytest.fixture
+def home(
+        tmp_path,
+        monkeypatch,
+) -> str:
+    """
+    Throw-away tool home with its own configuration, instances and run directories and a fake JBoss base
+    installation. The schemas are shared with the real tool home.
+
+    ### Returns
+    - Tool home path.
+    """
+    root = str(tmp_path)
+    os.makedirs(f"{root}/resources/config")
+    os.symlink(f"{HOME}/resources/schema", f"{root}/resources/schema")
+    os.makedirs(f"{root}/instances")
+    os.makedirs(f"{root}/run")
+    for directory in ("configuration", "deployments"):
+        os.makedirs(f"{root}/jboss/standalone/{directory}")
+    for name in ("standalone-full.xml", "logging.properties"):
+        with open(f"{root}/jboss/standalone/configuration/{name}", "w") as f:
+            f.write(name)
+
+    with open(f"{root}/resources/config/config.yaml", "w") as f:
+        yaml.safe_dump({
+            "paths": {
+                "jboss": f"{root}/jboss",
+                "instances": f"{root}/instances",
+                "run": f"{root}/run",
+            },
+            "defaults": {
+                "jboss": {
+                    "profile": "standalone-full.xml",
+                },
+            },
+            "instances": [],
+        }, f)
+
+    # `paths.Paths.home()` is a singleton, it is reset for every test
+    monkeypatch.setattr(paths.Paths, "_home", root)
+    return root
+
+
+@pytest.fixture
+def jboss(
+        home,
+) -> str:
+    """
+    Fake JBoss base installation of the tool home whose scripts are the `bench/fake` stand-ins. Every process they
+    launched is killed once the test completes.
+
+    ### Returns
+    - JBoss base installation path.
+    """
+    os.makedirs(f"{home}/jboss/bin")
+    for script in ("standalone.sh", "jboss-cli.sh"):
+        os.symlink(f"{HOME}/bench/fake/{script}", f"{home}/jboss/bin/{script}")
+    os.makedirs(f"{home}/jboss/standalone/log")
+
+    yield f"{home}/jboss"
+
+    for proc in psutil.process_iter([ "cmdline" ]):
+        if any(home in x for x in proc.info["cmdline"] or []):
+            try:
+                proc.kill()
+            except psutil.NoSuchProcess:
+                pass
@@ -0,0 +1,125 @@
+"""
+Adding and removing many managed instances at once: rejections, partial failures and rollback.
+"""
+import os
+
+from box import Box
+import pytest
+
+from instance.impl import InstanceBatch, InstanceImpl
+import config
+
+
+def add(
+        *names,
+) -> dict:
+    results = InstanceBatch().add([ Box(name = x) for x in names ])
+    assert [ x.name for x in results ] == list(names)
+    return { x.name: x for x in results if x.success }
+
+
+def test_add_provisions_and_saves_every_instance(
+        home,
+):
+    assert sorted(add("a1", "a2", "a3")) == [ "a1", "a2", "a3" ]
+
+    assert config.Config.load().instance_names() == [ "a1", "a2", "a3" ]
+    assert sorted(os.listdir(f"{home}/instances")) == [ "a1", "a2", "a3" ]
+    assert os.path.isfile(f"{home}/instances/a1/configuration/standalone-full.xml")
+
+
+def test_add_rejects_existing_and_repeated_instances(
+        home,
+):
+    add("a1")
+
+    results = InstanceBatch().add([ Box(name = "a1"), Box(name = "a2"), Box(name = "a2") ])
+
+    assert [ (x.name, x.success, x.message) for x in results if not x.success ] == [
+        ("a1", False, "Already exists"),
+        ("a2", False, "Listed more than once"),
+    ]
+    assert config.Config.load().instance_names() == [ "a1", "a2" ]
+
+
+def test_add_saves_instances_provisioned_despite_failures(
+        home,
+        monkeypatch,
+):
+    provision = InstanceImpl.provision
+
+    def failing(self, conf, link = False):
+        if self._name == "a2":
+            raise OSError("No space left on device")
+        return provision(self, conf, link = link)
+
+    monkeypatch.setattr(InstanceImpl, "provision", failing)
+
+    assert sorted(add("a1", "a2", "a3")) == [ "a1", "a3" ]
+    assert config.Config.load().instance_names() == [ "a1", "a3" ]
+
+
+def test_add_rolls_back_when_saving_fails(
+        home,
+        monkeypatch,
+):
+    def failing(self):
+        raise OSError("Read-only file system")
+
+    with monkeypatch.context() as m:
+        m.setattr(config.Config, "_commit", failing)
+        results = InstanceBatch().add([ Box(name = "a1"), Box(name = "a2") ])
+
+    assert not any(x.success for x in results)
+    assert all(x.message.startswith("Rolled back") for x in results)
+    assert os.listdir(f"{home}/instances") == []
+    assert config.Config.load().instance_names() == []
+
+
+def test_add_removes_provisioned_directories_when_interrupted(
+        home,
+        monkeypatch,
+):
+    provision = InstanceImpl.provision
+
+    def interrupted(self, conf, link = False):
+        if self._name == "a2":
+            raise KeyboardInterrupt()
+        return provision(self, conf, link = link)
+
+    with monkeypatch.context() as m, pytest.raises(KeyboardInterrupt):
+        m.setattr(InstanceImpl, "provision", interrupted)
+        InstanceBatch(parallel = 1).add([ Box(name = "a1"), Box(name = "a2") ])
+
+    assert os.listdir(f"{home}/instances") == []
+    assert config.Config.load().instance_names() == []
+
+
+def test_remove_deletes_configuration_and_directory(
+        home,
+):
+    add("a1", "a2")
+
+    results = InstanceBatch(names = [ "a1", "a3" ]).remove()
+
+    assert [ (x.name, x.success) for x in results ] == [ ("a1", True), ("a3", False) ]
+    assert config.Config.load().instance_names() == [ "a2" ]
+    assert os.listdir(f"{home}/instances") == [ "a2" ]
+
+
+def test_remove_keeps_directory_when_saving_fails(
+        home,
+        monkeypatch,
+):
+    add("a1")
+
+    def failing(self):
+        raise OSError("Read-only file system")
+
+    with monkeypatch.context() as m:
+        m.setattr(config.Config, "_commit", failing)
+        results = InstanceBatch(names = [ "a1" ]).remove()
+
+    assert not results[0].success
+    assert os.path.isfile(f"{home}/instances/a1/configuration/standalone-full.xml")
+    assert config.Config.load().instance_names() == [ "a1" ]
@@ -0,0 +1,122 @@
+"""
+JBoss CLI sessions and their pool: commands performed in order, failures, timeouts and idle sessions.
+"""
+import os
+import time
+
+import psutil
+import pytest
+
+from instance.impl.cli import CliSession, CliSessionPool
+
+
+@pytest.fixture
+def cli(
+        jboss,
+) -> list:
+    """
+    Command line of the fake CLI.
+    """
+    return [ f"{jboss}/bin/jboss-cli.sh", "--connect" ]
+
+
+def launched(
+        session : CliSession,
+) -> psutil.Process:
+    """
+    Waits for the CLI script to launch the CLI and returns its process.
+    """
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        for proc in psutil.Process(session._proc.pid).children(recursive = True):
+            try:
+                if any(x.endswith("/cli.py") for x in proc.cmdline()):
+                    return proc
+            except psutil.NoSuchProcess:
+                pass
+        time.sleep(0.01)
+    raise AssertionError("CLI not launched")
+
+
+def gone(
+        proc : psutil.Process,
+) -> bool:
+    try:
+        return not proc.is_running() or proc.status() == psutil.STATUS_ZOMBIE
+    except psutil.NoSuchProcess:
+        return True
+
+
+def test_run_performs_commands_in_order(
+        cli,
+        monkeypatch,
+):
+    monkeypatch.setenv("FAKE_CLI_START_TIME", "0")
+    session = CliSession("a1", cli)
+    try:
+        results = session.run([ ":read-attribute(name=a)", "batch", ":one", ":two", "run-batch" ])
+        failed = session.run([ ":fail", ":read-attribute(name=b)" ])
+    finally:
+        session.close()
+
+    assert [ (x.command, x.success) for x in results ] == [
+        (":read-attribute(name=a)", True),
+        ("batch\n:one\n:two\nrun-batch", True),
+    ]
+    assert [ (x.command, x.success) for x in failed ] == [ (":fail", False) ]
+
+
+def test_timed_out_session_ends_the_launched_cli(
+        cli,
+        monkeypatch,
+):
+    monkeypatch.setenv("FAKE_CLI_START_TIME", "60")
+    session = CliSession("a1", cli, dict(os.environ))
+    proc = launched(session)
+
+    results = session.run([ ":read-attribute(name=a)" ], timeout = 0.2)
+
+    assert [ (x.success, x.output) for x in results ] == [ (False, "Timed out") ]
+    assert not session.alive
+    assert gone(proc)
+    session.close()
+
+
+def test_pool_reuses_sessions_per_instance(
+        cli,
+        monkeypatch,
+):
+    monkeypatch.setenv("FAKE_CLI_START_TIME", "0")
+    with CliSessionPool() as pool:
+        first = pool.session("a1", cli)
+        first.run([ ":read-attribute(name=a)" ])
+
+        assert pool.session("a1", cli) is first
+        assert pool.session("a2", cli) is not first
+        # The command line of the managed instance changed
+        replaced = pool.session("a1", cli + [ "--controller=localhost:10090" ])
+        assert replaced is not first
+        assert not first.alive
+
+    assert not replaced.alive
+
+
+def test_pool_ends_idle_and_exited_sessions(
+        cli,
+        monkeypatch,
+):
+    monkeypatch.setenv("FAKE_CLI_START_TIME", "0")
+    with CliSessionPool(ttl = 0.2) as pool:
+        idle = pool.session("a1", cli)
+        exited = pool.session("a2", cli)
+        assert not exited.run([ ":fail" ])[0].success
+        exited._proc.wait()
+
+        pool.evict()
+        assert idle.alive
+        assert pool.session("a2", cli) is not exited
+
+        time.sleep(0.2)
+        pool.evict()
+        assert not idle.alive
+        assert pool.timeout() is None
@@ -0,0 +1,141 @@
+"""
+Configuration persistence: merge-on-save, transactions and the sharded layout.
+"""
+import os
+import pickle
+
+from box import Box
+import jsonschema
+import pytest
+
+import config
+
+
+def test_save_merges_concurrent_changes(
+        home,
+):
+    first = config.Config.load()
+    second = config.Config.load()
+    first.add_instance(Box(name = "a1"))
+    second.add_instance(Box(name = "a2"))
+    first.save()
+    second.save()
+
+    assert config.Config.load().instance_names() == [ "a1", "a2" ]
+
+
+def test_save_merges_removal(
+        home,
+):
+    with config.Config.transaction() as conf:
+        conf.add_instance(Box(name = "a1"))
+        conf.add_instance(Box(name = "a2"))
+
+    first = config.Config.load()
+    second = config.Config.load()
+    first.remove_instance("a1")
+    second.add_instance(Box(name = "a3"))
+    first.save()
+    second.save()
+
+    assert config.Config.load().instance_names() == [ "a2", "a3" ]
+
+
+def test_transaction_writes_nothing_when_invalid(
+        home,
+):
+    with pytest.raises(jsonschema.ValidationError):
+        with config.Config.transaction() as conf:
+            conf.add_instance(Box(name = "a1"))
+            conf.add_instance(Box(name = "a2", bogus = True))
+
+    assert config.Config.load().instance_names() == []
+
+
+def test_transaction_writes_nothing_on_exception(
+        home,
+):
+    with pytest.raises(RuntimeError):
+        with config.Config.transaction() as conf:
+            conf.add_instance(Box(name = "a1"))
+            raise RuntimeError("aborted")
+
+    assert config.Config.load().instance_names() == []
+
+
+def test_save_refused_within_transaction(
+        home,
+):
+    with pytest.raises(RuntimeError):
+        with config.Config.transaction() as conf:
+            conf.save()
+
+
+@pytest.mark.parametrize("content", [
+    b"",
+    b"\x80\x05garbage",
+    # Written by a version pickling a class that no longer exists
+    b"cobsolete.snapshot\nSnapshot\n)\x81.",
+    pickle.dumps([ "not", "a", "snapshot" ]),
+])
+def test_unusable_snapshot_is_replaced(
+        home,
+        content,
+):
+    with config.Config.transaction() as conf:
+        conf.add_instance(Box(name = "a1"))
+    with open(config.Config.snapshot(), "wb") as f:
+        f.write(content)
+
+    assert config.Config.load().instance_names() == [ "a1" ]
+    with open(config.Config.snapshot(), "rb") as f:
+        assert pickle.load(f)["data"]["instances"] == [ { "name": "a1" } ]
+
+
+def test_migrate_shards_every_instance(
+        home,
+):
+    with config.Config.transaction() as conf:
+        conf.add_instance(Box(name = "a1", jvm = { "Xmx": "1g" }))
+        conf.add_instance(Box(name = "a2"))
+
+    assert config.Config.migrate() == 2
+
+    conf = config.Config.load()
+    assert conf.is_sharded()
+    assert sorted(os.listdir(config.Config.conf_dir())) == [ "a1.yaml", "a2.yaml" ]
+    assert conf.instance_names() == [ "a1", "a2" ]
+    assert conf.instance("a1").jvm.Xmx == "1g"
+    with pytest.raises(ValueError):
+        config.Config.migrate()
+
+
+def test_sharded_save_writes_only_changed_instances(
+        home,
+):
+    with config.Config.transaction() as conf:
+        conf.add_instance(Box(name = "a1"))
+    config.Config.migrate()
+
+    first = config.Config.load()
+    second = config.Config.load()
+    first.add_instance(Box(name = "a2"))
+    second.remove_instance("a1")
+    first.save()
+    second.save()
+
+    assert config.Config.load().instance_names() == [ "a2" ]
+
+
+def test_sharded_transaction_validates_every_instance_before_writing(
+        home,
+):
+    config.Config.migrate()
+
+    with pytest.raises(jsonschema.ValidationError):
+        with config.Config.transaction() as conf:
+            conf.add_instance(Box(name = "a1"))
+            conf.add_instance(Box(name = "a2", bogus = True))
+
+    assert os.listdir(config.Config.conf_dir()) == []
+    assert config.Config.load().instance_names() == []
@@ -0,0 +1,114 @@
+"""
+Instance commands forwarded to the daemon, which observes changes made by other processes and keeps CLI sessions.
+"""
+import json
+import os
+import subprocess
+import sys
+import time
+
+from box import Box
+import psutil
+import pytest
+
+from daemon.impl import DaemonClient
+import config
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def jbadm(
+        home,
+        jboss,
+) -> list:
+    """
+    Command line of the tool installed in the tool home, whose daemon is running until the test completes.
+    """
+    os.makedirs(f"{home}/bin")
+    os.symlink(f"{ROOT}/bin/jbadm", f"{home}/bin/jbadm")
+    for name in ("cli", "lib"):
+        os.symlink(f"{ROOT}/{name}", f"{home}/{name}")
+
+    env = dict(os.environ, FAKE_CLI_START_TIME = "0")
+    env.pop(DaemonClient.DISABLE_VARIABLE, None)
+    proc = subprocess.Popen(
+        [ sys.executable, f"{home}/bin/jbadm", "daemon", "run" ], env = env, stdin = subprocess.DEVNULL,
+        stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL)
+    client = DaemonClient(timeout = 10)
+    deadline = time.monotonic() + 10
+    while client.ping() is None:
+        assert proc.poll() is None and time.monotonic() < deadline, "The daemon did not start"
+        time.sleep(0.05)
+
+    yield [ sys.executable, f"{home}/bin/jbadm" ]
+
+    client.shutdown()
+    proc.wait(10)
+
+
+def run(
+        jbadm : list,
+        *args,
+        env : dict = None,
+) -> subprocess.CompletedProcess:
+    return subprocess.run(jbadm + list(args), env = env, capture_output = True, text = True, timeout = 30)
+
+
+def served() -> int:
+    return DaemonClient(timeout = 10).ping()["served"]
+
+
+def test_commands_are_forwarded(
+        jbadm,
+):
+    added = run(jbadm, "instance", "add", "a1")
+    listed = run(jbadm, "instance", "list", "-o", "json")
+
+    assert added.returncode == 0, added.stderr
+    assert [ x["name"] for x in json.loads(listed.stdout) ] == [ "a1" ]
+    assert served() == 2
+
+
+def test_changes_made_by_other_processes_are_observed(
+        jbadm,
+):
+    assert json.loads(run(jbadm, "instance", "list", "-o", "json").stdout) == []
+
+    with config.Config.transaction() as conf:
+        conf.add_instance(Box(name = "a1"))
+
+    assert [ x["name"] for x in json.loads(run(jbadm, "instance", "list", "-o", "json").stdout) ] == [ "a1" ]
+
+
+def test_failing_commands_report_their_status(
+        jbadm,
+):
+    removed = run(jbadm, "instance", "remove", "a1")
+
+    assert removed.returncode != 0
+    assert served() == 1
+
+
+def test_forwarding_can_be_disabled(
+        jbadm,
+):
+    listed = run(jbadm, "instance", "list", env = dict(os.environ, **{ DaemonClient.DISABLE_VARIABLE: "1" }))
+
+    assert listed.returncode == 0, listed.stderr
+    assert served() == 0
+
+
+def test_cli_sessions_are_kept_by_the_daemon(
+        jbadm,
+):
+    run(jbadm, "instance", "add", "a1")
+
+    results = [ run(jbadm, "instance", "cli", "a1", "--command", f":read-attribute(name={x})") for x in "ab" ]
+
+    assert all(x.returncode == 0 for x in results), [ x.stderr for x in results ]
+    assert ":read-attribute(name=b)" in results[1].stdout
+    daemon = psutil.Process(DaemonClient(timeout = 10).ping()["pid"])
+    sessions = [ x for x in daemon.children(recursive = True) if any(y.endswith("/cli.py") for y in x.cmdline()) ]
+    assert len(sessions) == 1
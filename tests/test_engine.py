@@ -0,0 +1,105 @@
+"""
+Running commands on an event loop: captured output, timeouts and background commands.
+"""
+import asyncio
+import signal
+import sys
+import time
+
+import psutil
+
+from base.engine import BoundedBuffer, ProcessEngine
+
+
+def python(
+        code : str,
+) -> list:
+    return [ sys.executable, "-c", code ]
+
+
+def test_bounded_buffer_keeps_most_recent_bytes():
+    buffer = BoundedBuffer(4)
+    buffer.write(b"abc")
+    buffer.write(b"def")
+
+    assert buffer.getvalue() == b"cdef"
+    assert buffer.dropped == 2
+
+
+def test_run_captures_output_and_status():
+    result = asyncio.run(ProcessEngine().run(python(
+        "import sys; print('out'); print('err', file = sys.stderr); sys.exit(3)")))
+
+    assert (result.stdout, result.stderr, result.returncode) == (b"out\n", b"err\n", 3)
+    assert not result.success
+    assert not result.truncated
+
+
+def test_run_bounds_captured_output():
+    result = asyncio.run(ProcessEngine().run(python("print('x' * 100000, end = '')"), limit = 1000))
+
+    assert result.success
+    assert result.stdout == b"x" * 1000
+    assert result.truncated
+
+
+def test_runs_are_concurrent():
+    async def run_all():
+        engine = ProcessEngine()
+        return await asyncio.gather(*[ engine.run(python("import time; time.sleep(0.5)")) for _ in range(8) ])
+
+    started = time.monotonic()
+    results = asyncio.run(run_all())
+
+    assert all(x.success for x in results)
+    assert time.monotonic() - started < 0.5 * 4
+
+
+def test_run_terminates_command_out_of_time(
+        monkeypatch,
+):
+    monkeypatch.setattr(ProcessEngine, "KILL_GRACE", 0.2)
+
+    terminated = asyncio.run(ProcessEngine().run(python("import time; time.sleep(60)"), timeout = 0.2))
+    killed = asyncio.run(ProcessEngine().run(python(
+        "import signal, time; signal.signal(signal.SIGTERM, signal.SIG_IGN); print('ready', flush = True); "
+        "time.sleep(60)"), timeout = 0.5))
+
+    assert terminated.timed_out and terminated.returncode == -signal.SIGTERM
+    assert killed.timed_out and killed.returncode == -signal.SIGKILL
+    assert killed.stdout == b"ready\n"
+
+
+def test_run_does_not_wait_for_background_children():
+    result = asyncio.run(ProcessEngine().run([ "sh", "-c", "sleep 5 & echo done" ]))
+
+    assert result.success
+    assert result.stdout == b"done\n"
+    assert result.elapsed < 5
+
+
+def test_spawned_command_is_reaped_by_the_running_loop():
+    async def spawn():
+        pid = ProcessEngine().spawn([ "true" ])
+        for _ in range(100):
+            await asyncio.sleep(0.01)
+            if not psutil.pid_exists(pid):
+                break
+        return pid
+
+    assert not psutil.pid_exists(asyncio.run(spawn()))
+
+
+def test_held_command_reports_its_exit_status():
+    engine = ProcessEngine()
+
+    async def spawn():
+        pid = engine.spawn([ "sh", "-c", "exit 3" ], hold = True)
+        # Not reaped by the loop meanwhile
+        await asyncio.sleep(0.2)
+        return pid, engine.release(pid)
+
+    pid, returncode = asyncio.run(spawn())
+
+    assert returncode == 3
+    assert engine.release(pid) is None
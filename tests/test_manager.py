@@ -0,0 +1,173 @@
+"""
+Lifecycle operations performed by the manager, and the batches built upon it, against the `bench/fake` stand-ins.
+"""
+import os
+
+from box import Box
+import psutil
+import pytest
+
+from instance.impl import InstanceBatch
+import config
+
+
+@pytest.fixture
+def instances(
+        jboss,
+        monkeypatch,
+) -> list:
+    """
+    Names of the managed instances added to the tool home, whose fake JVMs boot right away.
+    """
+    monkeypatch.setenv("FAKE_JAVA_BOOT_TIME", "0.05")
+    names = [ "a1", "a2", "a3" ]
+    InstanceBatch().add([ Box(name = x) for x in names ])
+    return names
+
+
+def outcomes(
+        results : list,
+) -> dict:
+    return { x.name: x.success for x in results }
+
+
+def gone(
+        pid : int,
+) -> bool:
+    try:
+        return psutil.Process(pid).status() == psutil.STATUS_ZOMBIE
+    except psutil.NoSuchProcess:
+        return True
+
+
+def test_start_status_and_stop(
+        instances,
+):
+    started = InstanceBatch(names = instances, parallel = 2).start(wait_ready = True, ready_timeout = 10)
+
+    assert outcomes(started) == { "a1": True, "a2": True, "a3": True }
+    assert all(x.message.startswith("Ready in") for x in started)
+    status = InstanceBatch(select_all = True).status()
+    assert { x.name: x.pid for x in status } == { x.name: x.pid for x in started }
+    assert all(psutil.Process(x.pid).name() == "java" for x in started)
+
+    stopped = InstanceBatch(pattern = "a[12]").stop()
+
+    assert outcomes(stopped) == { "a1": True, "a2": True }
+    assert all(gone(x.pid) for x in started[:2])
+    assert outcomes(InstanceBatch(select_all = True).status()) == { "a1": False, "a2": False, "a3": True }
+
+
+def test_start_skips_running_instances(
+        instances,
+):
+    first = InstanceBatch(names = [ "a1" ]).start(wait_ready = True, ready_timeout = 10)
+    second = InstanceBatch(names = instances).start(wait_ready = True, ready_timeout = 10)
+
+    assert outcomes(second) == { "a1": True, "a2": True, "a3": True }
+    assert second[0].pid == first[0].pid
+
+
+def test_restart_launches_new_processes(
+        instances,
+):
+    started = InstanceBatch(names = instances).start(wait_ready = True, ready_timeout = 10)
+
+    restarted = InstanceBatch(names = instances).restart()
+
+    assert outcomes(restarted) == { "a1": True, "a2": True, "a3": True }
+    assert all(gone(x.pid) for x in started)
+    status = InstanceBatch(names = instances).status()
+    assert { x.name: x.pid for x in status } == { x.name: x.pid for x in restarted }
+
+
+def test_boot_failure_is_reported(
+        instances,
+        monkeypatch,
+):
+    monkeypatch.setenv("FAKE_JAVA_BOOT_FAILURE", "1")
+
+    results = InstanceBatch(names = [ "a1" ]).start(wait_ready = True, ready_timeout = 10)
+
+    assert not results[0].success
+    assert "WFLYSRV0056" in results[0].message
+
+
+def test_rolling_restart_aborts_on_first_failure(
+        instances,
+        monkeypatch,
+):
+    started = InstanceBatch(names = instances).start(wait_ready = True, ready_timeout = 10)
+    monkeypatch.setenv("FAKE_JAVA_BOOT_FAILURE", "1")
+
+    results = InstanceBatch(names = instances).rolling_restart(max_unavailable = 1, ready_timeout = 10)
+
+    assert outcomes(results) == { "a1": False, "a2": False, "a3": False }
+    assert "WFLYSRV0056" in results[0].message
+    assert [ x.message for x in results[1:] ] == [ "Skipped, rollout aborted" ] * 2
+    # The instances not restarted keep serving
+    status = InstanceBatch(names = instances[1:]).status()
+    assert { x.name: x.pid for x in status } == { x.name: x.pid for x in started[1:] }
+
+
+def test_rolling_restart_restarts_every_instance(
+        instances,
+):
+    started = InstanceBatch(names = instances).start(wait_ready = True, ready_timeout = 10)
+
+    results = InstanceBatch(select_all = True).rolling_restart(max_unavailable = 2, ready_timeout = 10)
+
+    assert outcomes(results) == { "a1": True, "a2": True, "a3": True }
+    assert all(gone(x.pid) for x in started)
+
+
+def test_kill_forgets_instance_states(
+        instances,
+):
+    started = InstanceBatch(names = instances).start(wait_ready = True, ready_timeout = 10)
+
+    killed = InstanceBatch(names = instances).kill()
+
+    assert outcomes(killed) == { "a1": True, "a2": True, "a3": True }
+    assert all(gone(x.pid) for x in started)
+    assert outcomes(InstanceBatch(names = instances).status()) == { "a1": False, "a2": False, "a3": False }
+
+
+def test_running_instance_is_not_removed(
+        home,
+        instances,
+):
+    InstanceBatch(names = [ "a1" ]).start(wait_ready = True, ready_timeout = 10)
+
+    results = InstanceBatch(names = [ "a1", "a2" ]).remove()
+
+    assert [ (x.name, x.success, x.message) for x in results ] == [
+        ("a1", False, "Running, stop it first"),
+        ("a2", True, "Removed"),
+    ]
+    assert config.Config.load().instance_names() == [ "a1", "a3" ]
+    assert sorted(os.listdir(f"{home}/instances")) == [ "a1", "a3" ]
+
+
+def test_unknown_instances_are_reported(
+        instances,
+):
+    results = InstanceBatch(names = [ "a1", "b1" ]).stop()
+
+    assert [ (x.name, x.success) for x in results ] == [ ("a1", True), ("b1", False) ]
+    assert results[1].message == "Instance b1 does not exist"
+
+
+def test_wrapper_exit_status_is_reported(
+        jboss,
+        instances,
+):
+    os.unlink(f"{jboss}/bin/standalone.sh")
+    with open(f"{jboss}/bin/standalone.sh", "w") as f:
+        f.write("#!/bin/sh\nexit 3\n")
+    os.chmod(f"{jboss}/bin/standalone.sh", 0o755)
+
+    results = InstanceBatch(names = instances).start()
+
+    assert not any(x.success for x in results)
+    assert all("exited with status 3 before launching the JVM" in x.message for x in results)
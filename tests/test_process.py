@@ -0,0 +1,131 @@
+"""
+Process identities telling a recorded JVM apart from a later process reusing its PID.
+"""
+import os
+import subprocess
+import sys
+
+from box import Box
+import psutil
+import pytest
+
+from instance.impl.process import ProcessIdentity
+from instance.impl.state import InstanceStateManager
+import config
+
+
+@pytest.fixture
+def process():
+    """
+    Process running until the test completes.
+    """
+    proc = subprocess.Popen([ sys.executable, "-c", "import time; time.sleep(60)" ])
+    yield proc
+    proc.kill()
+    proc.wait()
+
+
+@pytest.fixture
+def exited() -> int:
+    """
+    PID of a process that exited and was reaped.
+    """
+    proc = subprocess.Popen([ sys.executable, "-c", "pass" ])
+    proc.wait()
+    return proc.pid
+
+
+def test_identity_agrees_with_psutil(
+        process,
+):
+    identity = ProcessIdentity.of(process.pid)
+
+    started = psutil.boot_time() + identity["start_time"] / os.sysconf("SC_CLK_TCK")
+    assert abs(started - psutil.Process(process.pid).create_time()) <= 0.01
+    assert identity == ProcessIdentity.of(process.pid)
+    assert identity["fingerprint"] != ProcessIdentity.of(os.getpid())["fingerprint"]
+
+
+def test_identity_of_exited_process(
+        exited,
+):
+    with pytest.raises(psutil.NoSuchProcess):
+        ProcessIdentity.of(exited)
+
+
+def test_verify_matches_recorded_identity(
+        process,
+):
+    identity = ProcessIdentity.of(process.pid)
+
+    assert ProcessIdentity.verify(Box(name = "a1", pid = process.pid, **identity))
+
+
+def test_verify_detects_reused_pid(
+        process,
+):
+    identity = ProcessIdentity.of(process.pid)
+
+    # Another process started later, or running another command line, under the recorded PID
+    earlier = dict(identity, start_time = identity["start_time"] - 1)
+    other = dict(identity, fingerprint = "0123456789abcdef")
+    assert not ProcessIdentity.verify(Box(name = "a1", pid = process.pid, **earlier))
+    assert not ProcessIdentity.verify(Box(name = "a1", pid = process.pid, **other))
+
+
+def test_verify_ignores_clock_steps(
+        process,
+        monkeypatch,
+):
+    identity = ProcessIdentity.of(process.pid)
+    recorded = psutil.Process(process.pid).create_time()
+
+    # Stepping the wall clock shifts the boot time derived from it
+    boot_time = psutil.boot_time()
+    monkeypatch.setattr(psutil, "boot_time", lambda: boot_time + 0.5)
+
+    assert ProcessIdentity.verify(Box(name = "a1", pid = process.pid, **identity))
+    assert ProcessIdentity.verify(Box(name = "a1", pid = process.pid, create_time = recorded))
+    assert not ProcessIdentity.verify(Box(name = "a1", pid = process.pid, create_time = recorded - 60))
+
+
+def test_verify_falls_back_to_pid_without_identity(
+        process,
+        exited,
+):
+    assert ProcessIdentity.verify(Box(name = "a1", pid = process.pid))
+    assert not ProcessIdentity.verify(Box(name = "a1", pid = exited))
+
+
+def test_verify_many_preserves_order(
+        process,
+        exited,
+):
+    identity = ProcessIdentity.of(process.pid)
+    states = [
+        Box(name = "a1", pid = exited),
+        Box(name = "a2", pid = process.pid, **identity),
+        Box(name = "a3", pid = process.pid, **dict(identity, fingerprint = "0123456789abcdef")),
+        Box(name = "a4", pid = process.pid),
+    ]
+
+    assert ProcessIdentity.verify_many(states) == [ None, identity, None, identity ]
+    assert [ x is not None for x in ProcessIdentity.verify_many(states) ] == [ ProcessIdentity.verify(x) for x in states ]
+
+
+def test_state_manager_ignores_reused_pid(
+        home,
+        process,
+):
+    with config.Config.transaction() as conf:
+        conf.add_instance(Box(name = "a1"))
+        conf.add_instance(Box(name = "a2"))
+    conf = config.Config.load()
+    identity = ProcessIdentity.of(process.pid)
+    state_manager = InstanceStateManager.load(conf)
+    state_manager.update(Box(name = "a1", pid = process.pid, **identity))
+    state_manager.update(Box(name = "a2", pid = process.pid, **dict(identity, start_time = identity["start_time"] - 1)))
+
+    assert state_manager.is_running("a1").pid == process.pid
+    assert state_manager.is_running("a2") is None
+    assert { k: v.pid for k, v in state_manager.reconcile([ "a1", "a2" ]).items() } == { "a1": process.pid }
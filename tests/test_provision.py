@@ -0,0 +1,149 @@
+"""
+Provisioning managed instances: the allowed subset of the base installation and the template cache.
+"""
+import os
+
+import pytest
+
+from instance.impl.provision import Provisioner
+from instance.impl.template import TemplateCache
+
+
+ALLOWED = [ "configuration", "configuration/*.xml", "deployments" ]
+
+
+@pytest.fixture
+def source(
+        tmp_path,
+) -> str:
+    """
+    Base installation `standalone` directory with files that are allowed and others that are not.
+    """
+    root = f"{tmp_path}/standalone"
+    for name, content in {
+        "configuration/standalone.xml": "profile",
+        "configuration/mgmt-users.properties": "secret",
+        "deployments/README.txt": "not allowed",
+        "data/content/blob": "not allowed",
+    }.items():
+        os.makedirs(os.path.dirname(f"{root}/{name}"), exist_ok = True)
+        with open(f"{root}/{name}", "w") as f:
+            f.write(content)
+    os.chmod(f"{root}/configuration/standalone.xml", 0o600)
+    os.utime(f"{root}/configuration/standalone.xml", (1000000000, 1000000000))
+    return root
+
+
+def tree(
+        root : str,
+) -> list:
+    return sorted(os.path.relpath(f"{path}/{x}", root) for path, dirs, files in os.walk(root) for x in dirs + files)
+
+
+def test_copy_only_allowed_paths(
+        tmp_path,
+        source,
+):
+    stats = Provisioner(source, ALLOWED).copy(f"{tmp_path}/a1")
+
+    assert tree(f"{tmp_path}/a1") == [ "configuration", "configuration/standalone.xml", "deployments" ]
+    assert (stats.files, stats.directories, stats.bytes) == (1, 2, len("profile"))
+    copied = os.stat(f"{tmp_path}/a1/configuration/standalone.xml")
+    assert (copied.st_mode & 0o7777, copied.st_mtime) == (0o600, 1000000000)
+
+
+def test_copy_hard_links_when_requested(
+        tmp_path,
+        source,
+):
+    stats = Provisioner(source, ALLOWED, link = True).copy(f"{tmp_path}/a1")
+
+    assert stats.methods == { "hardlink": 1 }
+    assert os.path.samefile(f"{tmp_path}/a1/configuration/standalone.xml", f"{source}/configuration/standalone.xml")
+
+
+def test_copy_refuses_existing_destination_and_cleans_up_failures(
+        tmp_path,
+        source,
+        monkeypatch,
+):
+    os.makedirs(f"{tmp_path}/a1")
+    with pytest.raises(FileExistsError):
+        Provisioner(source, ALLOWED).copy(f"{tmp_path}/a1")
+
+    def failing(self, source, destination, stat):
+        raise OSError("No space left on device")
+
+    monkeypatch.setattr(Provisioner, "copy_file", failing)
+    with pytest.raises(OSError):
+        Provisioner(source, ALLOWED).copy(f"{tmp_path}/a2")
+    assert not os.path.exists(f"{tmp_path}/a2")
+
+
+@pytest.fixture
+def builds(
+        home,
+        monkeypatch,
+) -> list:
+    """
+    Records every template build.
+    """
+    result = []
+    build = TemplateCache._build
+
+    def recorded(self):
+        result.append(self.template_dir())
+        build(self)
+
+    monkeypatch.setattr(TemplateCache, "_build", recorded)
+    return result
+
+
+def test_template_is_built_once(
+        tmp_path,
+        source,
+        builds,
+):
+    cache = TemplateCache(source, ALLOWED)
+    cache.clone(f"{tmp_path}/a1")
+    cache.clone(f"{tmp_path}/a2")
+    TemplateCache(source, ALLOWED).clone(f"{tmp_path}/a3")
+
+    assert len(builds) == 1
+    assert tree(f"{tmp_path}/a3") == tree(f"{tmp_path}/a1")
+    with open(f"{tmp_path}/a3/configuration/standalone.xml") as f:
+        assert f.read() == "profile"
+
+
+def test_template_is_rebuilt_when_the_source_changes(
+        tmp_path,
+        source,
+        builds,
+):
+    cache = TemplateCache(source, ALLOWED)
+    cache.clone(f"{tmp_path}/a1")
+
+    with open(f"{source}/configuration/standalone.xml", "w") as f:
+        f.write("changed profile")
+    cache.clone(f"{tmp_path}/a2")
+    with open(f"{source}/configuration/standalone-ha.xml", "w") as f:
+        f.write("added profile")
+    cache.clone(f"{tmp_path}/a3")
+
+    assert len(builds) == 3
+    with open(f"{tmp_path}/a2/configuration/standalone.xml") as f:
+        assert f.read() == "changed profile"
+    assert "configuration/standalone-ha.xml" in tree(f"{tmp_path}/a3")
+
+
+def test_templates_are_kept_per_allow_list(
+        tmp_path,
+        source,
+        builds,
+):
+    TemplateCache(source, ALLOWED).clone(f"{tmp_path}/a1")
+    TemplateCache(source, ALLOWED + [ "configuration/*.properties" ]).clone(f"{tmp_path}/a2")
+
+    assert len(set(builds)) == 2
+    assert "configuration/mgmt-users.properties" not in tree(f"{tmp_path}/a1")
+    assert "configuration/mgmt-users.properties" in tree(f"{tmp_path}/a2")
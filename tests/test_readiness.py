@@ -0,0 +1,165 @@
+"""
+Following server logs until the boot of managed instances completed, failed or ran out of time.
+"""
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from instance.impl.readiness import ReadinessWatcher
+
+
+READY = "12:00:00,000 INFO  [org.jboss.as] (Controller Boot Thread) WFLYSRV0025: WildFly Full 30.0.0.Final started in 4200ms\n"
+
+
+def append(
+        log_dir : str,
+        *chunks,
+        delay : float = 0.05,
+) -> threading.Thread:
+    """
+    Appends chunks to a server log from another thread, each after a delay, like a booting server does.
+    """
+    def write():
+        for chunk in chunks:
+            time.sleep(delay)
+            with open(f"{log_dir}/{ReadinessWatcher.LOG_FILE}", "a") as f:
+                f.write(chunk)
+
+    thread = threading.Thread(target = write)
+    thread.start()
+    return thread
+
+
+@pytest.mark.parametrize("line", [
+    READY,
+    "INFO  [org.jboss.as] JBAS015874: JBoss EAP 6.4.0.GA (AS 7.5.0.Final-redhat-21) started in 5120ms\n",
+])
+def test_ready_when_boot_completed(
+        tmp_path,
+        line,
+):
+    watcher = ReadinessWatcher(timeout = 10)
+    watcher.watch("a1", f"{tmp_path}/log")
+    writer = append(f"{tmp_path}/log", "INFO  [org.jboss.as] booting\n", line)
+
+    readiness = watcher.wait()["a1"]
+    writer.join()
+
+    assert readiness.ready
+    assert readiness.message.startswith(tuple(x.decode() for x in ReadinessWatcher.READY))
+    assert line.strip().endswith(readiness.message)
+
+
+@pytest.mark.parametrize("marker", [ "WFLYSRV0026", "JBAS015875", "WFLYSRV0056" ])
+def test_not_ready_when_boot_failed_or_completed_with_errors(
+        tmp_path,
+        marker,
+):
+    watcher = ReadinessWatcher(timeout = 10)
+    watcher.watch("a1", f"{tmp_path}/log")
+    writer = append(f"{tmp_path}/log", f"ERROR [org.jboss.as] {marker}: boot outcome\n")
+
+    readiness = watcher.wait()["a1"]
+    writer.join()
+
+    assert not readiness.ready
+    assert readiness.message.startswith(marker)
+
+
+def test_marker_split_across_writes(
+        tmp_path,
+):
+    watcher = ReadinessWatcher(timeout = 10)
+    watcher.watch("a1", f"{tmp_path}/log")
+    writer = append(f"{tmp_path}/log", READY[:50], READY[50:])
+
+    readiness = watcher.wait()["a1"]
+    writer.join()
+
+    assert readiness.ready
+
+
+def test_previous_boots_are_skipped(
+        tmp_path,
+):
+    os.makedirs(f"{tmp_path}/log")
+    with open(f"{tmp_path}/log/{ReadinessWatcher.LOG_FILE}", "w") as f:
+        f.write(READY)
+
+    watcher = ReadinessWatcher(timeout = 0.2)
+    watcher.watch("a1", f"{tmp_path}/log")
+    readiness = watcher.wait()["a1"]
+
+    assert not readiness.ready
+    assert readiness.message == "Not ready within 0.2 s"
+    assert readiness.elapsed >= 0.2
+
+
+def test_rotated_log_is_read_from_its_beginning(
+        tmp_path,
+):
+    os.makedirs(f"{tmp_path}/log")
+    with open(f"{tmp_path}/log/{ReadinessWatcher.LOG_FILE}", "w") as f:
+        f.write("INFO  [org.jboss.as] previous boot\n" * 100)
+
+    watcher = ReadinessWatcher(timeout = 10)
+    watcher.watch("a1", f"{tmp_path}/log")
+    with open(f"{tmp_path}/log/{ReadinessWatcher.LOG_FILE}.new", "w") as f:
+        f.write(READY)
+    os.rename(f"{tmp_path}/log/{ReadinessWatcher.LOG_FILE}.new", f"{tmp_path}/log/{ReadinessWatcher.LOG_FILE}")
+
+    assert watcher.wait()["a1"].ready
+
+
+def test_every_instance_is_followed_at_once(
+        tmp_path,
+):
+    watcher = ReadinessWatcher(timeout = 0.5)
+    for name in ("a1", "a2", "a3"):
+        watcher.watch(name, f"{tmp_path}/{name}/log")
+    writers = [
+        append(f"{tmp_path}/a1/log", READY),
+        append(f"{tmp_path}/a2/log", "ERROR [org.jboss.as] WFLYSRV0026: started (with errors)\n"),
+    ]
+
+    result = watcher.wait()
+    for writer in writers:
+        writer.join()
+
+    assert { k: v.ready for k, v in result.items() } == { "a1": True, "a2": False, "a3": False }
+    assert result["a3"].message == "Not ready within 0.5 s"
+
+
+def test_exited_before_boot_completed(
+        tmp_path,
+):
+    proc = subprocess.Popen([ sys.executable, "-c", "import time; time.sleep(0.2)" ])
+    watcher = ReadinessWatcher(timeout = 10)
+    watcher.watch("a1", f"{tmp_path}/log")
+    watcher.attach("a1", proc.pid)
+
+    readiness = watcher.wait()["a1"]
+    proc.wait()
+
+    assert not readiness.ready
+    assert readiness.message == "Exited before its boot completed"
+    assert readiness.elapsed < 10
+
+
+def test_forgotten_instance_is_not_waited_upon(
+        tmp_path,
+):
+    watcher = ReadinessWatcher(timeout = 10)
+    watcher.watch("a1", f"{tmp_path}/a1/log")
+    watcher.watch("a2", f"{tmp_path}/a2/log")
+    watcher.forget("a2")
+    writer = append(f"{tmp_path}/a1/log", READY)
+
+    result = watcher.wait()
+    writer.join()
+
+    assert list(result) == [ "a1" ]
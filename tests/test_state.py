@@ -0,0 +1,190 @@
+"""
+Instance state persistence: merge-on-save, the sharded layout and its migration.
+"""
+import os
+import sys
+import threading
+
+from box import Box
+import jsonschema
+import pytest
+
+from instance.impl import InstanceImpl
+from instance.impl.state import InstanceStateManager
+import config
+
+
+def add_instances(
+        *names,
+) -> None:
+    with config.Config.transaction() as conf:
+        for name in names:
+            conf.add_instance(Box(name = name))
+
+
+def shards(
+        conf : config.Config,
+) -> list:
+    return sorted(x for x in os.listdir(conf.paths.run) if x.endswith(".state"))
+
+
+def test_save_merges_concurrent_changes(
+        home,
+):
+    add_instances("a1", "a2", "a3")
+    conf = config.Config.load()
+    setup = InstanceStateManager.load(conf)
+    setup.update(Box(name = "a3", pid = 3))
+    setup.save(conf)
+
+    first = InstanceStateManager.load(conf)
+    second = InstanceStateManager.load(conf)
+    first.update(Box(name = "a1", pid = 1))
+    second.update(Box(name = "a2", pid = 2))
+    second.remove(Box(name = "a3"))
+    first.save(conf)
+    second.save(conf)
+
+    result = InstanceStateManager.load(conf)
+    assert result.state_for("a1").pid == 1
+    assert result.state_for("a2").pid == 2
+    assert result.state_for("a3") is None
+
+
+def test_save_writes_nothing_when_invalid(
+        home,
+):
+    add_instances("a1", "a2")
+    conf = config.Config.load()
+    state_manager = InstanceStateManager.load(conf)
+    state_manager.update(Box(name = "a1", pid = 1))
+    state_manager.update(Box(name = "a2"))
+
+    with pytest.raises(jsonschema.ValidationError):
+        state_manager.save(conf)
+    assert not os.path.exists(InstanceStateManager.state_file(conf))
+
+
+def test_migrate_shards_configuration_and_states(
+        home,
+):
+    add_instances("a1", "a2")
+    conf = config.Config.load()
+    state_manager = InstanceStateManager.load(conf)
+    state_manager.update(Box(name = "a1", pid = 1, create_time = 1.5, fingerprint = "0123456789abcdef"))
+    state_manager.save(conf)
+
+    assert InstanceImpl.migrate() == { "instances": 2, "states": 1 }
+
+    conf = config.Config.load()
+    assert conf.is_sharded()
+    assert not os.path.exists(InstanceStateManager.state_file(conf))
+    assert os.path.exists(InstanceStateManager.shard(conf, "a1"))
+
+    state = InstanceStateManager.load(conf).state_for("a1")
+    assert (state.pid, state.create_time, state.fingerprint) == (1, 1.5, "0123456789abcdef")
+    assert InstanceStateManager.load(conf).state_for("a2") is None
+
+
+def test_sharded_save_writes_only_changed_states(
+        home,
+):
+    add_instances("a1", "a2")
+    InstanceImpl.migrate()
+    conf = config.Config.load()
+
+    first = InstanceStateManager.load(conf)
+    second = InstanceStateManager.load(conf)
+    first.update(Box(name = "a1", pid = 1))
+    second.update(Box(name = "a2", pid = 2))
+    first.save(conf)
+    second.save(conf)
+    assert shards(conf) == [ "a1.state", "a2.state" ]
+
+    state_manager = InstanceStateManager.load(conf)
+    state_manager.remove(Box(name = "a1"))
+    state_manager.save(conf)
+    assert shards(conf) == [ "a2.state" ]
+    assert InstanceStateManager.load(conf).state_for("a2").pid == 2
+
+
+def test_sharded_save_validates_every_state_before_writing(
+        home,
+):
+    add_instances("a1", "a2")
+    InstanceImpl.migrate()
+    conf = config.Config.load()
+
+    state_manager = InstanceStateManager.load(conf)
+    state_manager.update(Box(name = "a1", pid = 1))
+    state_manager.update(Box(name = "a2"))
+
+    with pytest.raises(jsonschema.ValidationError):
+        state_manager.save(conf)
+    assert shards(conf) == []
+
+
+def test_lookups_are_consistent_with_concurrent_removals(
+        home,
+):
+    names = [ f"a{i}" for i in range(200) ]
+    add_instances(*names)
+    conf = config.Config.load()
+    state_manager = InstanceStateManager.load(conf)
+    removed = threading.Event()
+    mismatches = []
+
+    def lookup():
+        while not removed.is_set():
+            for name in names[::-1]:
+                try:
+                    state = state_manager.state_for(name)
+                except IndexError as e:
+                    mismatches.append((name, e))
+                    continue
+                if state is not None and state.name != name:
+                    mismatches.append((name, state.name))
+
+    # Switch threads as often as possible to interleave lookups with the renumbering of the removals
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    threads = [ threading.Thread(target = lookup) for _ in range(4) ]
+    try:
+        for thread in threads:
+            thread.start()
+        for _ in range(10):
+            for i, name in enumerate(names):
+                state_manager.update(Box(name = name, pid = i + 1))
+            for name in names[:-1]:
+                state_manager.remove(Box(name = name))
+    finally:
+        removed.set()
+        for thread in threads:
+            thread.join()
+        sys.setswitchinterval(interval)
+
+    assert mismatches == []
+    assert state_manager.state_for(names[-1]).pid == len(names)
+
+
+def test_failed_migration_keeps_states(
+        home,
+        monkeypatch,
+):
+    add_instances("a1", "a2")
+    conf = config.Config.load()
+    state_manager = InstanceStateManager.load(conf)
+    state_manager.update(Box(name = "a1", pid = 1))
+    state_manager.save(conf)
+
+    def failing(cls):
+        raise OSError("No space left on device")
+
+    monkeypatch.setattr(config.Config, "migrate", classmethod(failing))
+    with pytest.raises(OSError):
+        InstanceImpl.migrate()
+
+    conf = config.Config.load()
+    assert not conf.is_sharded()
+    assert shards(conf) == []
+    assert InstanceStateManager.load(conf).state_for("a1").pid == 1